@@ -1,15 +1,83 @@
-class AnalyticReport(object):
-
-    def __init__(self,
-                 course: str,
-                 views: int = 0,
-                 count_students: int = 0,
-                 percent_passed: float = 0.0,
-                 date: str = None,
-                 url: str = None):
-        self.course = course
-        self.views = views
-        self.count_students = count_students
-        self.percent_passed = percent_passed
-        self.date = date
-        self.url = url
\ No newline at end of file
+from typing import NamedTuple
+from django.core.cache import cache
+from learning.cache import get_course_versions
+from learning.counters import course_views
+from learning.models import Course
+
+
+ANALYTICS_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+class AnalyticReport(NamedTuple):
+    course_id: int
+    course: str
+    views: int = 0
+    count_students: int = 0
+    percent_passed: float = 0
+
+
+class AnalyticEngine(object):
+    """
+    Расчет аналитики сразу по всем курсам без обращения к таблице Tracking
+    """
+    # Счетчики прохождения берутся из поддерживаемой инкрементально таблицы CourseStats,
+    # просмотры - из CourseViews с учетом еще не сброшенного буфера
+    fields = ('id', 'title', 'stats__count_students', 'stats__percent_sum', 'view_counter__total')
+
+    def get_queryset(self, course_ids=None):
+        courses = Course.objects.values_list(*self.fields)
+        if course_ids is not None:
+            courses = courses.filter(id__in=course_ids)
+        return courses
+
+    def make_report(self, row, pending_views: dict) -> AnalyticReport:
+        course_id, title, count_students, percent_sum, views = row
+        return AnalyticReport(
+            course_id=course_id,
+            course=title,
+            views=(views or 0) + pending_views.get(course_id, 0),
+            count_students=count_students or 0,
+            percent_passed=round(percent_sum / count_students, 2) if count_students else 0,
+        )
+
+    def get_reports(self, course_ids=None) -> list:
+        pending_views = course_views.buffer.pending()
+        return [self.make_report(row, pending_views) for row in self.get_queryset(course_ids)]
+
+    def get_cached_reports(self, course_ids=None) -> list:
+        """
+        Отчеты собираются из закэшированных фрагментов по курсам; ключ фрагмента содержит версию
+        данных курса, поэтому пересчитываются только изменившиеся курсы
+        """
+        ids = Course.objects.values_list('id', flat=True)
+        if course_ids is not None:
+            ids = ids.filter(id__in=course_ids)
+        versions = get_course_versions(ids)
+        keys = {course_id: f'analytics_{course_id}_{version}' for course_id, version in versions.items()}
+        fragments = cache.get_many(keys.values())
+
+        missing = [course_id for course_id, key in keys.items() if key not in fragments]
+        if missing:
+            computed = {keys[report.course_id]: report for report in
+                        (self.make_report(row, {}) for row in self.get_queryset(missing))}
+            cache.set_many(computed, timeout=ANALYTICS_CACHE_TIMEOUT)
+            fragments.update(computed)
+
+        pending_views = course_views.buffer.pending()
+        return [report._replace(views=report.views + pending_views.get(report.course_id, 0))
+                for report in (fragments.get(keys[course_id]) for course_id in versions) if report]
+
+    def iter_reports(self, chunk_size: int = 2000):
+        """
+        Постраничный обход всех курсов по первичному ключу: память не растет с числом курсов
+        """
+        pending_views = course_views.buffer.pending()
+        queryset = self.get_queryset().order_by('id')
+        last_id = 0
+        while True:
+            rows = list(queryset.filter(id__gt=last_id)[:chunk_size])
+            for row in rows:
+                yield self.make_report(row, pending_views)
+            if len(rows) < chunk_size:
+                break
+            last_id = rows[-1][0]
@@ -0,0 +1,43 @@
+import csv
+import json
+from django.shortcuts import reverse
+
+
+EXPORT_FIELDS = ('course', 'views', 'count_students', 'percent_passed', 'url')
+
+
+class Echo(object):
+    """
+    Псевдо-файл для csv.writer: вместо записи возвращает строку
+    """
+
+    def write(self, value):
+        return value
+
+
+def report_to_dict(report, base_url: str) -> dict:
+    return {
+        'course': report.course,
+        'views': report.views,
+        'count_students': report.count_students,
+        'percent_passed': report.percent_passed,
+        'url': f'{base_url}{reverse("detail", kwargs={"course_id": report.course_id})}',
+    }
+
+
+def iter_csv(reports, base_url: str = ''):
+    writer = csv.DictWriter(Echo(), fieldnames=EXPORT_FIELDS)
+    yield writer.writeheader()
+    for report in reports:
+        yield writer.writerow(report_to_dict(report, base_url))
+
+
+def iter_ndjson(reports, base_url: str = ''):
+    for report in reports:
+        yield json.dumps(report_to_dict(report, base_url), ensure_ascii=False) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': (iter_csv, 'text/csv; charset=utf-8'),
+    'ndjson': (iter_ndjson, 'application/x-ndjson; charset=utf-8'),
+}
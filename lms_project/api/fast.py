@@ -0,0 +1,131 @@
+from types import SimpleNamespace
+from rest_framework import fields
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+
+# Поля, у которых to_representation не меняет значение, пришедшее из базы
+PASSTHROUGH_FIELDS = (fields.IntegerField, fields.CharField, fields.FloatField, )
+
+
+class NotCompilable(Exception):
+    pass
+
+
+class FastSerializer(object):
+    """
+    Быстрый режим чтения для ModelSerializer: данные берутся из values(), поля переводятся
+    заранее скомпилированными функциями. Результат совпадает с выводом сериализатора;
+    сериализатор с полями, которые так не выразить (методы, source='*'), не компилируется
+    """
+
+    def __init__(self, serializer):
+        if isinstance(serializer, ListSerializer):
+            serializer = serializer.child
+        self.model = serializer.Meta.model
+        self.columns = [self.model._meta.pk.attname]
+        self.mappers = []  # (имя поля, функция строки)
+        self.relations = {}  # имя поля -> (модель, поле связи для фильтра, колонки, функция значения)
+        for name, field in serializer.fields.items():
+            if not field.write_only:
+                self.mappers.append((name, self.compile_field(name, field)))
+
+    def add_column(self, column):
+        if column not in self.columns:
+            self.columns.append(column)
+        return column
+
+    def value_mapper(self, field):
+        if isinstance(field, PASSTHROUGH_FIELDS):
+            return None
+        return field.to_representation
+
+    def compile_field(self, name, field):
+        if field.source == '*' or '.' in field.source:
+            raise NotCompilable(name)
+        model_field = self.model._meta.get_field(field.source)
+
+        if isinstance(field, (ListSerializer, ManyRelatedField)):
+            return self.compile_many(name, model_field, field)
+        if isinstance(field, BaseSerializer):
+            representation = self.compile_representation(field, f'{model_field.name}__')
+            column = self.add_column(model_field.attname)
+            return lambda row: None if row[column] is None else representation(row)
+        if isinstance(field, PrimaryKeyRelatedField):
+            column = self.add_column(model_field.attname)
+            return lambda row: row[column]
+        if model_field.is_relation:
+            raise NotCompilable(name)
+
+        column = self.add_column(model_field.attname)
+        mapper = self.value_mapper(field)
+        if mapper is None:
+            return lambda row: row[column]
+        return lambda row: None if row[column] is None else mapper(row[column])
+
+    def compile_representation(self, serializer, prefix=''):
+        """
+        Вложенный сериализатор с собственным to_representation получает объект только с заявленными полями
+        """
+        names = getattr(serializer, 'representation_fields', None)
+        if names is None:
+            raise NotCompilable(serializer.__class__.__name__)
+        columns = [(name, self.add_column(f'{prefix}{name}')) for name in names]
+        to_representation = serializer.to_representation
+        return lambda row: to_representation(SimpleNamespace(**{name: row[column] for name, column in columns}))
+
+    def compile_many(self, name, model_field, field):
+        if model_field.many_to_many and not model_field.auto_created:
+            lookup = model_field.related_query_name()
+        elif model_field.one_to_many:
+            lookup = model_field.field.name
+        else:
+            raise NotCompilable(name)
+        related_model = model_field.related_model
+        if isinstance(field, ManyRelatedField):
+            columns = [related_model._meta.pk.attname]
+            self.relations[name] = (related_model, lookup, columns, lambda row: row[columns[0]])
+        else:
+            nested = RelatedColumns()
+            representation = nested.compile_representation(field.child)
+            self.relations[name] = (related_model, lookup, nested.columns, representation)
+        return lambda row: row['_related'][name]
+
+    def load_relations(self, rows):
+        pk = self.model._meta.pk.attname
+        ids = [row[pk] for row in rows]
+        for name, (related_model, lookup, columns, representation) in self.relations.items():
+            grouped = {id: [] for id in ids}
+            # Порядок - сортировка модели по умолчанию, как у prefetch_related
+            for row in related_model._default_manager.filter(**{f'{lookup}__in': ids}).values(lookup, *columns):
+                grouped[row[lookup]].append(representation(row))
+            for row in rows:
+                row.setdefault('_related', {})[name] = grouped[row[pk]]
+
+    def values(self, queryset, extra=()):
+        """
+        Queryset строк для serialize; extra - дополнительные колонки (например, для курсора пагинации)
+        """
+        return queryset.prefetch_related(None).values(*self.columns, *[name for name in extra
+                                                                        if name not in self.columns])
+
+    def serialize(self, rows) -> list:
+        rows = list(rows)
+        if self.relations:
+            self.load_relations(rows)
+        mappers = self.mappers
+        return [{name: mapper(row) for name, mapper in mappers} for row in rows]
+
+
+class RelatedColumns(FastSerializer):
+    # Колонки связанной модели для вложенного many=True сериализатора
+
+    def __init__(self):
+        self.columns = []
+
+
+def compile_serializer(serializer):
+    try:
+        return FastSerializer(serializer)
+    except NotCompilable:
+        return None
@@ -0,0 +1,46 @@
+from rest_framework.filters import BaseFilterBackend, SearchFilter
+from rest_framework.serializers import ValidationError
+from rest_framework.settings import api_settings
+from learning.facets import filter_courses
+from learning.forms import CourseFilterForm
+from learning.search import search_courses
+
+
+class CourseSearchFilter(SearchFilter):
+    """
+    Поиск курсов по поисковому индексу с сортировкой по рангу.
+    Явная сортировка из запроса (?order_by=) имеет приоритет над рангом
+    """
+
+    def is_ranked(self, request) -> bool:
+        return bool(request.query_params.get(self.search_param, '').strip()) \
+            and api_settings.ORDERING_PARAM not in request.query_params
+
+    def get_rank_ordering(self, request):
+        return ('-rank', 'title', ) if self.is_ranked(request) else None
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        if not query.strip():
+            return queryset
+        queryset = search_courses(queryset, query)
+        if self.is_ranked(request):
+            return queryset.order_by(*self.get_rank_ordering(request))
+        return queryset
+
+
+class CourseFacetFilter(BaseFilterBackend):
+    """
+    Фасетный фильтр курсов: диапазоны цены, даты старта и продолжительности, только бесплатные
+    """
+
+    def get_filters(self, request) -> dict:
+        form = CourseFilterForm(request.query_params)
+        filters = form.get_filters()
+        errors = {name: error for name, error in form.errors.items() if name not in ('price_order', )}
+        if errors:
+            raise ValidationError(errors)
+        return filters
+
+    def filter_queryset(self, request, queryset, view):
+        return filter_courses(queryset, self.get_filters(request))
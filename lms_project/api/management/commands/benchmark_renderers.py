@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+from api.fast import compile_serializer
+from api.middleware import COMPRESSION_BROTLI_QUALITY, brotli
+from api.renderers import FastJSONRenderer, MessagePackRenderer, msgpack, orjson
+from .benchmark_serializers import Command as SerializerBenchmark
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает рендереры ответов API и сжатие: время кодирования и размер на синтетических данных ' \
+           '(данные откатываются)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000], help='Количество строк')
+        parser.add_argument('--repeat', type=int, default=5, help='Число повторов, берется лучшее время')
+
+    def handle(self, *args, **options):
+        benchmark = SerializerBenchmark()
+        renderers = [('json', JSONRenderer())]
+        if orjson is not None:
+            renderers.append(('orjson', FastJSONRenderer()))
+        if msgpack is not None:
+            renderers.append(('msgpack', MessagePackRenderer()))
+        encodings = [('gzip', compress_string)]
+        if brotli is not None:
+            encodings.append(('br', lambda content: brotli.compress(content, quality=COMPRESSION_BROTLI_QUALITY)))
+
+        for rows in options['rows']:
+            with transaction.atomic():
+                for label, serializer_class, queryset in benchmark.create_data(rows):
+                    fast = compile_serializer(serializer_class())
+                    data = fast.serialize(fast.values(queryset))
+                    for name, renderer in renderers:
+                        self.report(benchmark, label, rows, name, renderer, data, encodings, options['repeat'])
+                transaction.set_rollback(True)
+
+    def report(self, benchmark, label, rows, name, renderer, data, encodings, repeat):
+        encode_time, content = benchmark.measure(lambda: renderer.render(data), repeat)
+        line = f'{label:<8} {rows:>6} строк {name:<8} кодирование {encode_time * 1000:8.1f} мс, {len(content):>9} байт'
+        for encoding, compress in encodings:
+            compress_time, compressed = benchmark.measure(lambda: compress(content), repeat)
+            line += f'; {encoding} {len(compressed):>8} байт ({len(compressed) / len(content):.0%}) ' \
+                    f'за {compress_time * 1000:.1f} мс'
+        self.stdout.write(line)
@@ -0,0 +1,79 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from api.fast import compile_serializer
+from api.optimizer import plan_for
+from api.serializers import CourseSerializer, LessonSerializer, ReviewSerializer
+from auth_app.models import User
+from learning.models import Course, Lesson, Review
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает ModelSerializer и быстрый режим FastSerializer на синтетических данных (данные откатываются)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000], help='Количество строк')
+        parser.add_argument('--repeat', type=int, default=3, help='Число повторов, берется лучшее время')
+
+    def handle(self, *args, **options):
+        for rows in options['rows']:
+            with transaction.atomic():
+                for label, serializer_class, queryset in self.create_data(rows):
+                    self.compare(label, serializer_class, queryset, rows, options['repeat'])
+                transaction.set_rollback(True)
+
+    def create_data(self, rows):
+        users = User.objects.bulk_create([
+            User(username='bench', email=f'bench{number}@bench.local', first_name=f'Имя{number}',
+                 last_name=f'Фамилия{number}', password='!')
+            for number in range(rows)], batch_size=1000)
+        if users[0].pk is None:
+            users = list(User.objects.filter(email__endswith='@bench.local').order_by('id'))
+        Course.objects.bulk_create([
+            Course(title=f'Бенчмарк {number}', description='Описание курса', start_date=timezone.now().date(),
+                   duration=number % 12 + 1, price=number, count_lessons=rows)
+            for number in range(rows)], batch_size=1000)
+        courses = list(Course.objects.filter(title__startswith='Бенчмарк ').order_by('id'))
+        Course.authors.through.objects.bulk_create([
+            Course.authors.through(course_id=course.id, user_id=users[(number + shift) % rows].id)
+            for number, course in enumerate(courses) for shift in (0, 1)], batch_size=1000)
+        course = courses[0]
+        Lesson.objects.bulk_create([
+            Lesson(course=course, name=f'Бенч-урок {number}', preview='Описание урока', position=number)
+            for number in range(rows)], batch_size=1000)
+        Review.objects.bulk_create([
+            Review(course=course, user=user, content=f'Отзыв {number}') for number, user in enumerate(users)],
+            batch_size=1000)
+        return (
+            ('courses', CourseSerializer, Course.objects.filter(title__startswith='Бенчмарк ').order_by('title')),
+            ('lessons', LessonSerializer, Lesson.objects.filter(course=course).order_by('name')),
+            ('reviews', ReviewSerializer, Review.objects.filter(course=course).order_by('sent_date', 'id')),
+        )
+
+    def measure(self, func, repeat):
+        best, result = None, None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def compare(self, label, serializer_class, queryset, rows, repeat):
+        renderer = JSONRenderer()
+        serializer = serializer_class()
+        optimized = plan_for(serializer).apply(queryset)
+        fast = compile_serializer(serializer)
+        if fast is None:
+            raise CommandError(f'{serializer_class.__name__} не компилируется в быстрый режим')
+
+        slow_time, slow_content = self.measure(
+            lambda: renderer.render(serializer_class(optimized.all(), many=True).data), repeat)
+        fast_time, fast_content = self.measure(
+            lambda: renderer.render(fast.serialize(fast.values(queryset.all()))), repeat)
+        if slow_content != fast_content:
+            raise CommandError(f'{label}: ответы ModelSerializer и FastSerializer различаются')
+        self.stdout.write(f'{label:<8} {rows:>6} строк: ModelSerializer {slow_time:.3f} с, '
+                          f'FastSerializer {fast_time:.3f} с, быстрее в {slow_time / fast_time:.1f} раза')
@@ -0,0 +1,25 @@
+import sys
+from django.core.management.base import BaseCommand
+from api.analytics import AnalyticEngine
+from api.export import EXPORT_FORMATS
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка аналитики по всем курсам в CSV или NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS.keys(), default='csv', help='Формат выгрузки')
+        parser.add_argument('--output', help='Файл для записи (по умолчанию stdout)')
+        parser.add_argument('--base-url', default='', help='Адрес сайта для ссылок на курсы')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Количество курсов в одной выборке')
+
+    def handle(self, *args, **options):
+        iter_rows, _ = EXPORT_FORMATS[options['format']]
+        reports = AnalyticEngine().iter_reports(chunk_size=options['chunk_size'])
+        output = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else sys.stdout
+        try:
+            for line in iter_rows(reports, options['base_url'].rstrip('/')):
+                output.write(line)
+        finally:
+            if output is not sys.stdout:
+                output.close()
@@ -0,0 +1,113 @@
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Ответы меньше порога не сжимаются: заголовки и время кодирования дороже выигрыша
+COMPRESSION_MIN_SIZE = 1024
+# Качество brotli для динамических ответов: выше 5 время растет быстрее, чем сжатие
+COMPRESSION_BROTLI_QUALITY = 4
+# Сжимаются только форматы API и выгрузок; HTML с CSRF-токеном не сжимается (атака BREACH)
+COMPRESSION_CONTENT_TYPES = ('application/json', 'application/msgpack', 'text/csv', 'application/x-ndjson', )
+
+
+def accepted_encodings(header: str) -> dict:
+    """
+    Разбор Accept-Encoding: кодировка -> вес q
+    """
+    encodings = {}
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        name, _, value = params.strip().partition('=')
+        if name.strip() == 'q':
+            try:
+                weight = float(value)
+            except ValueError:
+                weight = 0.0
+        encodings[coding] = weight
+    return encodings
+
+
+def choose_encoding(header: str):
+    """
+    Кодировка с наибольшим весом среди поддерживаемых; при равном весе brotli предпочтительнее
+    """
+    encodings = accepted_encodings(header)
+    best, best_weight = None, 0.0
+    for coding in ('br', 'gzip') if brotli is not None else ('gzip', ):
+        weight = encodings.get(coding, encodings.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def compress_brotli_sequence(sequence, quality: int):
+    # Каждая часть потока сбрасывается сразу, чтобы клиент получал данные без ожидания конца выгрузки
+    compressor = brotli.Compressor(quality=quality)
+    for item in sequence:
+        data = compressor.process(item) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Сжатие ответов API gzip или brotli (если установлен brotli) по Accept-Encoding клиента.
+    Сжимаются ответы форматов COMPRESSION_CONTENT_TYPES больше COMPRESSION_MIN_SIZE и потоковые выгрузки
+    """
+
+    def should_compress(self, response) -> bool:
+        if response.has_header('Content-Encoding'):
+            return False
+        content_type = response.get('Content-Type', '').partition(';')[0].strip().lower()
+        if content_type not in getattr(settings, 'COMPRESSION_CONTENT_TYPES', COMPRESSION_CONTENT_TYPES):
+            return False
+        return response.streaming or \
+            len(response.content) >= getattr(settings, 'COMPRESSION_MIN_SIZE', COMPRESSION_MIN_SIZE)
+
+    def compress(self, content: bytes, coding: str) -> bytes:
+        if coding == 'br':
+            return brotli.compress(content, quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY',
+                                                            COMPRESSION_BROTLI_QUALITY))
+        return compress_string(content)
+
+    def process_response(self, request, response):
+        if not self.should_compress(response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding', ))
+        coding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if coding is None:
+            return response
+
+        if response.streaming:
+            if coding == 'br':
+                response.streaming_content = compress_brotli_sequence(
+                    response.streaming_content,
+                    getattr(settings, 'COMPRESSION_BROTLI_QUALITY', COMPRESSION_BROTLI_QUALITY))
+            else:
+                response.streaming_content = compress_sequence(response.streaming_content)
+            del response.headers['Content-Length']
+        else:
+            compressed = self.compress(response.content, coding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # Сжатое представление не совпадает побайтно с исходным: ETag становится слабым (RFC 7232)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = coding
+        return response
@@ -0,0 +1,183 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from learning.cache import get_catalog_version, get_model_versions, get_scope_version
+from learning.conditional import ConditionalGetMixin, make_etag
+from .fast import compile_serializer
+from .optimizer import plan_for
+
+
+class VersionedConditionalGetMixin(ConditionalGetMixin):
+    """
+    Условный GET для чтения API: валидаторы строятся по версии каталога и,
+    если задан version_scope, по версии уроков/отзывов курса из URL
+    """
+    version_scope = None
+
+    def get_versions(self, request, **kwargs) -> list:
+        if not hasattr(self, 'versions'):
+            self.versions = [get_catalog_version()]
+            if self.version_scope:
+                self.versions.append(get_scope_version(self.version_scope, kwargs[self.lookup_url_kwarg]))
+        return self.versions
+
+    def get_etag(self, request, *args, **kwargs):
+        # Формат ответа выбирается по Accept или параметру запроса, поэтому оба входят в ETag
+        return make_etag(self.__class__.__name__, *self.get_versions(request, **kwargs),
+                         request.get_full_path(), request.META.get('HTTP_ACCEPT', ''))
+
+
+# Время жизни ответа в кэше, сек.; устаревшие ответы отсекаются версиями моделей в ключе
+API_RESPONSE_CACHE_TIMEOUT = 300
+
+
+class ResponseCacheMixin(object):
+    """
+    Кэш ответов list / retrieve. Ключ: представление, адрес, нормализованные параметры запроса,
+    классы прав и версии моделей, из которых собран ответ (cache_models или модели плана запроса).
+    Версии поднимаются сигналами сохранения и удаления, поэтому повторный запрос не обращается к базе,
+    пока данные не изменились. Кэшируются данные ответа: формат выбирается при отрисовке.
+    Ответ, зависящий от пользователя, требует cache_per_user
+    """
+    cache_models = None
+    cache_per_user = False
+
+    def get_cache_models(self) -> list:
+        if self.cache_models is not None:
+            return list(self.cache_models)
+        plan = self.get_query_plan() if hasattr(self, 'get_query_plan') else None
+        models = plan.models() if plan is not None else {self.get_serializer_class().Meta.model}
+        return sorted(models, key=lambda model: model._meta.label_lower)
+
+    def normalize_query_params(self, query_params) -> list:
+        """
+        Параметры в каноническом виде: по алфавиту, без пустых значений, с нормализованными пробелами;
+        поиск регистронезависимый, поэтому строка поиска приводится к одному регистру
+        """
+        params = []
+        for name in sorted(query_params):
+            values = [' '.join(value.split()) for value in query_params.getlist(name)]
+            if name == api_settings.SEARCH_PARAM:
+                values = [value.casefold() for value in values]
+            values = sorted(value for value in values if value)
+            if values:
+                params.append((name, values))
+        return params
+
+    def get_access_key(self, request) -> tuple:
+        # Класс доступа пользователя: права представления и статус; id - только для личных ответов
+        user = request.user
+        access = (*[permission.__name__ for permission in self.permission_classes],
+                  'staff' if user.is_staff else 'user' if user.is_authenticated else 'anonymous')
+        return (*access, user.pk) if self.cache_per_user else access
+
+    def get_response_cache_key(self, request) -> str:
+        models = self.get_cache_models()
+        request_key = make_etag(self.__class__.__name__, request.get_host(), request.path,
+                                self.normalize_query_params(request.query_params), self.get_access_key(request))
+        versions = '.'.join(map(str, get_model_versions(models)))
+        return f'api_response_{request_key}_{versions}'
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        timeout = getattr(settings, 'API_RESPONSE_CACHE_TIMEOUT', API_RESPONSE_CACHE_TIMEOUT)
+        if not timeout or request.method not in ('GET', 'HEAD'):
+            return handler(request, *args, **kwargs)
+        key = self.get_response_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            data, headers = cached
+            return Response(data, headers=headers)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200 and not response.exception:
+            cache.set(key, (response.data, dict(response.items())), timeout)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super(ResponseCacheMixin, self).list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super(ResponseCacheMixin, self).retrieve, request, *args, **kwargs)
+
+
+class QueryOptimizerMixin(object):
+    """
+    Для чтения дополняет queryset представления select_related / prefetch_related / only()
+    по графу полей сериализатора, чтобы список загружался фиксированным числом запросов
+    """
+
+    def get_query_plan(self):
+        serializer_class = self.get_serializer_class()
+        plans = self.__class__.__dict__.get('_query_plans')
+        if plans is None:
+            plans = self.__class__._query_plans = {}
+        if serializer_class not in plans:
+            plans[serializer_class] = plan_for(self.get_serializer())
+        return plans[serializer_class]
+
+    def get_ordering_fields_to_load(self):
+        # Курсор пагинации читает поля сортировки из последнего объекта страницы
+        ordering = getattr(self, 'ordering', None) or ()
+        ordering_fields = getattr(self, 'ordering_fields', None) or ()
+        names = [ordering] if isinstance(ordering, str) else list(ordering)
+        names += [] if ordering_fields == '__all__' else list(ordering_fields)
+        model_fields = {field.name for field in self.get_serializer_class().Meta.model._meta.concrete_fields}
+        return [name.lstrip('-') for name in names if name.lstrip('-') in model_fields]
+
+    def optimize_queryset(self, queryset):
+        if self.request is None or self.request.method not in SAFE_METHODS:
+            return queryset
+        plan = self.get_query_plan()
+        return queryset if plan is None else plan.apply(queryset, self.get_ordering_fields_to_load())
+
+    def filter_queryset(self, queryset):
+        # Представления переопределяют get_queryset, поэтому план применяется после фильтров:
+        # этот метод вызывают и list, и get_object
+        return self.optimize_queryset(super(QueryOptimizerMixin, self).filter_queryset(queryset))
+
+
+class FastSerializerMixin(object):
+    """
+    Быстрый режим чтения по флагу fast_serializer: list и retrieve строят ответ из values()
+    через FastSerializer вместо ModelSerializer. Ответ совпадает побайтно; если сериализатор
+    не компилируется, используется обычный путь. Проверки прав на объект в быстром режиме нет,
+    поэтому флаг включается только для публичных представлений только для чтения
+    """
+    fast_serializer = False
+
+    def get_fast_serializer(self):
+        if not self.fast_serializer:
+            return None
+        serializer_class = self.get_serializer_class()
+        compiled = self.__class__.__dict__.get('_fast_serializers')
+        if compiled is None:
+            compiled = self.__class__._fast_serializers = {}
+        if serializer_class not in compiled:
+            compiled[serializer_class] = compile_serializer(self.get_serializer())
+        return compiled[serializer_class]
+
+    def list(self, request, *args, **kwargs):
+        fast = self.get_fast_serializer()
+        if fast is None:
+            return super(FastSerializerMixin, self).list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.paginator is None:
+            return Response(fast.serialize(fast.values(queryset)))
+        # Курсор пагинации читает поля сортировки из строк страницы
+        ordering = self.paginator.get_ordering(request, queryset, self)
+        rows = self.paginate_queryset(fast.values(queryset, [name.lstrip('-') for name in ordering]))
+        return self.get_paginated_response(fast.serialize(rows))
+
+    def retrieve(self, request, *args, **kwargs):
+        fast = self.get_fast_serializer()
+        if fast is None:
+            return super(FastSerializerMixin, self).retrieve(request, *args, **kwargs)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = fast.values(self.filter_queryset(self.get_queryset()))\
+            .filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})\
+            .first()
+        if row is None:
+            raise Http404
+        return Response(fast.serialize([row])[0])
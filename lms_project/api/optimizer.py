@@ -0,0 +1,134 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework.relations import ManyRelatedField, RelatedField
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+
+class QueryPlan(object):
+    """
+    Что нужно загрузить для сериализатора: пути select_related, вложенные Prefetch и поля для only().
+    Пути, для которых нужны все поля модели (свойства, методы, SerializerMethodField), помечаются полными
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.select_related = {}  # путь -> модель
+        self.prefetch = {}  # путь -> QueryPlan вложенного сериализатора
+        self.fields = {'': set()}  # путь -> поля модели по этому пути
+        self.full = set()
+
+    def relation_path(self, prefix, name):
+        return f'{prefix}__{name}' if prefix else name
+
+    def add_field(self, prefix, name):
+        self.fields.setdefault(prefix, set()).add(name)
+
+    def add_source(self, model, prefix, attrs, is_related_field=False):
+        """
+        Разбор source поля (например, lesson.course.title): отношения по пути попадают в select_related
+        """
+        for position, attr in enumerate(attrs):
+            last = position == len(attrs) - 1
+            try:
+                field = model._meta.get_field(attr)
+            except FieldDoesNotExist:
+                # Свойство или метод модели: какие поля он читает, неизвестно
+                self.full.add(prefix)
+                return
+            if field.many_to_many or field.one_to_many:
+                self.add_prefetch(prefix, field, None)
+                return
+            if field.is_relation and (not last or not is_related_field):
+                self.add_field(prefix, field.name)
+                prefix = self.relation_path(prefix, field.name)
+                model = field.related_model
+                self.select_related[prefix] = model
+                self.fields.setdefault(prefix, set())
+                if last:
+                    self.full.add(prefix)
+                continue
+            self.add_field(prefix, field.attname if last and field.is_relation else field.name)
+
+    def add_prefetch(self, prefix, field, serializer):
+        path = self.relation_path(prefix, field.name)
+        plan = QueryPlan(field.related_model)
+        if serializer is not None:
+            plan.collect(serializer, field.related_model)
+        if field.one_to_many:
+            # Обратный внешний ключ нужен Django, чтобы разложить объекты по родителям
+            plan.add_field('', field.field.attname)
+        self.prefetch[path] = plan
+
+    def collect(self, serializer, model, prefix=''):
+        representation_fields = getattr(serializer, 'representation_fields', None)
+        if representation_fields is not None:
+            # Сериализатор с собственным to_representation заявляет, какие поля он читает
+            for name in representation_fields:
+                self.add_source(model, prefix, name.split('.'))
+            return
+        for field in serializer.fields.values():
+            if field.write_only:
+                continue
+            if field.source == '*':
+                self.full.add(prefix)
+                continue
+            attrs = field.source.split('.')
+            if isinstance(field, ListSerializer) and len(attrs) == 1:
+                self.add_prefetch(prefix, model._meta.get_field(attrs[0]), field.child)
+            elif isinstance(field, BaseSerializer) and len(attrs) == 1:
+                relation = model._meta.get_field(attrs[0])
+                self.add_field(prefix, relation.name)
+                path = self.relation_path(prefix, relation.name)
+                self.select_related[path] = relation.related_model
+                self.fields.setdefault(path, set())
+                self.collect(field, relation.related_model, path)
+            else:
+                self.add_source(model, prefix, attrs, isinstance(field, (RelatedField, ManyRelatedField)))
+        for source in getattr(serializer, 'related_sources', ()):
+            self.add_source(model, prefix, source.split('.'))
+
+    def only_fields(self, extra=()):
+        """
+        Поля для only(). Django ограничивает поля по модели, а не по пути, поэтому модель,
+        которая хотя бы по одному пути нужна полностью, загружается полностью везде
+        """
+        if '' in self.full:
+            return None
+        models = {'': self.model, **self.select_related}
+        full_models = {models[path] for path in self.full}
+        only = set()
+        for path, names in self.fields.items():
+            if models[path] in full_models:
+                continue
+            for name in (names | set(extra) if not path else names):
+                only.add(self.relation_path(path, name))
+            only.add(self.relation_path(path, models[path]._meta.pk.name))
+        return sorted(only)
+
+    def models(self) -> set:
+        # Модели, из которых собирается ответ: корень, select_related и вложенные prefetch
+        models = {self.model, *self.select_related.values()}
+        for plan in self.prefetch.values():
+            models |= plan.models()
+        return models
+
+    def apply(self, queryset, extra=()):
+        if self.select_related:
+            queryset = queryset.select_related(*sorted(self.select_related))
+        for path, plan in sorted(self.prefetch.items()):
+            queryset = queryset.prefetch_related(Prefetch(path, queryset=plan.apply(plan.model._default_manager.all())))
+        only = self.only_fields(extra)
+        if only is not None:
+            queryset = queryset.only(*only)
+        return queryset
+
+
+def plan_for(serializer) -> QueryPlan:
+    if isinstance(serializer, ListSerializer):
+        serializer = serializer.child
+    model = getattr(getattr(serializer, 'Meta', None), 'model', None)
+    if model is None:
+        return None
+    plan = QueryPlan(model)
+    plan.collect(serializer, model)
+    return plan
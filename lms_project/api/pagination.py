@@ -0,0 +1,76 @@
+from collections import OrderedDict
+from django.db import connections
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from .filters import CourseSearchFilter
+
+
+def estimate_count(queryset):
+    """
+    Оценка количества записей без COUNT(*): статистика таблицы или план запроса MySQL.
+    Для остальных СУБД выполняется обычный COUNT(*)
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'mysql':
+        return queryset.count()
+
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute('SELECT TABLE_ROWS FROM information_schema.TABLES '
+                           'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s', [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+            return int(row[0] or 0) if row else 0
+        sql, params = queryset.order_by().values('pk').query.sql_with_params()
+        cursor.execute(f'EXPLAIN {sql}', params)
+        columns = [column[0] for column in cursor.description]
+        return int(dict(zip(columns, cursor.fetchone())).get('rows') or 0)
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Курсорная пагинация по стабильной сортировке: без COUNT(*) и OFFSET.
+    Оценка общего количества записей возвращается по запросу ?with_total=1
+    """
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    with_total_query_param = 'with_total'
+
+    def get_ordering(self, request, queryset, view):
+        return self.with_tie_breaker(self.get_base_ordering(request, queryset, view))
+
+    @staticmethod
+    def with_tie_breaker(ordering) -> tuple:
+        # Неуникальная сортировка (title, price) дополняется id: страницы не теряют и не повторяют записи
+        ordering = tuple(ordering)
+        if any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            return ordering
+        return ordering + ('id', )
+
+    def get_base_ordering(self, request, queryset, view):
+        search_filters = [filter_cls for filter_cls in getattr(view, 'filter_backends', [])
+                          if issubclass(filter_cls, CourseSearchFilter)]
+        if search_filters:
+            ordering = search_filters[0]().get_rank_ordering(request)
+            if ordering:
+                return ordering
+        return super(KeysetPagination, self).get_ordering(request, queryset, view)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.total = estimate_count(queryset) if request.query_params.get(self.with_total_query_param) else None
+        return super(KeysetPagination, self).paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        content = [
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]
+        if self.total is not None:
+            content.insert(0, ('count', self.total))
+        return Response(OrderedDict(content))
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super(KeysetPagination, self).get_paginated_response_schema(schema)
+        response_schema['properties']['count'] = {'type': 'integer', 'example': 123}
+        return response_schema
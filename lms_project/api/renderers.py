@@ -0,0 +1,69 @@
+from math import isfinite
+from rest_framework.utils import encoders
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def floats_match_json(data) -> bool:
+    """
+    orjson и json пишут float одинаково, пока repr числа без экспоненты: 1e16 у orjson - «1e16»,
+    у json - «1e+16». NaN и бесконечность orjson выводит как null, а строгий JSONRenderer отклоняет
+    """
+    if isinstance(data, float):
+        return isfinite(data) and 'e' not in repr(data)
+    if isinstance(data, dict):
+        return all(floats_match_json(key) and floats_match_json(value) for key, value in data.items())
+    if isinstance(data, (list, tuple)):
+        return all(floats_match_json(item) for item in data)
+    return True
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON через orjson, если он установлен. Вывод совпадает с JSONRenderer: компактный UTF-8,
+    типы, которых orjson не знает (Decimal, даты, ленивые строки), переводит кодировщик DRF.
+    Отступы, ASCII-вывод, float в экспоненциальной записи или NaN и данные, которые orjson не принимает,
+    обрабатывает стандартный рендерер
+    """
+    encoder = encoders.JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact \
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None \
+                or not floats_match_json(data):
+            return super(FastJSONRenderer, self).render(data, accepted_media_type, renderer_context)
+        try:
+            content = orjson.dumps(data, default=self.encoder.default,
+                                   option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+        except orjson.JSONEncodeError:
+            return super(FastJSONRenderer, self).render(data, accepted_media_type, renderer_context)
+        # Как и JSONRenderer, экранируем U+2028 и U+2029: ответ остается подмножеством JavaScript
+        if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+            content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return content
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    MessagePack (application/msgpack, ?to=msgpack). Доступен, только если установлен msgpack
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    encoder = encoders.JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=self.encoder.default, use_bin_type=True)
+
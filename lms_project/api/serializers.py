@@ -1,12 +1,18 @@
 from rest_framework import serializers
 from rest_framework.serializers import ModelSerializer, Serializer, ValidationError, ListSerializer
 from django.utils.timezone import datetime
-from django.db.models import Count, Sum
+from django.shortcuts import reverse
 from learning.models import Course, Lesson, Tracking, Review
 from auth_app.models import User
+from learning.enrollment import ALREADY_ENROLLED, EnrollmentError, enroll_users
+
+
+COHORT_MAX_SIZE = 10000
 
 
 class UserRepresentationSerializer(ModelSerializer):
+    # Поля, которые читает to_representation: по ним QueryOptimizerMixin строит only()
+    representation_fields = ('first_name', 'last_name', )
 
     class Meta:
         model = User
@@ -17,6 +23,8 @@ class UserRepresentationSerializer(ModelSerializer):
 
 
 class CourseRepresentationSerializer(ModelSerializer):
+    representation_fields = ('title', )
+
     class Meta:
         model = Course
         fields = '__all__'
@@ -26,6 +34,8 @@ class CourseRepresentationSerializer(ModelSerializer):
 
 
 class LessonRepresentationSerializer(ModelSerializer):
+    representation_fields = ('name', )
+
     class Meta:
         model = Lesson
         fields = '__all__'
@@ -69,45 +79,16 @@ class ReviewSerializer(ModelSerializer):
 
 
 class AnalyticCourseSerializer(Serializer):
-    course = serializers.SerializerMethodField()
-    views = serializers.SerializerMethodField()
-    count_students = serializers.SerializerMethodField()
-    percent_passed = serializers.SerializerMethodField()
+    course = serializers.CharField()
+    views = serializers.IntegerField()
+    count_students = serializers.IntegerField()
+    percent_passed = serializers.FloatField()
     url = serializers.SerializerMethodField()
 
-    def get_course(self, instance) -> str:
-        return instance.course.title
-
-    def get_views(self, instance) -> int:
-        request = self.context.get('request')
-        views_dict = request.session.get('views', {})
-        return views_dict.get(str(instance.course.id), 0)
-
     def get_url(self, instance) -> str:
         request = self.context.get('request')
-        return f'{request.scheme}://{request.META["HTTP_HOST"]}{instance.course.get_absolute_url()}'
-
-    def get_count_students(self, instance) -> int:
-        total_students = Tracking.objects\
-            .filter(lesson__course=instance.course.id)\
-            .values('lesson__course')\
-            .aggregate(Count('user', distinct=True))
-        return total_students['user__count']
-
-    def get_percent_passed(self, instance) -> float:
-        course_id = instance.course.id
-        students = Tracking.objects.filter(lesson__course=course_id).values('user').distinct()
-        users_percent = list()
-        for id in range(len(students)):
-            percents = Tracking.objects.filter(lesson__course=course_id, user=students[id]['user']).\
-                aggregate(total=Count('lesson'), fact=Sum('passed'))
-            user_percent = float(percents['fact'] / percents['total'] * 100)
-            users_percent.append(user_percent)
-        try:
-            total_percent = round(sum(users_percent) / len(users_percent), 2)
-            return total_percent
-        except ZeroDivisionError:
-            return 0
+        path = reverse('detail', kwargs={'course_id': instance.course_id})
+        return f'{request.scheme}://{request.get_host()}{path}'
 
 
 class AnalyticSerializer(Serializer):
@@ -125,30 +106,21 @@ class TrackingListSerializer(serializers.ListSerializer):
 
     def save(self, **kwargs):
         course = kwargs.pop('lesson')
-        is_existed = Tracking.objects.filter(user=kwargs['user'], lesson__course__id=course).exists()
-        if is_existed:
+        try:
+            result, = enroll_users(course, [kwargs['user'].id])
+        except EnrollmentError as error:
+            raise serializers.ValidationError({'error': str(error)})
+        if result.status == ALREADY_ENROLLED:
             raise serializers.ValidationError({'error': 'Вы уже записаны на данный курс'})
-        else:
-            lessons = Lesson.objects.filter(course__id=course)
-            records = [Tracking(lesson=lesson, user=kwargs['user'], passed=False) for lesson in lessons]
-            trackings = Tracking.objects.bulk_create(records)
-            return trackings
-
-    def update(self, instances, validated_data):
-        passed_list = list(map(lambda x: x['passed'], validated_data))
-        updated_instances = []
-        for id, instance in enumerate(instances):
-            instance.passed = passed_list[id]
-            updated_instances.append(instance)
-
-        Tracking.objects.bulk_update(objs=updated_instances, fields=('passed', ))
-        return updated_instances
+        return list(Tracking.objects.select_related('lesson__course').filter(user=kwargs['user'], lesson__course=course))
 
 
 class StudentTrackingSerializer(ModelSerializer):
     lesson = serializers.PrimaryKeyRelatedField(queryset=Course.objects.all(), label='Курс',
                                                 source='lesson.name')
     passed = serializers.ReadOnlyField()
+    # Дополнительно к полям to_representation читает курс урока
+    related_sources = ('lesson.course.title', )
 
     class Meta:
         model = Tracking
@@ -181,6 +153,21 @@ class AuthorTrackingSerializer(StudentTrackingSerializer):
         list_serializer_class = TrackingListSerializer
 
 
+class CohortEnrollmentSerializer(Serializer):
+    course = CoursePKRelatedField(queryset=Course.objects.all(), label='Курс')
+    users = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, default=list,
+                                  max_length=COHORT_MAX_SIZE, label='id учеников')
+    emails = serializers.ListField(child=serializers.EmailField(), required=False, default=list,
+                                   max_length=COHORT_MAX_SIZE, label='Email учеников')
+
+    def validate(self, data):
+        if not data['users'] and not data['emails']:
+            raise ValidationError('Укажите id или email учеников')
+        if len(data['users']) + len(data['emails']) > COHORT_MAX_SIZE:
+            raise ValidationError(f'За один запрос можно записать не более {COHORT_MAX_SIZE} учеников')
+        return data
+
+
 class UserAdminSerializer(ModelSerializer):
 
     class Meta:
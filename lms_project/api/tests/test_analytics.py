@@ -0,0 +1,141 @@
+from datetime import datetime, time, timedelta
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import Count, Sum
+from django.shortcuts import reverse
+from django.test import TestCase
+from django.utils import timezone
+from api.analytics import AnalyticEngine
+from auth_app.models import User
+from learning.counters import course_views
+from learning.models import Course, CourseDailyStats, Enrollment, CourseViews, ProgressEvent, Tracking
+from learning.rollups import cohort_curves, rollup_progress, week_start
+
+
+class AnalyticEngineTestCase(TestCase):
+    fixtures = ['test_data.json']
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def get_expected(self, course_id):
+        students = Tracking.objects.filter(lesson__course=course_id).values('user').distinct()
+        percents = []
+        for student in students:
+            data = Tracking.objects.filter(lesson__course=course_id, user=student['user'])\
+                .aggregate(total=Count('lesson'), fact=Sum('passed'))
+            percents.append(data['fact'] / data['total'] * 100)
+        return len(percents), round(sum(percents) / len(percents), 2) if percents else 0
+
+    def test_reports_match_per_student_aggregation(self):
+        reports = {report.course_id: report for report in AnalyticEngine().get_reports()}
+        self.assertEqual(len(reports), Course.objects.count())
+        for course in Course.objects.all():
+            report = reports[course.id]
+            self.assertEqual((report.count_students, report.percent_passed), self.get_expected(course.id))
+
+    def test_reports_use_constant_number_of_queries(self):
+        with self.assertNumQueries(1):
+            AnalyticEngine().get_reports()
+
+    def test_cached_reports_are_invalidated_by_course_version(self):
+        reports = AnalyticEngine().get_cached_reports()
+        self.assertEqual(reports, AnalyticEngine().get_reports())
+        with self.assertNumQueries(1):
+            AnalyticEngine().get_cached_reports()
+
+        tracking = Tracking.objects.filter(passed=False).select_related('lesson').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            Tracking.objects.filter(id=tracking.id).update(passed=True)
+        with self.assertNumQueries(2):
+            reports = AnalyticEngine().get_cached_reports()
+        self.assertEqual(reports, AnalyticEngine().get_reports())
+
+    def test_stats_follow_tracking_updates(self):
+        tracking = Tracking.objects.filter(passed=False).select_related('lesson').first()
+        Tracking.objects.filter(id=tracking.id).update(passed=True)
+        report = AnalyticEngine().get_reports(course_ids=[tracking.lesson.course_id])[0]
+        self.assertEqual((report.count_students, report.percent_passed),
+                         self.get_expected(tracking.lesson.course_id))
+        call_command('rebuild_course_stats', '--verify', stdout=StringIO())
+
+    def test_views_are_counted_globally(self):
+        course_views.buffer.drain()
+        course = Course.objects.first()
+        for _ in range(2):
+            self.client.get(reverse('detail', kwargs={'course_id': course.id}))
+        self.assertEqual(AnalyticEngine().get_reports(course_ids=[course.id])[0].views, 2)
+
+        call_command('flush_course_views', stdout=StringIO())
+        self.assertEqual(CourseViews.objects.get(course=course).total, 2)
+        self.assertEqual(AnalyticEngine().get_reports(course_ids=[course.id])[0].views, 2)
+
+    def test_detail_analytic_view(self):
+        course = Course.objects.first()
+        response = self.client.get(reverse('analytic-detail-analytic', kwargs={'course_id': course.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data'][0]['course'], course.title)
+
+        response = self.client.get(reverse('analytic-detail-analytic', kwargs={'course_id': 0}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_streaming_export(self):
+        response = self.client.get(reverse('analytics_export', kwargs={'export_format': 'csv'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'course,views,count_students,percent_passed,url')
+        self.assertEqual(len(lines), Course.objects.count() + 1)
+
+        response = self.client.get(reverse('analytics_export', kwargs={'export_format': 'xml'}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_trend_and_cohorts_read_rollups(self):
+        course = Course.objects.get(title='Django&Django Rest Framework')
+        call_command('rollup_progress', stdout=StringIO())
+        response = self.client.get(reverse('analytic-cohorts', kwargs={'course_id': course.id}))
+        self.assertEqual(response.status_code, 200)
+        cohort = response.data['cohorts'][0]
+        self.assertEqual(cohort['enrolled'], Enrollment.objects.filter(course=course).count())
+        completed = Enrollment.objects.filter(course=course, completed_at__isnull=False).count()
+        self.assertEqual(cohort['percent_completed'][0], round(completed / cohort['enrolled'] * 100, 2))
+
+        response = self.client.get(reverse('analytic-trend', kwargs={'course_id': course.id}))
+        self.assertEqual(response.data['trend'][-1]['enrolled'], cohort['enrolled'])
+
+    def test_late_unenrol_shrinks_own_cohort(self):
+        course = Course.objects.first()
+        user = User.objects.first()
+        ProgressEvent.objects.filter(course=course).delete()
+        enrolled_on = (timezone.now() - timedelta(weeks=5)).date()
+        enrolled = ProgressEvent.objects.create(course=course, user=user, kind=ProgressEvent.ENROLLED,
+                                                cohort=enrolled_on)
+        ProgressEvent.objects.filter(pk=enrolled.pk).update(created_at=timezone.now() - timedelta(weeks=5))
+        ProgressEvent.objects.create(course=course, user=user, kind=ProgressEvent.ENROLLED, amount=-1,
+                                     cohort=enrolled_on)
+        rollup_progress(full=True)
+        self.assertEqual([(cohort['cohort'], cohort['enrolled']) for cohort in cohort_curves(course.id)],
+                         [(week_start(enrolled_on), 0)])
+
+    def test_rollup_picks_up_last_week_events(self):
+        course = Course.objects.first()
+        rollup_progress()
+        # Событие конца прошлой недели, пришедшее после ее последнего пересчета
+        sunday = week_start(timezone.now().date()) - timedelta(days=1)
+        event = ProgressEvent.objects.create(course=course, user=User.objects.first(), kind=ProgressEvent.ENROLLED,
+                                             cohort=sunday)
+        ProgressEvent.objects.filter(pk=event.pk).update(
+            created_at=timezone.make_aware(datetime.combine(sunday, time(12))))
+        expected = ProgressEvent.objects.filter(course=course, kind=ProgressEvent.ENROLLED,
+                                                created_at__date=sunday).aggregate(total=Sum('amount'))['total']
+        rollup_progress()
+        self.assertEqual(CourseDailyStats.objects.get(course=course, day=sunday).enrolled, expected)
+
+    def test_trend_and_cohorts_validate_period(self):
+        course = Course.objects.first()
+        for name, params in (('analytic-trend', {'days': 'abc'}), ('analytic-trend', {'days': 100500}),
+                             ('analytic-cohorts', {'weeks': 0})):
+            response = self.client.get(reverse(name, kwargs={'course_id': course.id}), params)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(next(iter(params)), response.data)
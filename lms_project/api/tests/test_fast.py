@@ -0,0 +1,37 @@
+from unittest import mock
+from django.core.cache import cache
+from django.shortcuts import reverse
+from django.test import TestCase
+from api.views import CourseListAPIView, CourseRetrieveAPIView, LessonListAPIView, ReviewsListAPIView
+
+
+class FastSerializerTestCase(TestCase):
+    fixtures = ['test_data.json']
+
+    def assertSameContent(self, view_class, url, params=None):
+        cache.clear()
+        fast = self.client.get(url, params)
+        with mock.patch.object(view_class, 'fast_serializer', False):
+            cache.clear()
+            slow = self.client.get(url, params)
+        self.assertEqual(fast.status_code, 200)
+        self.assertEqual(fast.content, slow.content)
+        return fast
+
+    def test_courses(self):
+        response = self.assertSameContent(CourseListAPIView, reverse('courses'), {'page_size': 10, 'to': 'json'})
+        self.assertTrue(response.json()['results'][0]['authors'])
+        self.assertSameContent(CourseListAPIView, reverse('courses'), {'order_by': '-price', 'to': 'json'})
+        self.assertSameContent(CourseListAPIView, reverse('courses'), {'search': 'html', 'to': 'json'})
+
+    def test_course(self):
+        self.assertSameContent(CourseRetrieveAPIView, reverse('courses_id', kwargs={'course_id': 25}), {'to': 'json'})
+        with mock.patch.object(CourseRetrieveAPIView, 'fast_serializer', True):
+            response = self.client.get(reverse('courses_id', kwargs={'course_id': 100500}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_lessons_and_reviews(self):
+        url = reverse('lessons', kwargs={'course_id': 25})
+        response = self.assertSameContent(LessonListAPIView, url, {'page_size': 30, 'to': 'json'})
+        self.assertEqual(len(response.json()['results']), 25)
+        self.assertSameContent(ReviewsListAPIView, reverse('reviews', kwargs={'course_id': 25}), {'to': 'json'})
@@ -0,0 +1,31 @@
+from django.shortcuts import reverse
+from django.test import TestCase
+from auth_app.models import User
+from learning.enrollment import enroll_users
+from .utils import QueryCountAssertionsMixin
+
+
+class ListQueryCountTestCase(QueryCountAssertionsMixin, TestCase):
+    fixtures = ['test_data.json']
+
+    def test_courses(self):
+        self.assertQueryCountStable(reverse('courses'))
+
+    def test_lessons(self):
+        self.assertQueryCountStable(reverse('lessons', kwargs={'course_id': 25}))
+
+    def test_reviews(self):
+        self.assertQueryCountStable(reverse('reviews', kwargs={'course_id': 25}), page_sizes=(1, 3))
+
+    def test_trackings_for_authors(self):
+        author = User.objects.filter(authors__lessons__tracking__isnull=False).first()
+        self.client.force_login(author)
+        self.assertQueryCountStable(reverse('tracking_for_authors-list'))
+
+    def test_student_trackings(self):
+        student = User.objects.get(email='test_student@gmail.com')
+        enroll_users(25, [student.id])
+        self.client.force_login(student)
+        # Курсы с разным числом уроков: ответ деталей ученика не разбит на страницы
+        self.assertSameQueryCount([self.capture_list_queries(reverse('tracking-detail', kwargs={'course_id': course_id}))
+                                   for course_id in (2, 25)])
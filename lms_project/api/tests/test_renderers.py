@@ -0,0 +1,74 @@
+import gzip
+import json
+from decimal import Decimal
+from unittest import mock, skipUnless
+from django.shortcuts import reverse
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from api import middleware
+from api.renderers import FastJSONRenderer, MessagePackRenderer, msgpack
+
+
+class RendererTestCase(TestCase):
+    fixtures = ['test_data.json']
+
+    def test_fast_json_matches_json_renderer(self):
+        response = self.client.get(reverse('lessons', kwargs={'course_id': 25}), {'page_size': 30, 'to': 'json'})
+        data = {**response.data, 'price': Decimal('10.50'), 'date': timezone.now(), 'text': 'строка\u2028\u2029',
+                1: None}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(data, 'application/json; indent=2'),
+                         JSONRenderer().render(data, 'application/json; indent=2'))
+
+    def test_fast_json_floats_match_json_renderer(self):
+        data = {'large': 1e16, 'small': 1e-7, 'plain': [0.5, -0.0, 123.456], 2.5: 1}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        with self.assertRaises(ValueError):
+            FastJSONRenderer().render({'value': float('nan')})
+
+    @skipUnless(msgpack, 'msgpack не установлен')
+    def test_msgpack(self):
+        url = reverse('lessons', kwargs={'course_id': 25})
+        packed = self.client.get(url, HTTP_ACCEPT=MessagePackRenderer.media_type)
+        self.assertEqual(packed['Content-Type'], MessagePackRenderer.media_type)
+        self.assertEqual(msgpack.unpackb(packed.content), self.client.get(url, {'to': 'json'}).json())
+        self.assertEqual(self.client.get(url, {'to': 'msgpack'}).content, packed.content)
+
+
+class CompressionTestCase(TestCase):
+    fixtures = ['test_data.json']
+
+    def test_choose_encoding(self):
+        with mock.patch.object(middleware, 'brotli', object()):
+            self.assertEqual(middleware.choose_encoding('gzip, deflate, br'), 'br')
+            self.assertEqual(middleware.choose_encoding('br;q=0.5, gzip'), 'gzip')
+            self.assertEqual(middleware.choose_encoding('*;q=0.1'), 'br')
+        with mock.patch.object(middleware, 'brotli', None):
+            self.assertEqual(middleware.choose_encoding('br'), None)
+            self.assertEqual(middleware.choose_encoding('gzip;q=0, identity'), None)
+
+    @mock.patch.object(middleware, 'brotli', None)
+    def test_gzip_above_threshold(self):
+        url = reverse('lessons', kwargs={'course_id': 25})
+        plain = self.client.get(url, {'page_size': 30, 'to': 'json'})
+        compressed = self.client.get(url, {'page_size': 30, 'to': 'json'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertEqual(json.loads(plain.content)['results'][0], compressed.data['results'][0])
+
+        # Слабый ETag сжатого ответа подходит для условного запроса
+        self.assertTrue(compressed['ETag'].startswith('W/'))
+        response = self.client.get(url, {'page_size': 30, 'to': 'json'}, HTTP_ACCEPT_ENCODING='gzip',
+                                   HTTP_IF_NONE_MATCH=compressed['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_small_and_html_responses_are_not_compressed(self):
+        small = self.client.get(reverse('courses_id', kwargs={'course_id': 25}), {'to': 'json'},
+                                HTTP_ACCEPT_ENCODING='gzip')
+        self.assertLess(len(small.content), middleware.COMPRESSION_MIN_SIZE)
+        self.assertFalse(small.has_header('Content-Encoding'))
+        html = self.client.get(reverse('lessons', kwargs={'course_id': 25}), {'page_size': 30},
+                               HTTP_ACCEPT='text/html', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(html.has_header('Content-Encoding'))
@@ -0,0 +1,50 @@
+from django.core.cache import cache
+from django.shortcuts import reverse
+from django.test import TestCase
+from auth_app.models import User
+from learning.models import Course, Lesson
+
+
+class ResponseCacheTestCase(TestCase):
+    fixtures = ['test_data.json']
+
+    def setUp(self):
+        cache.clear()
+
+    def test_repeated_request_skips_database(self):
+        url = reverse('courses')
+        first = self.client.get(url, {'search': 'HTML  ', 'to': 'json'})
+        with self.assertNumQueries(0):
+            second = self.client.get(url, {'to': 'json', 'search': 'html'})
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.content, second.content)
+
+    def test_save_invalidates(self):
+        url = reverse('courses_id', kwargs={'course_id': 25})
+        self.client.get(url, {'to': 'json'})
+        course = Course.objects.get(id=25)
+        course.title = 'Новое название курса'
+        course.save()
+        self.assertEqual(self.client.get(url, {'to': 'json'}).json()['title'], 'Новое название курса')
+
+    def test_related_changes_invalidate(self):
+        url = reverse('courses_id', kwargs={'course_id': 25})
+        authors = self.client.get(url, {'to': 'json'}).json()['authors']
+        Course.objects.get(id=25).authors.clear()
+        self.assertNotEqual(self.client.get(url, {'to': 'json'}).json()['authors'], authors)
+
+        url = reverse('lessons', kwargs={'course_id': 25})
+        self.client.get(url, {'to': 'json', 'page_size': 30})
+        lesson = Lesson.objects.filter(course=25).first()
+        lesson.name = 'Новое название урока'
+        lesson.save()
+        names = [item['name'] for item in self.client.get(url, {'to': 'json', 'page_size': 30}).json()['results']]
+        self.assertIn(lesson.name, names)
+
+    def test_login_keeps_cache(self):
+        url = reverse('reviews', kwargs={'course_id': 25})
+        self.client.get(url, {'to': 'json'})
+        self.client.force_login(User.objects.get(email='test_student@gmail.com'))
+        self.client.logout()
+        with self.assertNumQueries(0):
+            self.client.get(url, {'to': 'json'})
@@ -0,0 +1,197 @@
+from io import StringIO
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.shortcuts import reverse
+from django.test import TestCase
+from django.utils.http import http_date
+from auth_app.models import User
+from learning.grading import GradeRow, grade, load_trackings
+from learning.models import Course, Enrollment, Lesson, Tracking
+
+
+class KeysetPaginationTestCase(TestCase):
+    fixtures = ['test_data.json']
+
+    def test_courses_cursor_pages(self):
+        titles, url = [], reverse('courses')
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            titles.extend(course['title'] for course in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(titles, list(Course.objects.order_by('title').values_list('title', flat=True)))
+
+    def test_courses_equal_values_paged_by_id(self):
+        Course.objects.update(price=100)
+        ids, url, params = [], reverse('courses'), {'order_by': 'price', 'page_size': 2}
+        while url:
+            response = self.client.get(url, params)
+            ids.extend(course['id'] for course in response.data['results'])
+            url, params = response.data['next'], None
+        self.assertEqual(ids, list(Course.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_courses_estimated_total(self):
+        response = self.client.get(reverse('courses'), data={'with_total': 1, 'order_by': '-price'})
+        self.assertEqual(response.data['count'], Course.objects.count())
+        prices = [course['price'] for course in response.data['results']]
+        self.assertEqual(prices, sorted(prices, reverse=True))
+
+
+class CourseFacetsTestCase(TestCase):
+    fixtures = ['test_data.json']
+
+    def test_courses_filtered_by_facets(self):
+        response = self.client.get(reverse('courses'), data={'free_only': 'true', 'page_size': 10})
+        self.assertEqual({course['price'] for course in response.data['results']}, {0})
+
+        response = self.client.get(reverse('courses'), data={'price_min': 100, 'price_max': 1})
+        self.assertEqual(response.status_code, 400)
+
+    def test_facet_counts(self):
+        response = self.client.get(reverse('courses_facets'), data={'duration_max': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total'], Course.objects.filter(duration__lte=2).count())
+        duration = {value['key']: value['count'] for value in response.data['duration']}
+        # Выбранное значение не обнуляет остальные значения своего фасета
+        self.assertEqual(duration, {'short': Course.objects.filter(duration__lte=2).count(),
+                                    'medium': Course.objects.filter(duration__range=(3, 6)).count(),
+                                    'long': Course.objects.filter(duration__gte=7).count()})
+        price = {value['key']: value['count'] for value in response.data['price']}
+        self.assertEqual(price['free'], Course.objects.filter(duration__lte=2, price=0).count())
+
+
+class ConditionalGetTestCase(TestCase):
+    fixtures = ['test_data.json']
+
+    def test_lessons_not_modified(self):
+        url = reverse('lessons', kwargs={'course_id': 24})
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(url, {'to': 'json'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        Lesson.objects.filter(course=24).first().save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_courses_not_modified(self):
+        url = reverse('courses_id', kwargs={'course_id': 24})
+        response = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        # Только ETag: Last-Modified с точностью в секунду пропустил бы изменение в ту же секунду
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date()).status_code, 200)
+
+
+class CohortEnrollmentTestCase(TestCase):
+    fixtures = ['test_data.json']
+
+    def setUp(self) -> None:
+        self.author = User.objects.get(email='test@gmail.com')
+        self.course = Course.objects.filter(authors=self.author, lessons__isnull=False).first()
+        self.client.force_login(self.author)
+
+    def test_enroll_cohort(self):
+        enrolled = Tracking.objects.filter(lesson__course=self.course).values_list('user', flat=True).first()
+        students = list(User.objects.exclude(id__in=[enrolled, self.author.id])
+                        .exclude(tracking__lesson__course=self.course).values_list('id', flat=True)[:2])
+        count_lessons = self.course.lessons.count()
+        data = {'course': self.course.id, 'users': students + [enrolled, 100500], 'emails': ['nobody@example.com']}
+        response = self.client.post(reverse('tracking_for_authors-enroll-cohort'), data=data,
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        statuses = {result.get('user', result.get('email')): result['status'] for result in response.data['results']}
+        self.assertEqual(statuses, {students[0]: 'enrolled', students[1]: 'enrolled', enrolled: 'already_enrolled',
+                                    100500: 'not_found', 'nobody@example.com': 'not_found'})
+        self.assertEqual(Tracking.objects.filter(user__in=students, lesson__course=self.course).count(),
+                         count_lessons * len(students))
+
+        response = self.client.post(reverse('tracking_for_authors-enroll-cohort'), data=data,
+                                    content_type='application/json')
+        self.assertEqual(response.data['summary']['already_enrolled'], 3)
+        self.assertEqual(Tracking.objects.filter(user__in=students, lesson__course=self.course).count(),
+                         count_lessons * len(students))
+        self.assertEqual(Enrollment.objects.filter(user__in=students, course=self.course).count(), len(students))
+
+    def test_enroll_cohort_command(self):
+        student = User.objects.exclude(tracking__lesson__course=self.course).exclude(id=self.author.id).first()
+        call_command('enroll_cohort', self.course.id, student.email, chunk_size=1, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(Tracking.objects.filter(user=student, lesson__course=self.course).count(),
+                         self.course.lessons.count())
+
+
+class GradingTestCase(TestCase):
+    fixtures = ['test_data.json']
+
+    def setUp(self) -> None:
+        self.author = User.objects.get(email='test@gmail.com')
+        self.own = Tracking.objects.filter(lesson__course__authors=self.author).order_by('id')
+        self.foreign = Tracking.objects.exclude(lesson__course__authors=self.author).first()
+        self.client.force_login(self.author)
+
+    def test_grade_json(self):
+        first, second = self.own[:2]
+        data = [{'id': first.id, 'passed': not first.passed},
+                {'user': second.user_id, 'lesson': second.lesson_id, 'passed': second.passed},
+                {'id': self.foreign.id, 'passed': not self.foreign.passed},
+                {'id': 100500, 'passed': True},
+                {'id': first.id, 'passed': 'maybe'}]
+        response = self.client.post(reverse('tracking_for_authors-grade'), data=data, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.data['results']],
+                         ['updated', 'unchanged', 'forbidden', 'not_found', 'invalid'])
+        first.refresh_from_db()
+        self.foreign.refresh_from_db()
+        self.assertEqual(first.passed, data[0]['passed'])
+        self.assertNotEqual(self.foreign.passed, data[2]['passed'])
+        enrollment = Enrollment.objects.get(user=first.user_id, course=first.lesson.course_id)
+        self.assertEqual(enrollment.is_passed(first.lesson.position), first.passed)
+
+    def test_update_passed_keeps_response_shape(self):
+        first, second = self.own[:2]
+        data = [{'id': second.id, 'passed': True}, {'id': first.id, 'passed': False},
+                {'id': self.foreign.id, 'passed': not self.foreign.passed}]
+        url = reverse('tracking_for_authors-update-passed')
+        response = self.client.patch(url, data=data, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(item['id'], item['passed']) for item in response.data],
+                         sorted([(first.id, False), (second.id, True)]))
+        self.assertEqual(set(response.data[0]), {'id', 'user', 'lesson', 'passed', 'course'})
+        self.assertFalse(Tracking.objects.get(id=first.id).passed)
+
+        response = self.client.patch(url, data=[{'id': first.id, 'passed': True}, {'id': second.id}],
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertFalse(Tracking.objects.get(id=first.id).passed)
+
+    def test_grade_loads_only_named_pairs(self):
+        first = self.own[0]
+        # Другой ученик проходит другой урок того же курса, который есть и у первого ученика
+        lesson = Tracking.objects.filter(user=first.user_id, lesson__course=first.lesson.course_id)\
+            .exclude(lesson=first.lesson_id).values_list('lesson', flat=True)[0]
+        student = User.objects.exclude(tracking__lesson__course=first.lesson.course_id).first()
+        second = Tracking.objects.create(user=student, lesson_id=lesson, passed=False)
+        rows = [GradeRow(1, user=first.user_id, lesson=first.lesson_id, passed=True),
+                GradeRow(2, user=second.user_id, lesson=second.lesson_id, passed=True)]
+        by_id, by_pair = load_trackings(rows, self.author.id)
+        self.assertEqual(set(by_id), {first.id, second.id})
+
+    def test_grade_duplicates_across_chunks(self):
+        first, second = self.own[:2]
+        data = [{'id': first.id, 'passed': not first.passed},
+                {'id': second.id, 'passed': second.passed},
+                {'user': first.user_id, 'lesson': first.lesson_id, 'passed': first.passed},
+                {'id': second.id, 'passed': ''}]
+        results = grade(data, self.author.id, chunk_size=1)
+        self.assertEqual([result.status for result in results], ['duplicate', 'unchanged', 'unchanged', 'invalid'])
+        self.assertEqual(Tracking.objects.get(id=first.id).passed, first.passed)
+
+    def test_grade_csv(self):
+        trackings = list(self.own)
+        content = 'id,passed\n' + ''.join(f'{tracking.id},true\n' for tracking in trackings)
+        upload = SimpleUploadedFile('grades.csv', content.encode(), content_type='text/csv')
+        response = self.client.post(reverse('tracking_for_authors-grade'), data={'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['summary']['updated'] + response.data['summary']['unchanged'], len(trackings))
+        self.assertFalse(self.own.filter(passed=False).exists())
+
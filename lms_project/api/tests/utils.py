@@ -0,0 +1,38 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryCountAssertionsMixin(object):
+    """
+    Проверка для TestCase: число запросов списка не должно зависеть от размера страницы (нет N+1)
+    """
+
+    def get_page_rows(self, response) -> int:
+        data = response.data
+        return len(data['results'] if isinstance(data, dict) and 'results' in data else data)
+
+    def capture_list_queries(self, url, params=None, **extra):
+        cache.clear()
+        # Прогрев: счетчики версий и прочие кэши не должны попасть в сравнение; кэш ответов отключен,
+        # иначе второй запрос не дойдет до базы
+        with override_settings(API_RESPONSE_CACHE_TIMEOUT=0):
+            self.client.get(url, params, **extra)
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url, params, **extra)
+        self.assertEqual(response.status_code, 200)
+        return self.get_page_rows(response), [query['sql'] for query in context.captured_queries]
+
+    def assertSameQueryCount(self, results):
+        rows = [count for count, _ in results]
+        if len(set(rows)) < len(rows):
+            self.fail(f'Ответы содержат {rows} объектов - для проверки нужно больше данных')
+        counts = [len(queries) for _, queries in results]
+        if len(set(counts)) > 1:
+            self.fail(f'Число запросов растет с количеством объектов {dict(zip(rows, counts))}:\n'
+                      + '\n'.join(results[-1][1]))
+
+    def assertQueryCountStable(self, url, params=None, page_sizes=(1, 5), **extra):
+        self.assertSameQueryCount([self.capture_list_queries(url, {**(params or {}), 'page_size': page_size}, **extra)
+                                   for page_size in page_sizes])
@@ -42,6 +42,8 @@ urlpatterns = [
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
     path('courses/', CourseListAPIView.as_view(), name='courses'),
     path('courses/<int:course_id>', CourseRetrieveAPIView.as_view(), name='courses_id'),
+    path('courses/facets/', CourseFacetsAPIView.as_view(), name='courses_facets'),
+    path('analytics/export/<str:export_format>/', analytics_export, name='analytics_export'),
     path('', include(router.urls)),
 
     # before using routers
@@ -1,25 +1,47 @@
+import csv
+import io
+from collections import Counter
 from django.db.models import ObjectDoesNotExist
+from django.http import Http404, StreamingHttpResponse
+from django.views.decorators.http import require_GET
 from django.shortcuts import get_object_or_404, get_list_or_404
 from rest_framework.decorators import api_view, action
-from rest_framework.generics import ListAPIView, RetrieveAPIView, ListCreateAPIView, CreateAPIView, RetrieveDestroyAPIView
+from rest_framework.generics import GenericAPIView, ListAPIView, RetrieveAPIView, ListCreateAPIView, CreateAPIView, RetrieveDestroyAPIView
 from rest_framework.authentication import BasicAuthentication, TokenAuthentication
 from rest_framework.filters import SearchFilter, OrderingFilter
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer, TemplateHTMLRenderer, AdminRenderer
-from rest_framework.serializers import ValidationError
+from rest_framework.serializers import IntegerField, ValidationError
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 from rest_framework.viewsets import ViewSet, ModelViewSet
 from django.db import IntegrityError
 from rest_framework import status
-from .analytics import AnalyticReport
+from .analytics import AnalyticEngine
+from .filters import CourseSearchFilter, CourseFacetFilter
+from .mixins import FastSerializerMixin, QueryOptimizerMixin, ResponseCacheMixin, VersionedConditionalGetMixin
+from .pagination import KeysetPagination
+from .export import EXPORT_FORMATS
 from learning.models import Course, Lesson, Tracking, Review
+from learning.rollups import COHORT_MAX_WEEKS, TREND_MAX_DAYS, completion_trend, cohort_curves
+from learning.facets import get_facet_counts
+from learning.enrollment import NOT_FOUND, EnrollmentError, enroll_users, users_by_email
+from learning.grading import GRADE_MAX_ROWS, UNCHANGED, UPDATED, grade, parse_rows
 from auth_app.models import User
 from .permissions import IsAuthor, IsStudent
 from .serializers import (CourseSerializer, LessonSerializer, TrackingSerializer, ReviewSerializer,
-                          AnalyticCourseSerializer, AnalyticSerializer, UserAdminSerializer, UserSerializer, StudentTrackingSerializer, AuthorTrackingSerializer)
+                          AnalyticCourseSerializer, AnalyticSerializer, UserAdminSerializer, UserSerializer, StudentTrackingSerializer, AuthorTrackingSerializer,
+                          CohortEnrollmentSerializer)
+
+
+def int_query_param(request, name: str, default: int, max_value: int) -> int:
+    # Некорректное или слишком большое значение - ошибка клиента (400), а не 500
+    try:
+        return IntegerField(min_value=1, max_value=max_value).run_validation(request.query_params.get(name, default))
+    except ValidationError as error:
+        raise ValidationError({name: error.detail})
 
 
 class AnalyticViewSet(ViewSet):
@@ -28,8 +50,7 @@ class AnalyticViewSet(ViewSet):
     """
 
     def list(self, request):
-        courses = Course.objects.all()
-        reports = [AnalyticReport(course=course) for course in courses]
+        reports = AnalyticEngine().get_cached_reports()
         analytic_serializer = AnalyticSerializer(reports, many=False, context={'request': request})
         return Response(data=analytic_serializer.data, status=status.HTTP_200_OK)
 
@@ -38,13 +59,34 @@ class AnalyticViewSet(ViewSet):
             url_path='(?P<course_id>[^/.]+)',
             name='Аналитика по курсу')
     def detail_analytic(self, request, course_id):
-        course = get_object_or_404(Course, id=course_id)
-        reports = [AnalyticReport(course=course)]
+        reports = AnalyticEngine().get_cached_reports(course_ids=[course_id])
+        if not reports:
+            raise Http404
         analytic_serializer = AnalyticSerializer(reports, many=False, context={'request': request})
         return Response(data=analytic_serializer.data, status=status.HTTP_200_OK)
 
+    @action(methods=('get', ),
+            detail=False,
+            url_path='(?P<course_id>[^/.]+)/trend',
+            name='Динамика прохождения курса')
+    def trend(self, request, course_id):
+        course = get_object_or_404(Course, id=course_id)
+        days = int_query_param(request, 'days', 30, TREND_MAX_DAYS)
+        return Response(data={'course': course.title, 'trend': completion_trend(course.id, days)},
+                        status=status.HTTP_200_OK)
 
-class TrackingStudentViewSet(ModelViewSet):
+    @action(methods=('get', ),
+            detail=False,
+            url_path='(?P<course_id>[^/.]+)/cohorts',
+            name='Когорты курса')
+    def cohorts(self, request, course_id):
+        course = get_object_or_404(Course, id=course_id)
+        weeks = int_query_param(request, 'weeks', 12, COHORT_MAX_WEEKS)
+        return Response(data={'course': course.title, 'cohorts': cohort_curves(course.id, weeks)},
+                        status=status.HTTP_200_OK)
+
+
+class TrackingStudentViewSet(QueryOptimizerMixin, ModelViewSet):
     http_method_names = ('get', 'post', 'options', )
     serializer_class = StudentTrackingSerializer
     permission_classes = (IsAuthenticated, IsStudent, )
@@ -55,7 +97,7 @@ class TrackingStudentViewSet(ModelViewSet):
         return Tracking.objects.filter(user=self.request.user)
 
     def get_object(self):
-        tracking = self.get_queryset()
+        tracking = self.optimize_queryset(self.get_queryset())
         filters = {self.lookup_field: self.kwargs[self.lookup_url_kwarg]}
         return get_list_or_404(tracking, **filters)
 
@@ -82,6 +124,7 @@ class TrackingAuthorViewSet(TrackingStudentViewSet):
     permission_classes = (IsAuthenticated, IsAuthor, )
     filter_backends = (SearchFilter, OrderingFilter, )
     search_fields = ('user__last_name', 'user__first_name', 'lesson__name', )
+    ordering = 'id'
 
     def get_queryset(self):
         return Tracking.objects.filter(lesson__course__authors=self.request.user)
@@ -90,18 +133,68 @@ class TrackingAuthorViewSet(TrackingStudentViewSet):
         data = self.request.data
         return serializer.save(user=User.objects.get(id=data['user']), lesson=data['lesson'])
 
+    @action(methods=('post', ), detail=False, name='Запись группы учеников на курс',
+            serializer_class=CohortEnrollmentSerializer)
+    def enroll_cohort(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        course, emails = serializer.validated_data['course'], serializer.validated_data['emails']
+        user_ids = users_by_email(emails)
+        try:
+            enrolled = enroll_users(course.id, serializer.validated_data['users'] + list(user_ids.values()))
+        except EnrollmentError as error:
+            raise ValidationError({'course': str(error)})
+        results = [{'user': result.user, 'status': result.status, 'created': result.created} for result in enrolled]
+        results += [{'email': email, 'status': NOT_FOUND, 'created': 0} for email in emails if email not in user_ids]
+        return Response(data={'course': course.id,
+                              'summary': Counter(result['status'] for result in results),
+                              'results': results},
+                        status=status.HTTP_200_OK)
+
+    @action(methods=('post', ), detail=False, name='Ведомость: массовая отметка о сдаче уроков',
+            parser_classes=(JSONParser, MultiPartParser, FormParser, ))
+    def grade(self, request, *args, **kwargs):
+        """
+        Принимает JSON-список строк {id | user + lesson, passed} или CSV-файл в поле file
+        с теми же колонками. Отвечает результатом по каждой строке
+        """
+        rows = self.get_grade_rows(request)
+        if len(rows) > GRADE_MAX_ROWS:
+            raise ValidationError(f'За один запрос можно отметить не более {GRADE_MAX_ROWS} строк')
+        return self.grade_response(grade(rows, request.user.id))
+
     @action(methods=('patch', ), detail=False, name='ОТметка о сдаче урока')
     def update_passed(self, request, *args, **kwargs):
-        data = sorted(request.data, key=lambda x: x['id'])
-        ids = list(map(lambda x: x['id'], data))
-        instances = Tracking.objects.filter(id__in=ids).order_by('id')
-        serializer = self.get_serializer(instances, data=data, many=True, partial=True)
-        serializer.is_valid(raise_exception=True)
-        self.perform_update(serializer)
-        return Response(serializer.data)
+        # Отметки применяются только к записям курсов автора. Ответ прежний - список отмеченных записей,
+        # чужие и ненайденные записи в него не попадают; построчный результат отдает действие grade
+        if not isinstance(request.data, list):
+            raise ValidationError('Ожидается список записей')
+        _, invalid = parse_rows(request.data)
+        if invalid:
+            errors = [{} for _ in request.data]
+            for result in invalid:
+                errors[result.row - 1] = {api_settings.NON_FIELD_ERRORS_KEY: [result.error]}
+            raise ValidationError(errors)
+        ids = [result.tracking for result in grade(request.data, request.user.id)
+               if result.status in (UPDATED, UNCHANGED)]
+        instances = self.get_queryset().filter(id__in=ids).select_related('user', 'lesson__course').order_by('id')
+        return Response(self.get_serializer(instances, many=True).data)
 
-    def perform_update(self, serializer):
-        serializer.update(serializer.instance, serializer.validated_data)
+    def get_grade_rows(self, request):
+        upload = request.FILES.get('file')
+        if upload is not None:
+            try:
+                return list(csv.DictReader(io.TextIOWrapper(upload, encoding='utf-8-sig')))
+            except (UnicodeDecodeError, csv.Error) as error:
+                raise ValidationError(f'Не удалось прочитать CSV: {error}')
+        if not isinstance(request.data, list):
+            raise ValidationError('Ожидается список записей или CSV-файл в поле file')
+        return request.data
+
+    def grade_response(self, results):
+        return Response(data={'summary': Counter(result.status for result in results),
+                              'results': [result._asdict() for result in results]},
+                        status=status.HTTP_200_OK)
 
 
 
@@ -112,7 +205,7 @@ class TrackingAuthorViewSet(TrackingStudentViewSet):
 class UserForAdminView(ListCreateAPIView):
     name = 'Список пользователей LMS Codeby'
     serializer_class = UserAdminSerializer
-    pagination_class = PageNumberPagination
+    pagination_class = KeysetPagination
     authentication_classes = (BasicAuthentication, )
     permission_classes = (IsAdminUser, )
     renderer_classes = (AdminRenderer, )
@@ -145,29 +238,52 @@ class CourseDeleteView(RetrieveDestroyAPIView):
 
 
 
-class CourseListAPIView(ListAPIView):
+class CourseListAPIView(VersionedConditionalGetMixin, ResponseCacheMixin, QueryOptimizerMixin, FastSerializerMixin,
+                        ListAPIView):
     """
     Полный список курсов, размещенных на платформе
     """
     name = 'Список курсов'
     serializer_class = CourseSerializer
+    fast_serializer = True
     authentication_classes = (TokenAuthentication, )
-    pagination_class = PageNumberPagination
-    filter_backends = (SearchFilter, OrderingFilter, )
-    search_fields = ('title', 'description', 'authors__first_name', 'authors__last_name', 'start_date', )
-    ordering_fields = ('start_date', 'price', )
+    pagination_class = KeysetPagination
+    filter_backends = (CourseSearchFilter, CourseFacetFilter, OrderingFilter, )
+    ordering_fields = ('start_date', 'price', 'duration', )
     ordering = 'title'
 
     def get_queryset(self):
         return Course.objects.all()
 
 
-class CourseRetrieveAPIView(RetrieveAPIView):
+class CourseFacetsAPIView(GenericAPIView):
+    """
+    Количество курсов по значениям фасетов с учетом поиска и уже выбранных фильтров
+    """
+    name = 'Фасеты курсов'
+    # Фильтры фасетов применяет facet_counts: у каждого фасета свои, без его собственных параметров
+    filter_backends = (CourseSearchFilter, )
+
+    def get_queryset(self):
+        return Course.objects.all()
+
+    def get(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        params = {
+            'search': ' '.join(request.query_params.get(api_settings.SEARCH_PARAM, '').split()).casefold(),
+            **CourseFacetFilter().get_filters(request),
+        }
+        return Response(data=get_facet_counts(queryset, params), status=status.HTTP_200_OK)
+
+
+class CourseRetrieveAPIView(VersionedConditionalGetMixin, ResponseCacheMixin, QueryOptimizerMixin, FastSerializerMixin,
+                            RetrieveAPIView):
     """
     Получение курса по id, переданному в URL
     """
     name = 'Курс'
     serializer_class = CourseSerializer
+    fast_serializer = True
     lookup_field = 'id'
     lookup_url_kwarg = 'course_id'
 
@@ -175,13 +291,16 @@ class CourseRetrieveAPIView(RetrieveAPIView):
         return Course.objects.all()
 
 
-class LessonListAPIView(ListAPIView):
+class LessonListAPIView(VersionedConditionalGetMixin, ResponseCacheMixin, QueryOptimizerMixin, FastSerializerMixin,
+                        ListAPIView):
     """
     Получение уроков курса по id, переданному в URL
     """
     name = 'Уроки'
     serializer_class = LessonSerializer
-    pagination_class = PageNumberPagination
+    fast_serializer = True
+    version_scope = 'lessons'
+    pagination_class = KeysetPagination
     filter_backends = (SearchFilter, OrderingFilter, )
     search_fields = ('name', 'preview', )
     ordering_fields = ('name', 'preview', )
@@ -194,16 +313,17 @@ class LessonListAPIView(ListAPIView):
         return Lesson.objects.filter(course=course_id)
 
 
-class TrackingListAPIView(ListAPIView):
+class TrackingListAPIView(ResponseCacheMixin, QueryOptimizerMixin, ListAPIView):
     """
     Получение прогресса по курсам по id user, переданному в URL
     """
     name = 'Трэкинги'
     serializer_class = TrackingSerializer
-    pagination_class = PageNumberPagination
+    pagination_class = KeysetPagination
     filter_backends = (SearchFilter, OrderingFilter, )
     search_fields = ('lesson__name', )
     ordering_fields = ('lesson', )
+    ordering = 'id'
     lookup_field = 'user'
     lookup_url_kwarg = 'user_id'
 
@@ -212,17 +332,20 @@ class TrackingListAPIView(ListAPIView):
         return Tracking.objects.filter(user=user_id)
 
 
-class ReviewsListAPIView(ListAPIView):
+class ReviewsListAPIView(VersionedConditionalGetMixin, ResponseCacheMixin, QueryOptimizerMixin, FastSerializerMixin,
+                         ListAPIView):
     """
     Получение отзывов курса по id, переданному в URL
     """
     name = 'Отзывы'
     serializer_class = ReviewSerializer
-    pagination_class = PageNumberPagination
+    fast_serializer = True
+    version_scope = 'reviews'
+    pagination_class = KeysetPagination
     filter_backends = (SearchFilter, OrderingFilter,)
     search_fields = ('user__first_name', 'user__last_name', )
     ordering_fields = ('user', 'sent_date', )
-    ordering = 'sent_date'
+    ordering = ('sent_date', 'id', )
     lookup_field = 'course'
     lookup_url_kwarg = 'course_id'
 
@@ -232,6 +355,8 @@ class ReviewsListAPIView(ListAPIView):
 
 
 
+# CourseAPIView и функции ниже не подключены в api/urls.py: маршрут courses обслуживает CourseListAPIView,
+# поэтому быстрого режима (FastSerializerMixin) и кэша ответов у них нет
 class CourseAPIView(APIView):
     name = 'Список курсов'
     description = 'Информация о всех курсах, размещенных на платформе codeby'
@@ -297,11 +422,21 @@ def reviews(request, course_id):
 
 @api_view(['GET'])
 def analytics(request):
-    courses = Course.objects.all()
-    reports = [AnalyticReport(course=course) for course in courses]
+    reports = AnalyticEngine().get_cached_reports()
     analytic_serializer = AnalyticSerializer(reports, many=False, context={'request': request})
     return Response(data=analytic_serializer.data, status=status.HTTP_200_OK)
 
+@require_GET
+def analytics_export(request, export_format):
+    if export_format not in EXPORT_FORMATS:
+        raise Http404
+    iter_rows, content_type = EXPORT_FORMATS[export_format]
+    reports = AnalyticEngine().iter_reports()
+    response = StreamingHttpResponse(iter_rows(reports, f'{request.scheme}://{request.get_host()}'),
+                                     content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="analytics.{export_format}"'
+    return response
+
 @api_view(['GET', 'POST'])
 def users(request):
     if request.method == 'GET':
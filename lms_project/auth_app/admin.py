@@ -1,7 +1,21 @@
 from django.contrib import admin
-from .models import User
+from .models import User, KnownDevice, LoginEvent
 from django.contrib.auth.models import Group
 
 
 admin.site.site_header='Learning Management System'
-admin.site.register(User)
\ No newline at end of file
+admin.site.register(User)
+
+
+@admin.register(KnownDevice)
+class KnownDeviceAdmin(admin.ModelAdmin):
+    list_display = ('user', 'user_agent', 'ip', 'first_seen', 'last_seen')
+    search_fields = ('user__email', )
+    list_per_page = 100
+
+
+@admin.register(LoginEvent)
+class LoginEventAdmin(admin.ModelAdmin):
+    list_display = ('user', 'user_agent', 'ip', 'created_at', 'notified_at')
+    search_fields = ('user__email', )
+    list_per_page = 100
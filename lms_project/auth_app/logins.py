@@ -0,0 +1,111 @@
+import hashlib
+import ipaddress
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+from outbox.mail import build_message
+from outbox.models import OutboxMessage
+from .models import KnownDevice, LoginEvent
+
+
+# Окно накопления входов, сек.: повторы внутри окна отбрасываются, новые устройства попадают в одно письмо
+LOGIN_NOTIFY_WINDOW = 5 * 60
+LOGIN_FLUSH_BATCH_SIZE = 500
+
+
+def client_ip(request):
+    ip = request.META.get('REMOTE_ADDR')
+    try:
+        return str(ipaddress.ip_address(ip))
+    except ValueError:
+        return None
+
+
+def device_fingerprint(user_agent: str, ip) -> str:
+    """
+    Отпечаток устройства: User-Agent и подсеть (/24 для IPv4, /64 для IPv6),
+    чтобы смена адреса внутри сети провайдера не считалась новым устройством
+    """
+    network = ''
+    if ip:
+        address = ipaddress.ip_address(ip)
+        network = str(ipaddress.ip_network(f'{ip}/{24 if address.version == 4 else 64}', strict=False))
+    return hashlib.sha256(f'{user_agent}|{network}'.encode()).hexdigest()
+
+
+def get_window() -> int:
+    return getattr(settings, 'LOGIN_NOTIFY_WINDOW', LOGIN_NOTIFY_WINDOW)
+
+
+def record_login(user, request) -> bool:
+    """
+    Запоминает вход. Возвращает True, если устройство новое и о входе нужно уведомить
+    """
+    user_agent = request.META.get('HTTP_USER_AGENT', '')[:255]
+    ip = client_ip(request)
+    fingerprint = device_fingerprint(user_agent, ip)
+    # Повторные входы с того же устройства внутри окна (скрипты, автологин) не доходят до базы
+    if not cache.add(f'login_seen_{user.pk}_{fingerprint}', True, timeout=get_window()):
+        return False
+    if KnownDevice.objects.filter(user=user, fingerprint=fingerprint).update(last_seen=timezone.now()):
+        return False
+    KnownDevice.objects.bulk_create([KnownDevice(user=user, fingerprint=fingerprint, user_agent=user_agent, ip=ip)],
+                                    ignore_conflicts=True)
+    LoginEvent.objects.create(user=user, fingerprint=fingerprint, user_agent=user_agent, ip=ip)
+    return True
+
+
+def build_notification(user, events) -> OutboxMessage:
+    first_events = {}
+    for event in events:
+        first_events.setdefault(event.fingerprint, event)
+    devices = [f'{timezone.localtime(event.created_at):%d.%m.%Y %H:%M} - '
+               f'{event.user_agent or "неизвестное устройство"}, IP {event.ip or "неизвестен"}'
+               for event in first_events.values()]
+    context = {
+        'site_url': getattr(settings, 'SITE_URL', ''),
+        'message': f'В ваш аккаунт {user.email} был выполнен вход с нового устройства:\n'
+                   + '\n'.join(devices)
+                   + '\nЕсли Вы не совершали вход, то рекомендуем немедленно '
+    }
+    return build_message(subject='Вход в аккаунт | Платформа Codeby', to=user.email,
+                         html_message=render_to_string('registration/account_access_email.html', context))
+
+
+def flush_login_events(window=None, batch_size: int = LOGIN_FLUSH_BATCH_SIZE) -> int:
+    """
+    Отправляет накопленные уведомления: пользователь попадает в рассылку, когда его самому раннему
+    событию исполнилось окно; все его события на этот момент объединяются в одно письмо.
+    Письма ставятся в очередь outbox пачками по batch_size пользователей
+    """
+    window = get_window() if window is None else window
+    notified = 0
+    while True:
+        now = timezone.now()
+        pending = LoginEvent.objects.filter(notified_at__isnull=True)
+        user_ids = list(pending
+                        .filter(created_at__lte=now - timedelta(seconds=window))
+                        .order_by()
+                        .values_list('user', flat=True)
+                        .distinct()[:batch_size])
+        if not user_ids:
+            return notified
+        with transaction.atomic():
+            events = list(pending
+                          .select_for_update(skip_locked=True, of=('self', ))
+                          .filter(user__in=user_ids)
+                          .select_related('user')
+                          .order_by('user', 'created_at'))
+            if not events:
+                # События уже обрабатывает другой воркер
+                return notified
+            by_user = {}
+            for event in events:
+                by_user.setdefault(event.user_id, []).append(event)
+            OutboxMessage.objects.bulk_create([build_notification(user_events[0].user, user_events)
+                                               for user_events in by_user.values()])
+            LoginEvent.objects.filter(id__in=[event.id for event in events]).update(notified_at=now)
+        notified += len(by_user)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from auth_app.logins import LOGIN_FLUSH_BATCH_SIZE, flush_login_events
+
+
+class Command(BaseCommand):
+    help = 'Ставит в очередь писем уведомления о входах с новых устройств, накопленные за окно LOGIN_NOTIFY_WINDOW'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=int, help='Окно накопления, сек.; по умолчанию LOGIN_NOTIFY_WINDOW')
+        parser.add_argument('--batch-size', type=int, default=LOGIN_FLUSH_BATCH_SIZE,
+                            help='Количество пользователей в одной пачке')
+
+    def handle(self, *args, **options):
+        count = flush_login_events(options['window'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Уведомлений о входе поставлено в очередь: {count}'))
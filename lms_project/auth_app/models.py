@@ -23,4 +23,41 @@ class User(AbstractUser):
 
     def natural_key(self):
         # first_name, last_name
-        return self.get_full_name()
\ No newline at end of file
+        return self.get_full_name()
+
+
+class KnownDevice(models.Model):
+    """
+    Устройство, с которого пользователь уже входил: повторный вход с него не порождает уведомления
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Участник', related_name='known_devices')
+    fingerprint = models.CharField(verbose_name='Отпечаток устройства', max_length=64)
+    user_agent = models.CharField(verbose_name='User-Agent', max_length=255, blank=True)
+    ip = models.GenericIPAddressField(verbose_name='IP-адрес', null=True, blank=True)
+    first_seen = models.DateTimeField(verbose_name='Первый вход', auto_now_add=True)
+    last_seen = models.DateTimeField(verbose_name='Последний вход', auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'Известные устройства'
+        verbose_name = 'Известное устройство'
+        unique_together = ('user', 'fingerprint', )
+
+
+class LoginEvent(models.Model):
+    """
+    Вход с нового устройства, ожидающий уведомления: события копятся в течение окна и отправляются одним письмом
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Участник', related_name='login_events')
+    fingerprint = models.CharField(verbose_name='Отпечаток устройства', max_length=64)
+    user_agent = models.CharField(verbose_name='User-Agent', max_length=255, blank=True)
+    ip = models.GenericIPAddressField(verbose_name='IP-адрес', null=True, blank=True)
+    created_at = models.DateTimeField(verbose_name='Время входа', auto_now_add=True)
+    notified_at = models.DateTimeField(verbose_name='Время уведомления', null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'Входы с новых устройств'
+        verbose_name = 'Вход с нового устройства'
+        ordering = ('created_at', )
+        indexes = (
+            models.Index(fields=('notified_at', 'created_at', ), name='login_event_pending_idx'),
+        )
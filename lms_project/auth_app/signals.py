@@ -1,27 +1,15 @@
 from django.conf import settings
 from django.contrib.auth.models import Group
-from django.core.mail import EmailMessage
 from django.dispatch import Signal, receiver
 from django.db.models.signals import post_save
-from django.template.loader import render_to_string
-from django.utils import timezone
+from .logins import record_login
 
 
 account_access = Signal()
 
-def send_login_user_email(**kwargs):
-    template_name = 'registration/account_access_email.html'
-    request = kwargs['request']
-    context = {
-        'request': request,
-        'message': f'В ваш аккаунт {request.POST["username"]} был выполнен вход {timezone.now().isoformat()}'
-                   f'\nЕсли Вы не совершали вход, то рекомендуем немедленно '
-    }
-    email = EmailMessage(subject='Вход в аккаунт | Платформа Codeby',
-                         body=render_to_string(template_name,context),
-                         to=[request.POST['username']])
-    email.content_subtype = 'html'
-    email.send(fail_silently=True)
+def buffer_login_event(**kwargs):
+    # Письмо не отправляется сразу: вход с нового устройства копится и уходит через flush_login_events
+    record_login(kwargs['user'], kwargs['request'])
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
@@ -32,4 +20,4 @@ def grant_pupil_rights(sender, instance, created=True, **kwargs):
         print(f'Пользователь {instance} успешно добавлен в группу "Ученик"')
 
 
-account_access.connect(send_login_user_email)
\ No newline at end of file
+account_access.connect(buffer_login_event)
\ No newline at end of file
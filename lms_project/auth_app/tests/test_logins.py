@@ -0,0 +1,45 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.shortcuts import reverse
+from django.test import TestCase
+from auth_app.logins import flush_login_events
+from auth_app.models import KnownDevice, LoginEvent
+from outbox.models import OutboxMessage
+
+
+class LoginNotificationTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='student', email='student@example.com',
+                                                         password='student1234')
+        self.data = {'username': 'student@example.com', 'password': 'student1234'}
+
+    def login(self, user_agent='Firefox', ip='10.0.0.1'):
+        self.client.post(reverse('login'), self.data, HTTP_USER_AGENT=user_agent, REMOTE_ADDR=ip)
+        self.client.logout()
+
+    def test_repeated_logins_are_deduplicated(self):
+        for _ in range(5):
+            self.login()
+        # Адрес из той же подсети - то же устройство
+        self.login(ip='10.0.0.2')
+        self.assertEqual(KnownDevice.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(LoginEvent.objects.count(), 1)
+        self.assertEqual(OutboxMessage.objects.count(), 0)
+
+    def test_new_devices_coalesced_into_one_email(self):
+        self.login()
+        self.login(user_agent='Chrome', ip='192.168.1.5')
+        self.assertEqual(flush_login_events(), 0)
+
+        self.assertEqual(flush_login_events(window=0), 1)
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.to, ['student@example.com'])
+        self.assertIn('Chrome', message.html_body)
+        self.assertIn('Firefox', message.html_body)
+        self.assertFalse(LoginEvent.objects.filter(notified_at__isnull=True).exists())
+
+        cache.clear()
+        self.login()
+        self.assertEqual(LoginEvent.objects.count(), 2)
@@ -24,8 +24,8 @@ class UserLoginView(LoginView):
         elif is_remember == 'off':
             self.request.session.set_expiry(0)
 
-        # отправка email  с сообщением о входе в аккаунт
-        account_access.send(sender=self.__class__, request=self.request)
+        # уведомление о входе с нового устройства
+        account_access.send(sender=self.__class__, request=self.request, user=form.get_user())
 
         return super(UserLoginView, self).form_valid(form)
 
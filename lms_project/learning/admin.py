@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Course, Lesson, Tracking, Review
+from .models import Course, Lesson, Tracking, Review, Favourite
 
 
 @admin.register(Course)
@@ -36,4 +36,11 @@ class TrackingAdmin(admin.ModelAdmin):
 class ReviewAdmin(admin.ModelAdmin):
     list_display = ('user', 'content')
     search_fields = ('content', )
-    list_per_page = 100
\ No newline at end of file
+    list_per_page = 100
+
+
+@admin.register(Favourite)
+class FavouriteAdmin(admin.ModelAdmin):
+    list_display = ('user', 'course', 'added_at')
+    search_fields = ('course__title', 'user__email')
+    list_per_page = 5
@@ -0,0 +1,97 @@
+import time
+from django.core.cache import cache
+from django.db import transaction
+
+
+CATALOG_VERSION_KEY = 'catalog_version'
+
+
+def course_version_key(course_id) -> str:
+    return f'course_{course_id}_version'
+
+
+def new_version() -> int:
+    # Версия - время изменения в микросекундах: после вытеснения ключа из кэша версии не повторяются
+    return time.time_ns() // 1000
+
+
+def get_versions(keys) -> dict:
+    """
+    Текущие значения счетчиков версий {ключ: версия}; отсутствующие счетчики создаются
+    """
+    versions = cache.get_many(keys)
+    missing = {key: new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return versions
+
+
+def bump_versions(keys):
+    """
+    Увеличивает счетчики версий сразу и еще раз после фиксации транзакции,
+    чтобы данные, прочитанные до COMMIT, не закэшировались под новой версией
+    """
+    keys = set(keys)
+
+    def bump():
+        for key in keys:
+            try:
+                version = cache.incr(key)
+            except ValueError:
+                version = None
+            # Атомарный incr гарантирует смену версии, а подтягивание к текущему времени - ее монотонность
+            if version is None or version < new_version():
+                cache.set(key, new_version(), timeout=None)
+
+    if keys:
+        bump()
+        transaction.on_commit(bump)
+
+
+def get_course_versions(course_ids) -> dict:
+    keys = {course_version_key(course_id): course_id for course_id in course_ids}
+    versions = get_versions(keys)
+    return {course_id: versions[key] for key, course_id in keys.items()}
+
+
+def bump_course_versions(course_ids):
+    bump_versions(course_version_key(course_id) for course_id in course_ids)
+
+
+def get_catalog_version() -> int:
+    return get_versions([CATALOG_VERSION_KEY])[CATALOG_VERSION_KEY]
+
+
+def bump_catalog_version():
+    bump_versions([CATALOG_VERSION_KEY])
+
+
+def scope_version_key(name: str, scope) -> str:
+    return f'{name}_{scope}_version'
+
+
+def get_scope_version(name: str, scope) -> int:
+    key = scope_version_key(name, scope)
+    return get_versions([key])[key]
+
+
+def bump_scope_versions(name: str, scopes):
+    bump_versions(scope_version_key(name, scope) for scope in scopes)
+
+
+def model_version_key(model) -> str:
+    return f'model_{model._meta.label_lower}_version'
+
+
+def get_model_versions(models) -> list:
+    """
+    Версии моделей в порядке передачи: по ним строятся ключи кэша ответов API
+    """
+    keys = [model_version_key(model) for model in models]
+    versions = get_versions(keys)
+    return [versions[key] for key in keys]
+
+
+def bump_model_versions(models):
+    bump_versions(model_version_key(model) for model in models)
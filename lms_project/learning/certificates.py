@@ -0,0 +1,160 @@
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+from django.conf import settings
+from PIL import Image, ImageDraw, ImageFont
+from .models import Enrollment
+
+
+# Версия оформления: входит в ключ кэша, при изменении макета сертификаты перерисовываются
+CERTIFICATE_LAYOUT_VERSION = 1
+CERTIFICATE_CHUNK_SIZE = 200
+
+# Поля размечены под media/certificates/certificate.png (1200x1200)
+PAPER_COLOR = (222, 222, 222)
+RIBBON_COLOR = (0, 0, 0)
+TEXT_COLOR = (0, 0, 0)
+
+
+class CertificateData(NamedTuple):
+    user_id: int
+    course_id: int
+    full_name: str
+    course_title: str
+    completed_on: str
+
+
+def get_template_path() -> Path:
+    return Path(getattr(settings, 'CERTIFICATE_TEMPLATE', settings.MEDIA_ROOT / 'certificates/certificate.png'))
+
+
+def get_output_dir() -> Path:
+    return Path(getattr(settings, 'CERTIFICATE_ROOT', settings.MEDIA_ROOT / 'certificates/issued'))
+
+
+def certificate_key(data: CertificateData) -> str:
+    """
+    Ключ содержимого: данные сертификата, версия макета и состояние файла-шаблона
+    """
+    template = get_template_path().stat()
+    content = '|'.join(map(str, (*data, CERTIFICATE_LAYOUT_VERSION, template.st_size, template.st_mtime_ns)))
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def certificate_path(data: CertificateData) -> Path:
+    key = certificate_key(data)
+    return get_output_dir() / key[:2] / f'{key}.png'
+
+
+def load_font(size: int, bold: bool = False):
+    name = getattr(settings, 'CERTIFICATE_BOLD_FONT' if bold else 'CERTIFICATE_FONT',
+                   'DejaVuSans-Bold.ttf' if bold else 'DejaVuSans.ttf')
+    try:
+        return ImageFont.truetype(name, size)
+    except OSError:
+        return ImageFont.load_default(size)
+
+
+def draw_field(draw, text: str, box: tuple, size: int, fill: tuple, background: tuple, bold: bool = False):
+    """
+    Закрашивает заглушку шаблона в области box и пишет текст по центру, уменьшая шрифт, пока текст не влезет
+    """
+    left, top, right, bottom = box
+    draw.rectangle(box, fill=background)
+    while True:
+        font = load_font(size, bold)
+        text_left, text_top, text_right, text_bottom = draw.textbbox((0, 0), text, font=font)
+        if text_right - text_left <= right - left or size <= 10:
+            break
+        size -= 2
+    x = left + (right - left - (text_right - text_left)) / 2 - text_left
+    y = top + (bottom - top - (text_bottom - text_top)) / 2 - text_top
+    draw.text((x, y), text, font=font, fill=fill)
+
+
+def render_certificate(data: CertificateData, template_path: str, output_path: str) -> str:
+    """
+    Рисует сертификат поверх шаблона. Может выполняться в дочернем процессе: работает только с файлами,
+    без обращений к базе. Файл записывается атомарно через переименование
+    """
+    image = Image.open(template_path).convert('RGB')
+    draw = ImageDraw.Draw(image)
+    for text, box, size, fill, background, bold in (
+            (data.full_name, (240, 515, 960, 610), 64, TEXT_COLOR, PAPER_COLOR, True),
+            ('успешно завершил(а) курс', (230, 622, 970, 668), 26, TEXT_COLOR, PAPER_COLOR, False),
+            (data.course_title, (360, 700, 840, 770), 48, PAPER_COLOR, RIBBON_COLOR, True),
+            (data.completed_on, (105, 905, 330, 955), 26, TEXT_COLOR, PAPER_COLOR, False),
+            ('Платформа Codeby', (865, 905, 1095, 955), 26, TEXT_COLOR, PAPER_COLOR, False)):
+        draw_field(draw, text, box, size, fill, background, bold)
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = output_path.with_suffix(f'.{os.getpid()}.tmp')
+    image.save(temp_path, format='PNG', optimize=True)
+    os.replace(temp_path, output_path)
+    return str(output_path)
+
+
+def certificate_data(enrollments) -> list:
+    """
+    Данные для сертификатов завершенных записей на курс одним запросом
+    """
+    rows = enrollments\
+        .filter(completed_at__isnull=False)\
+        .values_list('user', 'course', 'user__first_name', 'user__last_name', 'course__title', 'completed_at')
+    return [CertificateData(user_id, course_id, f'{first_name} {last_name}'.strip(), title,
+                            completed_at.strftime('%d.%m.%Y'))
+            for user_id, course_id, first_name, last_name, title, completed_at in rows]
+
+
+def render_many(items, pool=None) -> int:
+    """
+    Рисует недостающие сертификаты; уже готовые файлы не трогаются. Без пула рисует в текущем потоке
+    """
+    template_path = str(get_template_path())
+    missing = [(data, certificate_path(data)) for data in items]
+    missing = [(data, path) for data, path in missing if not path.exists()]
+    if not missing:
+        return 0
+    if pool is None:
+        for data, path in missing:
+            render_certificate(data, template_path, str(path))
+    else:
+        futures = [pool.submit(render_certificate, data, template_path, str(path)) for data, path in missing]
+        for future in futures:
+            future.result()
+    return len(missing)
+
+
+def get_certificate(user_id, course_id):
+    """
+    Путь к сертификату ученика по курсу; повторный запрос отдает файл из кэша на диске.
+    None, если курс не завершен. Один сертификат рисуется в вызывающем потоке: пул процессов
+    из многопоточного веб-процесса не создается, fork копирует блокировки чужих потоков
+    """
+    items = certificate_data(Enrollment.objects.filter(user=user_id, course=course_id))
+    if not items:
+        return None
+    render_many(items)
+    return certificate_path(items[0])
+
+
+def prerender_certificates(course_ids=None, workers=None, chunk_size: int = CERTIFICATE_CHUNK_SIZE) -> int:
+    """
+    Массовая отрисовка сертификатов всех завершивших курсы: записи перебираются пачками по ключу.
+    Пул процессов создается только здесь - в однопоточной management-команде
+    """
+    enrollments = Enrollment.objects.filter(completed_at__isnull=False).order_by('id')
+    if course_ids:
+        enrollments = enrollments.filter(course__in=course_ids)
+    rendered, last_id = 0, 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            chunk = enrollments.filter(id__gt=last_id)[:chunk_size]
+            ids = list(chunk.values_list('id', flat=True))
+            if not ids:
+                return rendered
+            rendered += render_many(certificate_data(Enrollment.objects.filter(id__in=ids)), pool)
+            last_id = ids[-1]
@@ -0,0 +1,21 @@
+from hashlib import md5
+from django.views.decorators.http import condition
+
+
+def make_etag(*parts) -> str:
+    return md5('|'.join(map(str, parts)).encode()).hexdigest()
+
+
+class ConditionalGetMixin(object):
+    """
+    Условный GET (If-None-Match -> 304): ETag вычисляется по счетчикам версий из кэша
+    до выполнения запросов страницы. Last-Modified не отдается: у него точность в секунду,
+    и запись в ту же секунду, что и прошлый ответ, дала бы клиенту устаревший 304
+    """
+
+    def get_etag(self, request, *args, **kwargs):
+        return None
+
+    def dispatch(self, request, *args, **kwargs):
+        dispatch = condition(etag_func=self.get_etag)(super(ConditionalGetMixin, self).dispatch)
+        return dispatch(request, *args, **kwargs)
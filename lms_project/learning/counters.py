@@ -0,0 +1,125 @@
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from .cache import bump_course_versions
+from .models import Course, CourseViews
+
+
+VIEWS_BUFFER_KEY = 'course_views_buffer'
+VIEWS_FLUSH_LOCK_KEY = 'course_views_flush_lock'
+
+
+class LocalViewsBuffer(object):
+    """
+    Буфер просмотров в памяти процесса (для кэшей без Redis: locmem, dummy и т.п.)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def incr(self, course_id: int, amount: int = 1):
+        with self._lock:
+            self._counts[course_id] = self._counts.get(course_id, 0) + amount
+
+    def pending(self) -> dict:
+        with self._lock:
+            return dict(self._counts)
+
+    def drain(self) -> dict:
+        with self._lock:
+            counts, self._counts = self._counts, {}
+        return counts
+
+
+class RedisViewsBuffer(object):
+    """
+    Буфер просмотров в хэше Redis: HINCRBY на каждый просмотр, HGETALL + DEL в одной транзакции при сбросе
+    """
+
+    def __init__(self, redis_cache: RedisCache):
+        self.cache = redis_cache
+        self.key = redis_cache.make_key(VIEWS_BUFFER_KEY)
+
+    def get_client(self):
+        return self.cache._cache.get_client(self.key, write=True)
+
+    def incr(self, course_id: int, amount: int = 1):
+        self.get_client().hincrby(self.key, course_id, amount)
+
+    def pending(self) -> dict:
+        return {int(course_id): int(count) for course_id, count in self.get_client().hgetall(self.key).items()}
+
+    def drain(self) -> dict:
+        pipeline = self.get_client().pipeline(transaction=True)
+        pipeline.hgetall(self.key)
+        pipeline.delete(self.key)
+        counts, _ = pipeline.execute()
+        return {int(course_id): int(count) for course_id, count in counts.items()}
+
+
+class CourseViewsCounter(object):
+    """
+    Глобальный счетчик просмотров курсов.
+    Просмотры копятся в буфере и пачками переносятся в таблицу CourseViews
+    """
+
+    def __init__(self, buffer=None):
+        self._buffer = buffer
+        self.flush_interval = getattr(settings, 'COURSE_VIEWS_FLUSH_INTERVAL', 60)
+        self._last_flush = time.monotonic()
+
+    @property
+    def buffer(self):
+        if self._buffer is None:
+            default_cache = caches['default']
+            self._buffer = RedisViewsBuffer(default_cache) if isinstance(default_cache, RedisCache) \
+                else LocalViewsBuffer()
+        return self._buffer
+
+    def incr(self, course_id):
+        self.buffer.incr(int(course_id))
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self._last_flush = time.monotonic()
+            # Сбрасывает буфер только один процесс за интервал
+            if cache.add(VIEWS_FLUSH_LOCK_KEY, 1, timeout=self.flush_interval):
+                self.flush()
+
+    def flush(self) -> int:
+        counts = self.buffer.drain()
+        if not counts:
+            return 0
+        try:
+            with transaction.atomic():
+                course_ids = set(Course.objects.filter(id__in=counts).values_list('id', flat=True))
+                if not course_ids:
+                    return 0
+                CourseViews.objects.bulk_create([CourseViews(course_id=course_id) for course_id in course_ids],
+                                                ignore_conflicts=True)
+                CourseViews.objects.filter(course_id__in=course_ids).update(total=F('total') + Case(
+                    *[When(course_id=course_id, then=Value(counts[course_id])) for course_id in course_ids],
+                    default=Value(0),
+                ))
+                bump_course_versions(course_ids)
+        except Exception:
+            # Не теряем просмотры: возвращаем их в буфер до следующего сброса
+            for course_id, count in counts.items():
+                self.buffer.incr(course_id, count)
+            raise
+        return len(course_ids)
+
+    def get_totals(self, course_ids=None) -> dict:
+        queryset = CourseViews.objects.all()
+        if course_ids is not None:
+            queryset = queryset.filter(course_id__in=course_ids)
+        totals = dict(queryset.values_list('course_id', 'total'))
+        for course_id, count in self.buffer.pending().items():
+            totals[course_id] = totals.get(course_id, 0) + count
+        return totals
+
+
+course_views = CourseViewsCounter()
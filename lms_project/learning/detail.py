@@ -0,0 +1,73 @@
+from typing import NamedTuple
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from .cache import new_version
+from .models import Course, Lesson, Review
+
+
+DETAIL_CACHE_TIMEOUT = 60 * 60 * 24
+DETAIL_REVIEWS_PAGE_SIZE = 10
+
+
+class CourseDetail(NamedTuple):
+    course: Course
+    authors: list
+    lessons: list
+    reviews: list
+    count_reviews: int
+    # Момент сборки: служит валидатором условного GET, так как данные пересобираются при каждом изменении
+    built_at: int
+
+
+def course_detail_key(course_id) -> str:
+    return f'course_{course_id}_detail'
+
+
+def build_course_detail(course_id):
+    """
+    Собирает данные страницы курса за четыре запроса: курс с числом отзывов, авторы, уроки
+    и первая страница отзывов вместе с их авторами
+    """
+    course = Course.objects.filter(id=course_id).annotate(reviews_count=Count('review')).first()
+    if course is None:
+        return None
+    authors = list(course.authors.only('first_name', 'last_name').order_by('last_name', 'first_name'))
+    lessons = list(Lesson.objects.filter(course=course_id).order_by('id'))
+    for lesson in lessons:
+        # Курс урока уже загружен: шаблон и __str__ урока не делают дополнительных запросов
+        lesson.course = course
+    reviews = list(Review.objects
+                   .filter(course=course_id)
+                   .select_related('user')
+                   .only('content', 'sent_date', 'course', 'user__first_name', 'user__last_name', 'user__avatar')
+                   [:DETAIL_REVIEWS_PAGE_SIZE])
+    return CourseDetail(course=course, authors=authors, lessons=lessons, reviews=reviews,
+                        count_reviews=course.reviews_count, built_at=new_version())
+
+
+def get_course_detail(course_id):
+    """
+    Страница курса - одно чтение из кэша; при промахе данные собираются заново и сохраняются целиком
+    """
+    key = course_detail_key(course_id)
+    detail = cache.get(key)
+    if detail is None:
+        detail = build_course_detail(course_id)
+        if detail is not None:
+            cache.set(key, detail, timeout=DETAIL_CACHE_TIMEOUT)
+    return detail
+
+
+def invalidate_course_details(course_ids):
+    """
+    Удаляет закэшированные страницы курсов сразу и еще раз после фиксации транзакции
+    """
+    keys = [course_detail_key(course_id) for course_id in set(course_ids)]
+
+    def delete():
+        cache.delete_many(keys)
+
+    if keys:
+        delete()
+        transaction.on_commit(delete)
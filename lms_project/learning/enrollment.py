@@ -0,0 +1,190 @@
+from collections import Counter
+from typing import NamedTuple
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, Exists, Max, OuterRef
+from .cache import bump_model_versions
+from .models import Course, Enrollment, Lesson, Tracking
+from .stats import rebuild_stats
+
+
+ENROLL_CHUNK_SIZE = 500
+
+ENROLLED = 'enrolled'
+ALREADY_ENROLLED = 'already_enrolled'
+COMPLETED = 'completed'  # ученик был записан раньше, добавлены только новые уроки
+NOT_FOUND = 'not_found'
+
+
+class EnrollmentError(Exception):
+    # Запись невозможна для курса целиком: курса нет или в нем нет уроков
+    pass
+
+
+class EnrollmentResult(NamedTuple):
+    user: object
+    status: str
+    created: int = 0
+
+
+def users_by_email(emails) -> dict:
+    return dict(get_user_model().objects.filter(email__in=set(emails)).values_list('email', 'id'))
+
+
+def enroll_chunk(lesson_ids: list, user_ids: list) -> list:
+    """
+    Записывает пачку учеников; вызывается внутри транзакции. Строки учеников блокируются
+    до чтения существующих записей, поэтому одновременные запросы записывают одного ученика по очереди.
+    Статус строится по числу строк, которые действительно появились после вставки
+    """
+    found = set(get_user_model().objects
+                .select_for_update()
+                .filter(id__in=user_ids)
+                .order_by('id')
+                .values_list('id', flat=True))
+    existing = set(Tracking.objects
+                   .filter(user__in=found, lesson__in=lesson_ids)
+                   .values_list('user', 'lesson'))
+    records = [Tracking(user_id=user_id, lesson_id=lesson_id, passed=False)
+               for user_id in user_ids if user_id in found
+               for lesson_id in lesson_ids if (user_id, lesson_id) not in existing]
+    Tracking.objects.bulk_create(records, batch_size=1000, ignore_conflicts=True)
+
+    before = Counter(user_id for user_id, _ in existing)
+    after = Counter(Tracking.objects
+                    .filter(user__in={record.user_id for record in records}, lesson__in=lesson_ids)
+                    .values_list('user', flat=True)) if records else Counter()
+    results = []
+    for user_id in user_ids:
+        created = after[user_id] - before[user_id]
+        if user_id not in found:
+            results.append(EnrollmentResult(user_id, NOT_FOUND))
+        elif created <= 0:
+            results.append(EnrollmentResult(user_id, ALREADY_ENROLLED))
+        else:
+            results.append(EnrollmentResult(user_id, COMPLETED if before[user_id] else ENROLLED, created))
+    return results
+
+
+def enroll_users(course_id, user_ids, chunk_size: int = ENROLL_CHUNK_SIZE) -> list:
+    """
+    Идемпотентная запись учеников на курс: пачки по chunk_size, одна транзакция на пачку,
+    результат по каждому ученику в порядке передачи. EnrollmentError, если курса нет или в нем нет уроков
+    """
+    lesson_ids = list(Lesson.objects.filter(course=course_id).values_list('id', flat=True))
+    if not lesson_ids:
+        if not Course.objects.filter(id=course_id).exists():
+            raise EnrollmentError(f'Курс {course_id} не найден')
+        raise EnrollmentError('В курсе пока нет уроков')
+    user_ids = list(dict.fromkeys(user_ids))
+    results = []
+    for start in range(0, len(user_ids), chunk_size):
+        with transaction.atomic():
+            results.extend(enroll_chunk(lesson_ids, user_ids[start:start + chunk_size]))
+    return results
+
+
+def backfill_lesson(lesson_id, chunk_size: int = ENROLL_CHUNK_SIZE) -> int:
+    """
+    Добавляет записи Tracking по новому уроку всем записанным на курс ученикам.
+    Ученики перебираются по первичному ключу Enrollment пачками, каждая пачка - своя транзакция
+    """
+    course_id = Lesson.objects.filter(id=lesson_id).values_list('course', flat=True).first()
+    if course_id is None:
+        return 0
+    enrollments = Enrollment.objects.filter(course=course_id).order_by('id').values_list('id', 'user')
+    last_id, created = 0, 0
+    while True:
+        chunk = list(enrollments.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return created
+        with transaction.atomic():
+            results = enroll_chunk([lesson_id], [user_id for _, user_id in chunk])
+        created += sum(result.created for result in results)
+        last_id = chunk[-1][0]
+
+
+def find_gaps(course_id) -> list:
+    """
+    Ученики курса, у которых записей Tracking меньше, чем уроков: один сгруппированный запрос
+    """
+    count_lessons = Lesson.objects.filter(course=course_id).count()
+    return list(Tracking.objects
+                .order_by()
+                .filter(lesson__course=course_id)
+                .values('user')
+                .annotate(count_lessons=Count('id'))
+                .filter(count_lessons__lt=count_lessons)
+                .values_list('user', flat=True))
+
+
+def repair_gaps(course_id, user_ids=None, chunk_size: int = ENROLL_CHUNK_SIZE) -> int:
+    """
+    Дописывает недостающие записи Tracking ученикам курса, возвращает количество добавленных записей
+    """
+    user_ids = find_gaps(course_id) if user_ids is None else user_ids
+    if not user_ids:
+        return 0
+    return sum(result.created for result in enroll_users(course_id, user_ids, chunk_size))
+
+
+@transaction.atomic
+def renumber_lessons(course_ids=None) -> int:
+    """
+    Проставляет урокам последовательные номера внутри курса (по текущему номеру и id)
+    """
+    lessons = Lesson.objects.order_by('course', 'position', 'id').only('course', 'position')
+    if course_ids is not None:
+        lessons = lessons.filter(course__in=course_ids)
+    changed, course_id, position = [], None, 0
+    for lesson in lessons.iterator():
+        if lesson.course_id != course_id:
+            course_id, position = lesson.course_id, 0
+        if lesson.position != position:
+            lesson.position = position
+            changed.append(lesson)
+        position += 1
+    if changed:
+        # Номера уникальны в курсе: сначала уводим измененные уроки за текущий максимум, затем
+        # ставим итоговые, чтобы промежуточные строки не совпали с номером соседнего урока
+        offset = Lesson.objects.aggregate(last=Max('position'))['last'] + 1
+        final = [lesson.position for lesson in changed]
+        for lesson in changed:
+            lesson.position += offset
+        Lesson.objects.bulk_update(changed, fields=('position', ), batch_size=1000)
+        for lesson, position in zip(changed, final):
+            lesson.position = position
+        Lesson.objects.bulk_update(changed, fields=('position', ), batch_size=1000)
+        bump_model_versions([Lesson])
+    return len(changed)
+
+
+@transaction.atomic
+def dedupe_trackings(batch_size: int = 1000) -> int:
+    """
+    Удаляет повторные записи Tracking одной пары (ученик, урок), оставшиеся от записи на курс
+    без уникального ограничения: остается пройденная запись, при равенстве - с меньшим id.
+    Выполняется до добавления ограничения unique_tracking_user_lesson
+    """
+    others = Tracking.objects.filter(user=OuterRef('user'), lesson=OuterRef('lesson')).exclude(id=OuterRef('id'))
+    rows = Tracking.objects\
+        .filter(Exists(others))\
+        .order_by('user', 'lesson', '-passed', 'id')\
+        .values_list('id', 'user', 'lesson')
+    removed, kept = [], None
+    for tracking_id, user_id, lesson_id in rows.iterator():
+        if (user_id, lesson_id) == kept:
+            removed.append(tracking_id)
+        kept = (user_id, lesson_id)
+    for start in range(0, len(removed), batch_size):
+        Tracking.objects.filter(id__in=removed[start:start + batch_size]).delete()
+    return len(removed)
+
+
+@transaction.atomic
+def migrate_enrollments() -> tuple:
+    """
+    Перенос прогресса из Tracking в Enrollment: удаление повторных записей, нумерация уроков
+    и пересборка битовых масок
+    """
+    return dedupe_trackings(), renumber_lessons(), rebuild_stats()
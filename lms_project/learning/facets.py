@@ -0,0 +1,110 @@
+from datetime import date, timedelta
+from hashlib import md5
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.utils.http import urlencode
+from .cache import get_catalog_version
+
+
+FACETS_CACHE_TIMEOUT = 60 * 15
+
+# Параметр фильтра -> условие на поле курса
+FILTER_LOOKUPS = {
+    'price_min': 'price__gte',
+    'price_max': 'price__lte',
+    'start_from': 'start_date__gte',
+    'start_to': 'start_date__lte',
+    'duration_min': 'duration__gte',
+    'duration_max': 'duration__lte',
+}
+FILTER_FIELDS = tuple(FILTER_LOOKUPS) + ('free_only', )
+# Параметры фильтра, которые заменяются при выборе значения фасета
+FACET_FIELDS = {
+    'price': ('price_min', 'price_max', 'free_only', ),
+    'start_date': ('start_from', 'start_to', ),
+    'duration': ('duration_min', 'duration_max', ),
+}
+FACET_LABELS = {
+    'price': 'Цена',
+    'start_date': 'Старт курса',
+    'duration': 'Продолжительность',
+}
+
+
+def filter_conditions(filters: dict) -> Q:
+    conditions = Q(**{FILTER_LOOKUPS[name]: value for name, value in filters.items()
+                      if name in FILTER_LOOKUPS and value is not None})
+    if filters.get('free_only'):
+        conditions &= Q(price=0)
+    return conditions
+
+
+def filter_courses(queryset, filters: dict):
+    return queryset.filter(filter_conditions(filters))
+
+
+def get_facets(today: date) -> dict:
+    """
+    Значения фасетов: каждое задается набором параметров фильтра, поэтому по нему
+    и считается количество курсов, и строится ссылка для выбора значения
+    """
+    return {
+        'price': (
+            ('free', 'Бесплатные', {'free_only': True}),
+            ('up_to_5000', 'До 5 000 ₽', {'price_min': 1, 'price_max': 5000}),
+            ('up_to_10000', 'От 5 000 до 10 000 ₽', {'price_min': 5001, 'price_max': 10000}),
+            ('over_10000', 'Дороже 10 000 ₽', {'price_min': 10001}),
+        ),
+        'start_date': (
+            ('started', 'Уже начались', {'start_to': today}),
+            ('next_month', 'Старт в ближайший месяц', {'start_from': today + timedelta(days=1),
+                                                       'start_to': today + timedelta(days=30)}),
+            ('later', 'Старт позже', {'start_from': today + timedelta(days=31)}),
+        ),
+        'duration': (
+            ('short', 'До 2 месяцев', {'duration_max': 2}),
+            ('medium', 'От 3 до 6 месяцев', {'duration_min': 3, 'duration_max': 6}),
+            ('long', 'Больше 6 месяцев', {'duration_min': 7}),
+        ),
+    }
+
+
+def facet_counts(queryset, filters: dict = None, today: date = None) -> dict:
+    """
+    Количество курсов по всем значениям фасетов одним запросом с условной агрегацией.
+    queryset - выборка без фильтров фасетов: значения фасета считаются с фильтрами остальных фасетов,
+    но без его собственных, иначе после выбора значения остальные значения фасета показывали бы 0
+    """
+    filters = filters or {}
+    facets = get_facets(today or timezone.localdate())
+    aggregates = {}
+    for facet, values in facets.items():
+        other_filters = filter_conditions({name: value for name, value in filters.items()
+                                           if name not in FACET_FIELDS[facet]})
+        for key, label, params in values:
+            aggregates[f'{facet}__{key}'] = Count('pk', filter=other_filters & filter_conditions(params))
+    counts = queryset.order_by().aggregate(total=Count('pk', filter=filter_conditions(filters)), **aggregates)
+    result = {'total': counts['total']}
+    for facet, values in facets.items():
+        result[facet] = [{'key': key, 'label': label, 'count': counts[f'{facet}__{key}'],
+                          'params': {name: value.isoformat() if isinstance(value, date) else value
+                                     for name, value in params.items()}}
+                         for key, label, params in values]
+    return result
+
+
+def get_facet_counts(queryset, params: dict) -> dict:
+    """
+    Сводка фасетов кэшируется по версии каталога, текущей дате и параметрам выборки.
+    Фильтры фасетов берутся из params, queryset передается без них
+    """
+    today = timezone.localdate()
+    query = urlencode(sorted((name, str(value)) for name, value in params.items()))
+    key = f'facets_{get_catalog_version()}_{today.isoformat()}_{md5(query.encode()).hexdigest()}'
+    counts = cache.get(key)
+    if counts is None:
+        filters = {name: value for name, value in params.items() if name in FILTER_FIELDS}
+        counts = facet_counts(queryset, filters, today)
+        cache.set(key, counts, timeout=FACETS_CACHE_TIMEOUT)
+    return counts
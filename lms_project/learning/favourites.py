@@ -0,0 +1,46 @@
+from django.core.cache import cache
+from django.db import transaction
+from .models import Favourite
+
+
+FAVOURITES_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def favourites_key(user_id) -> str:
+    return f'favourites_{user_id}'
+
+
+def get_favourite_ids(user_id) -> frozenset:
+    """
+    Множество id избранных курсов пользователя: из кэша или одним запросом к таблице Favourite
+    """
+    key = favourites_key(user_id)
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(Favourite.objects.filter(user=user_id).values_list('course', flat=True))
+        cache.set(key, ids, timeout=FAVOURITES_CACHE_TIMEOUT)
+    return ids
+
+
+def filter_favourites(user_id, course_ids) -> set:
+    """
+    Пакетная проверка принадлежности: какие из курсов страницы находятся в избранном
+    """
+    return get_favourite_ids(user_id).intersection(course_ids)
+
+
+def invalidate_favourites(user_id):
+    key = favourites_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def add_favourites(user_id, course_ids):
+    Favourite.objects.bulk_create([Favourite(user_id=user_id, course_id=course_id) for course_id in set(course_ids)],
+                                  ignore_conflicts=True)
+    invalidate_favourites(user_id)
+
+
+def remove_favourites(user_id, course_ids):
+    Favourite.objects.filter(user=user_id, course__in=course_ids).delete()
+    invalidate_favourites(user_id)
@@ -1,6 +1,7 @@
 from .models import Course, Review, Lesson
+from .facets import FILTER_FIELDS
 from django import forms
-from django.forms.widgets import Textarea, TextInput
+from django.forms.widgets import Textarea, TextInput, DateInput
 from django.forms.utils import ValidationError
 
 
@@ -56,5 +57,37 @@ class OrderByAndSearchForm(forms.Form):
     price_order = forms.ChoiceField(label='', choices=PRICE_CHOICES, initial=PRICE_CHOICES[0])
 
 
+class CourseFilterForm(OrderByAndSearchForm):
+    price_min = forms.IntegerField(label='Цена от', min_value=0, required=False)
+    price_max = forms.IntegerField(label='Цена до', min_value=0, required=False)
+    free_only = forms.BooleanField(label='Только бесплатные', required=False)
+    start_from = forms.DateField(label='Старт с', required=False, widget=DateInput(attrs={'type': 'date'}))
+    start_to = forms.DateField(label='Старт по', required=False, widget=DateInput(attrs={'type': 'date'}))
+    duration_min = forms.IntegerField(label='Продолжительность от', min_value=0, required=False)
+    duration_max = forms.IntegerField(label='Продолжительность до', min_value=0, required=False)
+
+    def __init__(self, *args, **kwargs):
+        super(CourseFilterForm, self).__init__(*args, **kwargs)
+        self.fields['price_order'].required = False
+
+    def clean(self):
+        cleaned_data = super(CourseFilterForm, self).clean()
+        for field_from, field_to in (('price_min', 'price_max'),
+                                     ('start_from', 'start_to'),
+                                     ('duration_min', 'duration_max')):
+            value_from, value_to = cleaned_data.get(field_from), cleaned_data.get(field_to)
+            if value_from is not None and value_to is not None and value_from > value_to:
+                self.add_error(field_to, 'Верхняя граница меньше нижней')
+        return cleaned_data
+
+    def get_filters(self) -> dict:
+        """
+        Корректно заполненные параметры фильтрации; ошибочные поля игнорируются
+        """
+        self.is_valid()
+        return {name: self.cleaned_data[name] for name in FILTER_FIELDS
+                if self.cleaned_data.get(name) not in (None, False)}
+
+
 class SettingsForm(forms.Form):
     paginate_by = forms.IntegerField(label='Записей на одной странице', min_value=2, max_value=20, initial=5)
\ No newline at end of file
@@ -0,0 +1,150 @@
+from functools import reduce
+from operator import or_
+from typing import NamedTuple
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from .models import Course, Tracking
+
+
+GRADE_CHUNK_SIZE = 1000
+GRADE_MAX_ROWS = 20000
+
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+DUPLICATE = 'duplicate'  # та же запись встречается ниже, применяется последняя строка
+NOT_FOUND = 'not_found'
+FORBIDDEN = 'forbidden'
+INVALID = 'invalid'
+
+TRUE_VALUES = {'true', '1', 'yes', 'y', 'да', 'on'}
+FALSE_VALUES = {'false', '0', 'no', 'n', 'нет', 'off'}
+
+
+class GradeRow(NamedTuple):
+    row: int
+    tracking: int = None
+    user: int = None
+    lesson: int = None
+    passed: bool = None
+
+
+class GradeResult(NamedTuple):
+    row: int
+    tracking: int
+    status: str
+    error: str = ''
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValueError(f'Ожидается логическое значение, получено «{value}»')
+
+
+def parse_id(value):
+    if value is None or value == '':
+        return None
+    value = int(value)
+    if value < 1:
+        raise ValueError('id должен быть положительным')
+    return value
+
+
+def parse_rows(items) -> tuple:
+    """
+    Разбор строк ведомости: {'id', 'passed'} или {'user', 'lesson', 'passed'}.
+    Возвращает корректные строки и результаты для некорректных
+    """
+    rows, invalid = [], []
+    for number, item in enumerate(items, start=1):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError('Строка должна быть объектом')
+            tracking, user, lesson = parse_id(item.get('id')), parse_id(item.get('user')), parse_id(item.get('lesson'))
+            if tracking is None and (user is None or lesson is None):
+                raise ValueError('Укажите id записи или пару user и lesson')
+            if 'passed' not in item:
+                raise ValueError('Не указано поле passed')
+            rows.append(GradeRow(number, tracking, user, lesson, parse_bool(item['passed'])))
+        except (TypeError, ValueError) as error:
+            invalid.append(GradeResult(number, None, INVALID, str(error)))
+    return rows, invalid
+
+
+def load_trackings(rows, author_id) -> tuple:
+    """
+    Записи Tracking для пачки строк одним запросом вместе с признаком, что курс принадлежит автору
+    """
+    ids = {row.tracking for row in rows if row.tracking}
+    pairs = {(row.user, row.lesson) for row in rows if not row.tracking}
+    # Точные пары (ученик, урок), а не все сочетания учеников и уроков пачки
+    condition = reduce(or_, (Q(user=user, lesson=lesson) for user, lesson in pairs), Q(id__in=ids))
+    owned = Course.authors.through.objects.filter(course=OuterRef('lesson__course'), user=author_id)
+    records = Tracking.objects\
+        .order_by()\
+        .filter(condition)\
+        .annotate(owned=Exists(owned))\
+        .values_list('id', 'user', 'lesson', 'passed', 'owned')
+    by_id, by_pair = {}, {}
+    for record in records:
+        by_id[record[0]] = record
+        by_pair[(record[1], record[2])] = record
+    return by_id, by_pair
+
+
+def resolve_chunk(rows, author_id, targets: dict) -> list:
+    """
+    Находит записи для пачки строк. Строки курсов автора попадают в targets (id записи -> строка, запись);
+    если запись уже встречалась в ведомости, раньше стоящая строка получает статус duplicate
+    """
+    by_id, by_pair = load_trackings(rows, author_id)
+    results = []
+    for row in rows:
+        record = by_id.get(row.tracking) if row.tracking else by_pair.get((row.user, row.lesson))
+        if record is None:
+            results.append(GradeResult(row.row, row.tracking, NOT_FOUND))
+        elif not record[4]:
+            results.append(GradeResult(row.row, record[0], FORBIDDEN))
+        else:
+            if record[0] in targets:
+                previous = targets[record[0]][0]
+                results.append(GradeResult(previous.row, record[0], DUPLICATE))
+            targets[record[0]] = (row, record)
+    return results
+
+
+def apply_chunk(targets) -> list:
+    results, changes = [], {True: [], False: []}
+    for tracking_id, (row, record) in targets:
+        if record[3] == row.passed:
+            results.append(GradeResult(row.row, tracking_id, UNCHANGED))
+        else:
+            changes[row.passed].append(tracking_id)
+            results.append(GradeResult(row.row, tracking_id, UPDATED))
+    with transaction.atomic():
+        for passed, tracking_ids in changes.items():
+            if tracking_ids:
+                # Одно UPDATE на значение; менеджер Tracking пересчитывает Enrollment и CourseStats
+                Tracking.objects.filter(id__in=tracking_ids).update(passed=passed)
+    return results
+
+
+def grade(items, author_id, chunk_size: int = GRADE_CHUNK_SIZE) -> list:
+    """
+    Массовая отметка о прохождении уроков автором курса: владение проверяется одним запросом на пачку,
+    изменения применяются пачками. Повторы одной записи ищутся по всей ведомости до применения,
+    действует последняя строка. Результат - по строке на каждую входную строку в исходном порядке
+    """
+    rows, results = parse_rows(items)
+    targets = {}
+    for start in range(0, len(rows), chunk_size):
+        results.extend(resolve_chunk(rows[start:start + chunk_size], author_id, targets))
+    targets = list(targets.items())
+    for start in range(0, len(targets), chunk_size):
+        results.extend(apply_chunk(targets[start:start + chunk_size]))
+    return sorted(results, key=lambda result: result.row)
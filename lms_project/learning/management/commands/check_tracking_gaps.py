@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from learning.enrollment import ENROLL_CHUNK_SIZE, find_gaps, repair_gaps
+from learning.models import Course
+
+
+class Command(BaseCommand):
+    help = 'Находит учеников, у которых нет записей Tracking по части уроков курса, и при --repair дописывает их'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='courses',
+                            help='id курса (можно указать несколько раз); по умолчанию все курсы')
+        parser.add_argument('--repair', action='store_true', help='Дописать недостающие записи')
+        parser.add_argument('--chunk-size', type=int, default=ENROLL_CHUNK_SIZE,
+                            help='Количество учеников в одной транзакции')
+
+    def handle(self, *args, **options):
+        course_ids = Course.objects.order_by('id').values_list('id', flat=True)
+        if options['courses']:
+            course_ids = course_ids.filter(id__in=options['courses'])
+
+        total_gaps = total_created = 0
+        for course_id in course_ids.iterator():
+            user_ids = find_gaps(course_id)
+            if not user_ids:
+                continue
+            total_gaps += len(user_ids)
+            self.stdout.write(f'Курс {course_id}: учеников с пропусками - {len(user_ids)}')
+            if options['repair']:
+                total_created += repair_gaps(course_id, user_ids, options['chunk_size'])
+
+        if not total_gaps:
+            self.stdout.write(self.style.SUCCESS('Пропусков не найдено'))
+        elif options['repair']:
+            self.stdout.write(self.style.SUCCESS(f'Добавлено записей: {total_created}'))
+        else:
+            raise CommandError(f'Найдено учеников с пропусками: {total_gaps}')
@@ -0,0 +1,46 @@
+from collections import Counter
+from django.core.management.base import BaseCommand, CommandError
+from learning.enrollment import ENROLL_CHUNK_SIZE, NOT_FOUND, EnrollmentError, enroll_users, users_by_email
+from learning.models import Course
+
+
+class Command(BaseCommand):
+    help = 'Записывает группу учеников на курс: id или email учеников передаются списком или файлом'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_id', type=int)
+        parser.add_argument('users', nargs='*', help='id или email учеников')
+        parser.add_argument('--file', help='Файл со списком учеников: по одному id или email в строке')
+        parser.add_argument('--chunk-size', type=int, default=ENROLL_CHUNK_SIZE,
+                            help='Количество учеников в одной транзакции')
+
+    def handle(self, *args, **options):
+        if not Course.objects.filter(id=options['course_id']).exists():
+            raise CommandError(f'Курс {options["course_id"]} не найден')
+
+        identifiers = list(options['users'])
+        if options['file']:
+            with open(options['file'], encoding='utf-8') as file:
+                identifiers.extend(line.strip() for line in file if line.strip())
+        if not identifiers:
+            raise CommandError('Не указаны ученики')
+
+        emails = [identifier for identifier in identifiers if not identifier.isdigit()]
+        user_ids = users_by_email(emails)
+        try:
+            results = enroll_users(options['course_id'],
+                                   [int(identifier) for identifier in identifiers if identifier.isdigit()]
+                                   + list(user_ids.values()),
+                                   chunk_size=options['chunk_size'])
+        except EnrollmentError as error:
+            raise CommandError(str(error))
+
+        for result in results:
+            if result.status == NOT_FOUND:
+                self.stderr.write(f'Ученик {result.user} не найден')
+        for email in emails:
+            if email not in user_ids:
+                self.stderr.write(f'Ученик {email} не найден')
+        summary = Counter(result.status for result in results)
+        self.stdout.write(self.style.SUCCESS(
+            'Запись завершена: ' + ', '.join(f'{status} - {count}' for status, count in summary.items())))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from learning.counters import course_views
+
+
+class Command(BaseCommand):
+    help = 'Переносит накопленные в буфере просмотры курсов в таблицу CourseViews'
+
+    def handle(self, *args, **options):
+        count = course_views.flush()
+        self.stdout.write(self.style.SUCCESS(f'Просмотры сохранены для курсов: {count}'))
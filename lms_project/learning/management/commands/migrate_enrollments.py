@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from learning.enrollment import migrate_enrollments
+from learning.stats import verify_stats
+
+
+class Command(BaseCommand):
+    help = 'Удаляет повторные записи Tracking, нумерует уроки курсов и заполняет записи на курсы (Enrollment) ' \
+           'по таблице Tracking'
+
+    def handle(self, *args, **options):
+        removed, renumbered, enrollments = migrate_enrollments()
+        errors = verify_stats()
+        for error in errors:
+            self.stderr.write(error)
+        if errors:
+            raise CommandError(f'Найдено расхождений: {len(errors)}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено повторов Tracking: {removed}, перенумеровано уроков: {renumbered}, '
+            f'записей на курсы: {enrollments}'))
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from learning.certificates import CERTIFICATE_CHUNK_SIZE, prerender_certificates
+
+
+class Command(BaseCommand):
+    help = 'Заранее отрисовывает сертификаты всем завершившим курсы; готовые файлы пропускаются'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='courses',
+                            help='id курса (можно указать несколько раз); по умолчанию все курсы')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Число процессов отрисовки; по умолчанию CERTIFICATE_WORKERS')
+        parser.add_argument('--chunk-size', type=int, default=CERTIFICATE_CHUNK_SIZE,
+                            help='Количество записей на курс, читаемых за один запрос')
+
+    def handle(self, *args, **options):
+        workers = options['workers'] or getattr(settings, 'CERTIFICATE_WORKERS', None) or None
+        rendered = prerender_certificates(options['courses'], workers, options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Отрисовано сертификатов: {rendered}'))
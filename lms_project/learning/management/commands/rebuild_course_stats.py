@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from learning.stats import rebuild_stats, verify_stats
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает статистику прохождения курсов по таблице Tracking или сверяет ее'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Только сверить сохраненную статистику, не изменяя ее')
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            errors = verify_stats()
+            for error in errors:
+                self.stderr.write(error)
+            if errors:
+                raise CommandError(f'Найдено расхождений: {len(errors)}')
+            self.stdout.write(self.style.SUCCESS('Статистика курсов актуальна'))
+        else:
+            count = rebuild_stats()
+            self.stdout.write(self.style.SUCCESS(f'Статистика пересобрана, записей прогресса: {count}'))
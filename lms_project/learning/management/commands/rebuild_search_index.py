@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from learning.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает поисковый индекс курсов'
+
+    def handle(self, *args, **options):
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано курсов: {count}'))
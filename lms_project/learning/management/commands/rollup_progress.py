@@ -0,0 +1,17 @@
+from datetime import date
+from django.core.management.base import BaseCommand
+from learning.rollups import rollup_progress
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает дневные агрегаты прогресса и статистику когорт по событиям прогресса'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=date.fromisoformat,
+                            help='Дата (YYYY-MM-DD), с недели которой пересчитать агрегаты; '
+                                 'по умолчанию - прошлая неделя')
+        parser.add_argument('--full', action='store_true', help='Пересчитать всю историю')
+
+    def handle(self, *args, **options):
+        days, cohorts = rollup_progress(since=options['since'], full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f'Дневных агрегатов: {days}, записей когорт: {cohorts}'))
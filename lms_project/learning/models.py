@@ -1,6 +1,7 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.shortcuts import reverse
+from django.utils import timezone
 
 
 class Course(models.Model):
@@ -20,6 +21,12 @@ class Course(models.Model):
         permissions = (
             ('modify_course', 'Can modify course content'),
         )
+        # Индексы под фасетный фильтр каталога: диапазон по первому полю, уточнение по второму
+        indexes = (
+            models.Index(fields=('price', 'start_date', ), name='course_price_start_idx'),
+            models.Index(fields=('start_date', 'price', ), name='course_start_price_idx'),
+            models.Index(fields=('duration', 'price', ), name='course_duration_price_idx'),
+        )
 
 
     def get_absolute_url(self):
@@ -29,31 +36,117 @@ class Course(models.Model):
         return f'{self.title}: Старт{self.start_date}'
 
 
+class SearchTerm(models.Model):
+    term = models.CharField(verbose_name='Термин', max_length=50)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, verbose_name='Курс', related_name='search_terms')
+    weight = models.PositiveIntegerField(default=1, verbose_name='Вес')
+
+    class Meta:
+        verbose_name_plural = 'Поисковый индекс'
+        verbose_name = 'Термин поискового индекса'
+        unique_together = ('term', 'course', )
+
+
 class Lesson(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE, verbose_name='Курс',
                                related_name='lessons')
     name = models.CharField(verbose_name='Название курса', max_length=25, unique=True)
     preview = models.TextField(verbose_name='Описание курса', max_length=100)
+    position = models.PositiveIntegerField(default=0, verbose_name='Порядковый номер в курсе')
 
     class Meta:
         verbose_name_plural = 'Уроки'
         verbose_name = 'Урок'
-        ordering = ['course']
+        ordering = ['course', 'position']
+        indexes = (
+            models.Index(fields=('course', 'position', ), name='lesson_course_position_idx'),
+        )
+        constraints = (
+            models.UniqueConstraint(fields=('course', 'position', ), name='lesson_course_position_unique'),
+        )
         permissions = (
             ('modify_lesson', 'Can modify lesson content'),
         )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Lesson, cls).from_db(db, field_names, values)
+        # Курс на момент загрузки: при переносе урока в другой курс номер назначается заново
+        instance._loaded_course_id = instance.__dict__.get('course_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Номер урока в курсе - позиция отметки в битовой маске Enrollment. Новый или перенесенный
+        # из другого курса урок получает следующий номер; курс блокируется, чтобы параллельные
+        # сохранения не выдали один и тот же номер
+        loaded_course_id = getattr(self, '_loaded_course_id', None)
+        moved = not self._state.adding and loaded_course_id is not None and loaded_course_id != self.course_id
+        # Прежний курс нужен обработчику post_save, чтобы пересчитать прогресс в обоих курсах
+        self._moved_from = loaded_course_id if moved else None
+        if (self._state.adding and not self.position) or moved:
+            with transaction.atomic():
+                list(Course.objects.select_for_update().filter(id=self.course_id).values_list('id', flat=True))
+                last = Lesson.objects.filter(course=self.course_id).aggregate(last=models.Max('position'))['last']
+                self.position = 0 if last is None else last + 1
+                super(Lesson, self).save(*args, **kwargs)
+        else:
+            super(Lesson, self).save(*args, **kwargs)
+        self._moved_from = None
+        self._loaded_course_id = self.course_id
+
     def __str__(self):
         return f'{self.course.title}:Урок{self.name}'
 
 
+class TrackingQuerySet(models.QuerySet):
+    """
+    Массовые операции над Tracking поддерживают в актуальном состоянии статистику прохождения курсов
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from .cache import bump_model_versions
+        from .stats import sync_progress, tracking_pairs
+        objs = super(TrackingQuerySet, self).bulk_create(objs, *args, **kwargs)
+        sync_progress(tracking_pairs(objs))
+        bump_model_versions([self.model])
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        from .cache import bump_model_versions
+        from .stats import sync_progress, tracking_pairs
+        rows = super(TrackingQuerySet, self).bulk_update(objs, fields, *args, **kwargs)
+        sync_progress(tracking_pairs(objs))
+        bump_model_versions([self.model])
+        return rows
+
+    def update(self, **kwargs):
+        from .cache import bump_model_versions
+        from .stats import sync_progress
+        moved_ids = None
+        if kwargs.keys() & {'user', 'user_id', 'lesson', 'lesson_id'}:
+            moved_ids = list(self.values_list('id', flat=True))
+        pairs = set(self.order_by().values_list('user', 'lesson__course').distinct())
+        rows = super(TrackingQuerySet, self).update(**kwargs)
+        if moved_ids:
+            pairs |= set(self.model.objects.order_by().filter(id__in=moved_ids)
+                         .values_list('user', 'lesson__course').distinct())
+        sync_progress(pairs)
+        bump_model_versions([self.model])
+        return rows
+
+
 class Tracking(models.Model):
     lesson = models.ForeignKey(Lesson, on_delete=models.PROTECT, verbose_name='Урок')
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name='Ученик')
     passed = models.BooleanField(default=None, verbose_name='Пройден?')
 
+    objects = TrackingQuerySet.as_manager()
+
     class Meta:
         ordering = ['-user']
+        constraints = (
+            models.UniqueConstraint(fields=('user', 'lesson', ), name='unique_tracking_user_lesson'),
+        )
 
 
 class Review(models.Model):
@@ -67,3 +160,144 @@ class Review(models.Model):
         verbose_name = 'Отзыв'
         ordering = ('-sent_date', )
         unique_together = ('user', 'course', )
+
+
+class Favourite(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name='Пользователь',
+                             related_name='favourites')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, verbose_name='Курс', related_name='favourited_by')
+    added_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата добавления')
+
+    class Meta:
+        verbose_name_plural = 'Избранное'
+        verbose_name = 'Избранный курс'
+        unique_together = ('user', 'course', )
+
+
+class CourseStats(models.Model):
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, primary_key=True,
+                                  related_name='stats', verbose_name='Курс')
+    count_students = models.PositiveIntegerField(default=0, verbose_name='Количество учеников')
+    percent_sum = models.FloatField(default=0, verbose_name='Сумма процентов прохождения')
+
+    class Meta:
+        verbose_name_plural = 'Статистика курсов'
+        verbose_name = 'Статистика курса'
+
+    @property
+    def percent_passed(self):
+        return round(self.percent_sum / self.count_students, 2) if self.count_students else 0
+
+
+class CourseViews(models.Model):
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, primary_key=True,
+                                  related_name='view_counter', verbose_name='Курс')
+    total = models.PositiveBigIntegerField(default=0, verbose_name='Количество просмотров')
+
+    class Meta:
+        verbose_name_plural = 'Просмотры курсов'
+        verbose_name = 'Просмотры курса'
+
+
+class Enrollment(models.Model):
+    """
+    Запись ученика на курс: прохождение уроков хранится битовой маской по порядковому номеру урока,
+    поэтому прогресс читается одной строкой без соединения с Tracking и Lesson.
+    Это модель для чтения: отметки пишутся в Tracking, маски пересчитываются из него (stats.sync_progress)
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name='Ученик',
+                             related_name='enrollments')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, verbose_name='Курс', related_name='enrollments')
+    total = models.PositiveIntegerField(default=0, verbose_name='Всего уроков')
+    passed = models.PositiveIntegerField(default=0, verbose_name='Пройдено уроков')
+    lessons = models.BinaryField(default=bytes, verbose_name='Уроки (битовая маска по номеру урока)')
+    passed_lessons = models.BinaryField(default=bytes, verbose_name='Пройденные уроки (битовая маска)')
+    enrolled_at = models.DateTimeField(default=timezone.now, verbose_name='Дата записи')
+    completed_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата завершения')
+
+    class Meta:
+        verbose_name_plural = 'Записи на курсы'
+        verbose_name = 'Запись на курс'
+        unique_together = ('user', 'course', )
+
+    @staticmethod
+    def pack(bits: int) -> bytes:
+        return bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+
+    @staticmethod
+    def unpack(value) -> int:
+        return int.from_bytes(bytes(value or b''), 'little')
+
+    @staticmethod
+    def positions(bits: int) -> set:
+        return {position for position in range(bits.bit_length()) if bits >> position & 1}
+
+    @property
+    def lesson_positions(self) -> set:
+        return self.positions(self.unpack(self.lessons))
+
+    @property
+    def passed_positions(self) -> set:
+        return self.positions(self.unpack(self.passed_lessons))
+
+    def is_passed(self, position: int) -> bool:
+        return position in self.passed_positions
+
+    @property
+    def percent(self):
+        return self.passed / self.total * 100 if self.total else 0
+
+    @property
+    def is_completed(self):
+        return bool(self.total) and self.passed == self.total
+
+
+class ProgressEvent(models.Model):
+    ENROLLED = 'enrolled'
+    LESSON_PASSED = 'lesson_passed'
+    COMPLETED = 'completed'
+    KIND_CHOICES = (
+        (ENROLLED, 'Запись на курс'),
+        (LESSON_PASSED, 'Урок пройден'),
+        (COMPLETED, 'Курс завершен'),
+    )
+
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, verbose_name='Курс')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name='Ученик')
+    kind = models.CharField(verbose_name='Событие', max_length=15, choices=KIND_CHOICES)
+    amount = models.IntegerField(default=1, verbose_name='Количество')
+    cohort = models.DateField(verbose_name='Дата записи ученика')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Время события')
+
+    class Meta:
+        verbose_name_plural = 'События прогресса'
+        verbose_name = 'Событие прогресса'
+        ordering = ('created_at', )
+
+
+class CourseDailyStats(models.Model):
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, verbose_name='Курс', related_name='daily_stats')
+    day = models.DateField(verbose_name='День')
+    enrolled = models.IntegerField(default=0, verbose_name='Записалось')
+    lessons_passed = models.IntegerField(default=0, verbose_name='Пройдено уроков')
+    completed = models.IntegerField(default=0, verbose_name='Завершили курс')
+
+    class Meta:
+        verbose_name_plural = 'Дневная статистика курсов'
+        verbose_name = 'Дневная статистика курса'
+        ordering = ('day', )
+        unique_together = ('course', 'day', )
+
+
+class CohortStats(models.Model):
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, verbose_name='Курс', related_name='cohort_stats')
+    cohort = models.DateField(verbose_name='Неделя записи')
+    week = models.DateField(verbose_name='Неделя события')
+    enrolled = models.IntegerField(default=0, verbose_name='Записалось (за вычетом отписавшихся)')
+    completed = models.IntegerField(default=0, verbose_name='Завершили курс')
+
+    class Meta:
+        verbose_name_plural = 'Статистика когорт'
+        verbose_name = 'Статистика когорты'
+        ordering = ('cohort', 'week', )
+        unique_together = ('course', 'cohort', 'week', )
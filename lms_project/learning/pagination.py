@@ -0,0 +1,123 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import Http404
+
+
+class KeysetPage(object):
+    """
+    Страница выборки по ключу: вместо номера страницы хранит курсоры соседних страниц
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    def has_other_pages(self) -> bool:
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator(object):
+    """
+    Пагинация по значениям полей сортировки последней записи (WHERE (a, b, pk) > (...)):
+    не требует COUNT(*) и OFFSET, стоимость страницы не зависит от ее номера.
+    Сортировка дополняется первичным ключом, чтобы быть строго однозначной
+    """
+
+    def __init__(self, ordering, per_page):
+        self.ordering = [field for field in ordering if field.lstrip('-') not in ('pk', 'id')] + ['pk']
+        self.per_page = int(per_page)
+
+    @staticmethod
+    def reverse_field(field: str) -> str:
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    def get_values(self, instance) -> list:
+        return [getattr(instance, field.lstrip('-')) for field in self.ordering]
+
+    def encode_cursor(self, instance, reverse: bool) -> str:
+        data = json.dumps({'v': self.get_values(instance), 'r': int(reverse)}, cls=DjangoJSONEncoder)
+        return urlsafe_b64encode(data.encode()).decode()
+
+    def decode_cursor(self, cursor: str, model=None):
+        """
+        Значения курсора приводятся к типам полей модели: курсор приходит из URL и может быть подделан
+        """
+        try:
+            data = json.loads(urlsafe_b64decode(cursor.encode()).decode())
+            values, reverse = data['v'], bool(data['r'])
+        except (BinasciiError, UnicodeError, ValueError, TypeError, KeyError):
+            raise Http404('Некорректный курсор страницы')
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise Http404('Некорректный курсор страницы')
+        if model is not None:
+            values = [self.to_python(model, field, value) for field, value in zip(self.ordering, values)]
+        return values, reverse
+
+    @staticmethod
+    def to_python(model, field: str, value):
+        name = field.lstrip('-')
+        try:
+            model_field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # Аннотации (например, rank поиска) проверяются при построении условия
+            return value
+        try:
+            return model_field.to_python(value)
+        except ValidationError:
+            raise Http404('Некорректный курсор страницы')
+
+    @staticmethod
+    def after(ordering, values) -> Q:
+        """
+        Условие "строго после" для составного ключа: a > x OR (a = x AND b > y) OR ...
+        """
+        condition = Q()
+        for index, field in enumerate(ordering):
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            equal = {ordering[prev].lstrip('-'): values[prev] for prev in range(index)}
+            condition |= Q(**equal, **{f'{field.lstrip("-")}__{lookup}': values[index]})
+        return condition
+
+    def page(self, queryset, cursor=None) -> KeysetPage:
+        values, reverse = self.decode_cursor(cursor, queryset.model) if cursor else (None, False)
+        ordering = [self.reverse_field(field) for field in self.ordering] if reverse else self.ordering
+
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            try:
+                queryset = queryset.filter(self.after(ordering, values))
+            except (ValueError, TypeError, ValidationError):
+                raise Http404('Некорректный курсор страницы')
+        object_list = list(queryset[:self.per_page + 1])
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+        if reverse:
+            object_list.reverse()
+        if not object_list:
+            return KeysetPage(object_list)
+
+        # При движении назад следующая страница существует всегда, предыдущая - если выбрана лишняя запись
+        has_next = True if reverse else has_more
+        has_previous = has_more if reverse else values is not None
+        return KeysetPage(
+            object_list,
+            next_cursor=self.encode_cursor(object_list[-1], reverse=False) if has_next else None,
+            previous_cursor=self.encode_cursor(object_list[0], reverse=True) if has_previous else None,
+        )
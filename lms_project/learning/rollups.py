@@ -0,0 +1,114 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import ProgressEvent, CourseDailyStats, CohortStats
+
+
+# Верхние границы периодов для отчетов API
+TREND_MAX_DAYS = 366
+COHORT_MAX_WEEKS = 104
+
+DAILY_FIELDS = {
+    ProgressEvent.ENROLLED: 'enrolled',
+    ProgressEvent.LESSON_PASSED: 'lessons_passed',
+    ProgressEvent.COMPLETED: 'completed',
+}
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+@transaction.atomic
+def rollup_progress(since=None, full=False):
+    """
+    Пересчитывает дневные агрегаты и статистику когорт по событиям прогресса.
+    Пересчет идет целыми неделями, начиная с недели since. По умолчанию - с прошлой недели:
+    первый запуск после понедельника досчитывает события конца прошлой недели, пришедшие после
+    предыдущего запуска. full=True пересчитывает всю историю
+    """
+    since = None if full else week_start(since or timezone.now().date() - timedelta(weeks=1))
+
+    events = ProgressEvent.objects.order_by()
+    daily_stats = CourseDailyStats.objects.all()
+    cohort_stats = CohortStats.objects.all()
+    if since:
+        events = events.filter(created_at__date__gte=since)
+        daily_stats = daily_stats.filter(day__gte=since)
+        cohort_stats = cohort_stats.filter(week__gte=since)
+
+    days = defaultdict(lambda: {'enrolled': 0, 'lessons_passed': 0, 'completed': 0})
+    rows = events.annotate(day=TruncDate('created_at')).values_list('course', 'day', 'kind')\
+        .annotate(amount=Sum('amount'))
+    for course_id, day, kind, amount in rows:
+        days[(course_id, day)][DAILY_FIELDS[kind]] += amount
+
+    # Запись и отписка относятся к когорте по дате записи ученика, а не по дню события:
+    # поздняя отписка уменьшает размер своей когорты
+    cohorts = defaultdict(lambda: {'enrolled': 0, 'completed': 0})
+    rows = events.filter(kind__in=(ProgressEvent.ENROLLED, ProgressEvent.COMPLETED))\
+        .annotate(day=TruncDate('created_at'))\
+        .values_list('course', 'cohort', 'day', 'kind').annotate(amount=Sum('amount'))
+    for course_id, cohort, day, kind, amount in rows:
+        cohorts[(course_id, week_start(cohort), week_start(day))][DAILY_FIELDS[kind]] += amount
+
+    daily_stats.delete()
+    cohort_stats.delete()
+    CourseDailyStats.objects.bulk_create([
+        CourseDailyStats(course_id=course_id, day=day, **counts) for (course_id, day), counts in days.items()
+    ], batch_size=1000)
+    CohortStats.objects.bulk_create([
+        CohortStats(course_id=course_id, cohort=cohort, week=week, **counts)
+        for (course_id, cohort, week), counts in cohorts.items() if any(counts.values())
+    ], batch_size=1000)
+    return len(days), len(cohorts)
+
+
+def completion_trend(course_id, days: int = 30) -> list:
+    """
+    Динамика записи и завершения курса по дням (только из дневных агрегатов)
+    """
+    since = timezone.now().date() - timedelta(days=days)
+    stats = CourseDailyStats.objects.filter(course=course_id)
+    totals = stats.filter(day__lt=since).aggregate(enrolled=Sum('enrolled'), completed=Sum('completed'))
+    total_enrolled, total_completed = totals['enrolled'] or 0, totals['completed'] or 0
+
+    trend = []
+    for day, enrolled, lessons_passed, completed in stats.filter(day__gte=since)\
+            .values_list('day', 'enrolled', 'lessons_passed', 'completed'):
+        total_enrolled += enrolled
+        total_completed += completed
+        trend.append({
+            'day': day,
+            'enrolled': enrolled,
+            'lessons_passed': lessons_passed,
+            'completed': completed,
+            'percent_completed': round(total_completed / total_enrolled * 100, 2) if total_enrolled else 0,
+        })
+    return trend
+
+
+def cohort_curves(course_id, weeks: int = 12) -> list:
+    """
+    Когорты по неделе записи: доля завершивших курс спустя 0..weeks недель
+    """
+    sizes = defaultdict(int)
+    completed = defaultdict(lambda: [0] * (weeks + 1))
+    for cohort, week, enrolled, count in CohortStats.objects.filter(course=course_id)\
+            .values_list('cohort', 'week', 'enrolled', 'completed'):
+        sizes[cohort] += enrolled
+        offset = (week - cohort).days // 7
+        if offset <= weeks:
+            completed[cohort][offset] += count
+
+    curves = []
+    for cohort in sorted(sizes):
+        enrolled, total, curve = sizes[cohort], 0, []
+        for count in completed[cohort]:
+            total += count
+            curve.append(round(total / enrolled * 100, 2) if enrolled > 0 else 0)
+        curves.append({'cohort': cohort, 'enrolled': enrolled, 'percent_completed': curve})
+    return curves
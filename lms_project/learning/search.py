@@ -0,0 +1,101 @@
+import re
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Case, IntegerField, Max, OuterRef, Q, Subquery, Sum, Value, When
+from .models import Course, SearchTerm
+
+
+TITLE_WEIGHT = 5
+AUTHOR_WEIGHT = 3
+DESCRIPTION_WEIGHT = 1
+
+WORD_RE = re.compile(r'\w+')
+
+# Окончания упорядочены по длине: отрезается самое длинное подходящее
+RU_ENDINGS = sorted((
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ешь', 'ете', 'ить', 'ать', 'ять', 'еть',
+    'ция', 'ции', 'цию', 'ией', 'ах', 'ях', 'ов', 'ев', 'ом', 'ем', 'ам', 'ям', 'ых', 'их', 'ой', 'ей', 'ий',
+    'ый', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ую', 'юю', 'ия', 'ью', 'ть', 'а', 'я', 'о', 'е', 'ы', 'и', 'у',
+    'ю', 'ь', 'й',
+), key=len, reverse=True)
+EN_ENDINGS = ('ing', 'ies', 'ied', 'ed', 'es', 'ly', 's', 'e')
+MIN_STEM_LENGTH = 3
+# Термины индекса обрезаются до длины поля; слова запроса обрезаются так же, иначе длинные слова не находятся
+TERM_MAX_LENGTH = SearchTerm._meta.get_field('term').max_length
+
+
+def stem(word: str) -> str:
+    """
+    Облегченный стеммер для русских и английских слов: отрезает окончание,
+    оставляя основу не короче MIN_STEM_LENGTH символов
+    """
+    endings = RU_ENDINGS if re.search('[а-я]', word) else EN_ENDINGS
+    for ending in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text: str) -> list:
+    return [stem(word)[:TERM_MAX_LENGTH] for word in WORD_RE.findall(str(text).casefold().replace('ё', 'е'))]
+
+
+def course_terms(course, author_names) -> dict:
+    """
+    Термины курса с весами: название, имена авторов (денормализованы в индекс), описание, дата старта
+    """
+    weights = defaultdict(int)
+    for text, weight in ((course.title, TITLE_WEIGHT),
+                         (' '.join(author_names), AUTHOR_WEIGHT),
+                         (course.description, DESCRIPTION_WEIGHT),
+                         (course.start_date, DESCRIPTION_WEIGHT)):
+        for term in tokenize(text):
+            weights[term] += weight
+    return weights
+
+
+@transaction.atomic
+def index_courses(course_ids):
+    """
+    Переиндексирует курсы: два запроса на чтение и одна массовая вставка
+    """
+    courses = list(Course.objects.filter(id__in=course_ids).only('title', 'description', 'start_date'))
+    authors = defaultdict(list)
+    for course_id, first_name, last_name in Course.authors.through.objects\
+            .filter(course__in=course_ids).values_list('course', 'user__first_name', 'user__last_name'):
+        authors[course_id].append(f'{first_name} {last_name}')
+
+    SearchTerm.objects.filter(course__in=course_ids).delete()
+    SearchTerm.objects.bulk_create([
+        SearchTerm(course=course, term=term, weight=weight)
+        for course in courses
+        for term, weight in course_terms(course, authors[course.id]).items()
+    ], batch_size=1000)
+
+
+def rebuild_index(batch_size=500) -> int:
+    course_ids = list(Course.objects.values_list('id', flat=True))
+    for start in range(0, len(course_ids), batch_size):
+        index_courses(course_ids[start:start + batch_size])
+    return len(course_ids)
+
+
+def search_courses(queryset, query: str):
+    """
+    Отбирает курсы, содержащие все слова запроса (последнее - по префиксу), и аннотирует их рангом
+    """
+    terms = tokenize(query)
+    if not terms:
+        return queryset.annotate(rank=Value(0, output_field=IntegerField()))
+
+    conditions = [Q(term=term) for term in terms[:-1]] + [Q(term__startswith=terms[-1])]
+    hits = {f'hit_{index}': Max(Case(When(condition, then=Value(1)), default=Value(0)))
+            for index, condition in enumerate(conditions)}
+    matched = SearchTerm.objects.order_by()\
+        .filter(Q(*conditions, _connector=Q.OR))\
+        .values('course')\
+        .annotate(rank=Sum('weight'), **hits)\
+        .filter(**{hit: 1 for hit in hits})
+    return queryset\
+        .filter(id__in=matched.values('course'))\
+        .annotate(rank=Subquery(matched.filter(course=OuterRef('pk')).values('rank')[:1]))
@@ -1,11 +1,21 @@
 from django.conf import settings
-from django.core.mail import send_mail, EmailMultiAlternatives, get_connection, EmailMessage
-from django.db.models.signals import pre_save, post_save
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import Signal, receiver
-from .models import Course, Lesson
+from .models import Course, Lesson, Tracking, Review
+from .stats import remove_user_progress, sync_progress
+from .counters import course_views
+from .cache import bump_course_versions, bump_catalog_version, bump_scope_versions, bump_model_versions
+from .search import index_courses
+from .favourites import add_favourites
+from .detail import invalidate_course_details
+from .enrollment import backfill_lesson
+from .tasks import run_in_background
+from .certificates import get_certificate as get_certificate_path
+from outbox.announcements import announce
+from outbox.mail import enqueue
 from django.template.loader import render_to_string
 from django.db.models import Count
-from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_in
 
 
 set_views = Signal()
@@ -31,40 +41,38 @@ def send_enroll_email(**kwargs):
         'message': f'Вы были успешно записаны на курс {course.title}.'
                    f'Первый урок будет доступен уже {course.start_date}. Не пропустите!'
     }
-    send_mail(subject='Запись на курс | Платформа Codeby',
-              message='',
-              from_email=settings.DEFAULT_FROM_EMAIL,
-              recipient_list=[kwargs['request'].user.email],
-              html_message=render_to_string(template_name, context, kwargs['request']),
-              fail_silently=False)
+    enqueue(subject='Запись на курс | Платформа Codeby',
+            to=kwargs['request'].user.email,
+            html_message=render_to_string(template_name, context, kwargs['request']))
 
 
 def incr_views(sender, **kwargs):
-    session = kwargs['session']
-    views = session.setdefault('views', {})
-    course_id = str(kwargs['id'])
-    count = views.get(course_id, 0)
-    views[course_id] = count + 1
-    session['views'] = views
-    session.modified = True
+    course_views.incr(kwargs['id'])
+
+
+def email_certificate(email, user_id, course_id):
+    path = get_certificate_path(user_id, course_id)
+    if path is None:
+        return
+    template_name = 'emails/certificate_email.html'
+    context = {
+        'message': 'Поздравляем! Вы успешно закончили курс.'
+                   '\nВо вложении прилагаем сертификат о прохождении'
+    }
+    enqueue(subject='Сертификат о прохождении курса | Платформа Codeby',
+            to=email,
+            html_message=render_to_string(template_name, context),
+            attachments=[(str(path), 'image/png')])
 
 
 def send_user_certificate(**kwargs):
-     template_name = 'emails/certificate_email.html'
-     context = {
-         'message': 'Поздравляем! Вы успешно закончили курс.'
-                    '\nВо вложении прилагаем сертификат о прохождении'
-     }
-     email = EmailMultiAlternatives(subject='Сертификат о прохождении курса | Платформа Codeby',
-                                    to=[kwargs['sender'].email])
-     email.attach_alternative(render_to_string(template_name, context), mimetype='text/html')
-     email.attach_file(path=settings.MEDIA_ROOT / 'certificates/certificate.png', mimetype='image/png')
-     email.send(fail_silently=True)
+    # Отрисовка сертификата может занять время: письмо собирается вне обработки запроса
+    run_in_background(email_certificate, kwargs['sender'].email, kwargs['sender'].pk, kwargs['course_id'])
 
 
 @receiver(post_save, sender=Lesson)
 def send_info_email(sender, instance, **kwargs):
-    if kwargs['created']:
+    if kwargs['created'] and not kwargs.get('raw'):
         course_data = Course.objects.filter(id=instance.course.id).annotate(lessons_count=Count('lessons')).values('count_lessons', 'lessons_count')[0]
 
         if course_data['lessons_count'] >= course_data['count_lessons']:
@@ -75,25 +83,160 @@ def send_info_email(sender, instance, **kwargs):
                 'message': f'На нашей платформе появился новый курс {course.title}.'
                            f'\nПодробную информацию Вы можете получить по ссылке ниже'
             }
-            user = get_user_model()
-            recipients = user.objects.exclude(is_staff=True).values_list('email', flat=True)
+            # Письмо рендерится один раз, рассылку по ученикам выполняет воркер send_announcements
+            announce(subject='Время обучиться новому скиллу | Платформа Codeby',
+                     html_message=render_to_string(template_name, context))
+
+
+
+@receiver(pre_save, sender=Tracking)
+def remember_tracking_course(sender, instance, **kwargs):
+    # Запоминаем исходную пару (ученик, курс), чтобы пересчитать ее, если урок или ученик изменились
+    instance._progress_pairs = set(Tracking.objects.filter(pk=instance.pk).values_list('user', 'lesson__course')) \
+        if instance.pk else set()
+
+
+@receiver(post_save, sender=Tracking)
+@receiver(post_delete, sender=Tracking)
+def update_progress(sender, instance, **kwargs):
+    pairs = getattr(instance, '_progress_pairs', set())
+    pairs.add((instance.user_id, instance.lesson.course_id))
+    sync_progress(pairs)
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def remove_deleted_user_progress(sender, instance, **kwargs):
+    # До каскада: иначе записи на курсы удаляются без вычитания из CourseStats
+    remove_user_progress([instance.pk])
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def update_course_version(sender, instance, **kwargs):
+    bump_course_versions([instance.pk])
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def invalidate_course_detail(sender, instance, **kwargs):
+    invalidate_course_details([instance.pk])
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_related_course_detail(sender, instance, **kwargs):
+    invalidate_course_details([instance.course_id])
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def update_lessons_version(sender, instance, **kwargs):
+    bump_scope_versions('lessons', [instance.course_id])
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def update_reviews_version(sender, instance, **kwargs):
+    bump_scope_versions('reviews', [instance.course_id])
+
+
+@receiver(post_save, sender=Course)
+def index_course(sender, instance, **kwargs):
+    index_courses([instance.pk])
+
+
+@receiver(m2m_changed, sender=Course.authors.through)
+def index_course_authors(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        instance._cleared_course_ids = set(instance.authors.values_list('id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        course_ids = {instance.pk}
+    elif action == 'post_clear':
+        course_ids = getattr(instance, '_cleared_course_ids', set())
+    else:
+        course_ids = pk_set
+    index_courses(course_ids)
+    invalidate_course_details(course_ids)
+    bump_course_versions(course_ids)
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def index_author_courses(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields and not {'first_name', 'last_name'} & set(update_fields)):
+        return
+    index_courses(Course.objects.filter(authors=instance).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_course_details(sender, instance, created, update_fields=None, **kwargs):
+    # Имя и фото пользователя входят в страницы курсов, где он автор или оставил отзыв
+    if created or (update_fields and not {'first_name', 'last_name', 'avatar'} & set(update_fields)):
+        return
+    authored = set(Course.objects.filter(authors=instance).values_list('id', flat=True))
+    reviewed = set(Review.objects.filter(user=instance).values_list('course', flat=True))
+    invalidate_course_details(authored | reviewed)
+    bump_scope_versions('reviews', reviewed)
+    if authored:
+        bump_catalog_version()
+
+
+@receiver(post_save, sender=Lesson)
+def backfill_new_lesson(sender, instance, created, raw=False, **kwargs):
+    # Записанным на курс ученикам новый урок дописывается вне обработки запроса
+    if created and not raw:
+        run_in_background(backfill_lesson, instance.pk)
+
+
+@receiver(post_save, sender=Lesson)
+def resync_moved_lesson(sender, instance, created, raw=False, **kwargs):
+    # Урок перенесен в другой курс: маски обоих курсов пересчитываются по его отметкам,
+    # ученикам нового курса урок дописывается как новый
+    moved_from = getattr(instance, '_moved_from', None)
+    if created or raw or moved_from is None:
+        return
+    users = set(Tracking.objects.filter(lesson=instance).values_list('user', flat=True))
+    sync_progress({(user_id, course_id) for user_id in users for course_id in (moved_from, instance.course_id)})
+    bump_course_versions([moved_from])
+    run_in_background(backfill_lesson, instance.pk)
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def update_lesson_course_version(sender, instance, **kwargs):
+    bump_course_versions([instance.course_id])
+
+
+@receiver(user_logged_in)
+def merge_session_favourites(sender, request, user, **kwargs):
+    # Избранное, сохраненное в сессии до перехода на таблицу Favourite, переносится при входе
+    course_ids = request.session.pop('favourites', None) if hasattr(request, 'session') else None
+    if course_ids:
+        add_favourites(user.id, Course.objects.filter(id__in=course_ids).values_list('id', flat=True))
 
-            connection = get_connection(fail_silently=True)
-            connection.open()
 
-            EmailMessage.content_subtype = 'html'
-            emails = [
-                EmailMessage(subject='Время обучиться новому скиллу | Платформа Codeby',
-                             body=render_to_string(template_name, context),
-                             to=[email])
-                for email in recipients
-            ]
+def update_model_version(sender, update_fields=None, **kwargs):
+    # Счетчики версий моделей: ключи кэша ответов API включают версии моделей, из которых собран ответ.
+    # Отметка о входе в ответы не попадает и не должна сбрасывать кэш при каждом логине
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    bump_model_versions([sender])
 
-            connection.send_messages(emails)
-            connection.close()
 
+def update_m2m_model_versions(sender, instance, action, model, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_model_versions({sender, instance.__class__, model})
 
 
+for versioned_model in (Course, Lesson, Review, Tracking, settings.AUTH_USER_MODEL):
+    post_save.connect(update_model_version, sender=versioned_model)
+    post_delete.connect(update_model_version, sender=versioned_model)
+m2m_changed.connect(update_m2m_model_versions, sender=Course.authors.through)
 pre_save.connect(check_quantity, sender=Lesson)
 set_views.connect(incr_views)
 course_enroll.connect(send_enroll_email)
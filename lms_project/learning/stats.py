@@ -0,0 +1,229 @@
+from collections import defaultdict
+from typing import NamedTuple
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .cache import bump_course_versions
+from .models import Course, Lesson, Tracking, CourseStats, Enrollment, ProgressEvent
+
+
+class ProgressState(NamedTuple):
+    """
+    Фактическое состояние записи на курс: битовые маски уроков и пройденных уроков по их номерам
+    """
+    lessons: int = 0
+    passed_lessons: int = 0
+
+    @property
+    def total(self) -> int:
+        return bin(self.lessons).count('1')
+
+    @property
+    def passed(self) -> int:
+        return bin(self.passed_lessons & self.lessons).count('1')
+
+    def apply(self, enrollment):
+        enrollment.total, enrollment.passed = self.total, self.passed
+        enrollment.lessons = Enrollment.pack(self.lessons)
+        enrollment.passed_lessons = Enrollment.pack(self.passed_lessons & self.lessons)
+        return enrollment
+
+    @classmethod
+    def of(cls, enrollment):
+        return cls(Enrollment.unpack(enrollment.lessons), Enrollment.unpack(enrollment.passed_lessons))
+
+
+def tracking_pairs(trackings) -> set:
+    """
+    Пары (ученик, курс), затронутые переданными записями Tracking
+    """
+    lesson_ids = {tracking.lesson_id for tracking in trackings}
+    courses = dict(Lesson.objects.filter(id__in=lesson_ids).values_list('id', 'course'))
+    return {(tracking.user_id, courses[tracking.lesson_id]) for tracking in trackings
+            if tracking.lesson_id in courses}
+
+
+def compute_progress(user_ids=None, course_ids=None) -> dict:
+    """
+    Фактический прогресс по таблице Tracking: {(ученик, курс): ProgressState}
+    """
+    queryset = Tracking.objects.order_by()
+    if user_ids is not None:
+        queryset = queryset.filter(user__in=user_ids)
+    if course_ids is not None:
+        queryset = queryset.filter(lesson__course__in=course_ids)
+    states = defaultdict(lambda: [0, 0])
+    for user_id, course_id, position, passed in \
+            queryset.values_list('user', 'lesson__course', 'lesson__position', 'passed').iterator():
+        state = states[(user_id, course_id)]
+        state[0] |= 1 << position
+        if passed:
+            state[1] |= 1 << position
+    return {pair: ProgressState(*state) for pair, state in states.items()}
+
+
+def apply_course_deltas(deltas: dict):
+    """
+    Применяет приращения {курс: [учеников, сумма процентов]} к CourseStats одним UPDATE на курс
+    """
+    deltas = {course_id: delta for course_id, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+    CourseStats.objects.bulk_create([CourseStats(course_id=course_id) for course_id in deltas],
+                                    ignore_conflicts=True)
+    for course_id, (count_students, percent_sum) in deltas.items():
+        CourseStats.objects.filter(course_id=course_id).update(
+            count_students=F('count_students') + count_students,
+            percent_sum=F('percent_sum') + percent_sum,
+        )
+
+
+@transaction.atomic
+def sync_progress(pairs):
+    """
+    Пересчитывает записи на курс только для затронутых пар (ученик, курс)
+    и переносит разницу в CourseStats
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return
+    user_ids = {user_id for user_id, _ in pairs}
+    course_ids = {course_id for _, course_id in pairs}
+
+    actual = compute_progress(user_ids, course_ids)
+    existing = {
+        (enrollment.user_id, enrollment.course_id): enrollment
+        for enrollment in Enrollment.objects.select_for_update().filter(user__in=user_ids, course__in=course_ids)
+    }
+
+    now = timezone.now()
+    deltas = defaultdict(lambda: [0, 0.0])
+    created, updated, deleted, events = [], [], [], []
+    for user_id, course_id in pairs:
+        state = actual.get((user_id, course_id), ProgressState())
+        enrollment = existing.get((user_id, course_id))
+        if enrollment is None:
+            if state.total:
+                enrollment = state.apply(Enrollment(user_id=user_id, course_id=course_id, enrolled_at=now))
+                created.append(enrollment)
+                deltas[course_id][0] += 1
+                deltas[course_id][1] += enrollment.percent
+                events.append(progress_event(enrollment, ProgressEvent.ENROLLED))
+                events.extend(progress_events(enrollment, 0, False))
+        elif not state.total:
+            deleted.append(enrollment.pk)
+            deltas[course_id][0] -= 1
+            deltas[course_id][1] -= enrollment.percent
+            events.append(progress_event(enrollment, ProgressEvent.ENROLLED, -1))
+        elif ProgressState.of(enrollment) != state:
+            deltas[course_id][1] -= enrollment.percent
+            was_passed, was_completed = enrollment.passed, enrollment.is_completed
+            state.apply(enrollment)
+            deltas[course_id][1] += enrollment.percent
+            events.extend(progress_events(enrollment, was_passed, was_completed))
+            updated.append(enrollment)
+
+    Enrollment.objects.bulk_create(created)
+    Enrollment.objects.bulk_update(updated, fields=('total', 'passed', 'lessons', 'passed_lessons', 'completed_at', ))
+    Enrollment.objects.filter(pk__in=deleted).delete()
+    ProgressEvent.objects.bulk_create(events)
+    apply_course_deltas(deltas)
+    bump_course_versions(course_id for _, course_id in pairs)
+
+
+@transaction.atomic
+def remove_user_progress(user_ids):
+    """
+    Снимает удаляемых учеников с курсов и вычитает их из CourseStats: каскадное удаление
+    пользователя удаляет записи на курсы в обход sync_progress
+    """
+    enrollments = list(Enrollment.objects.select_for_update().filter(user__in=user_ids))
+    if not enrollments:
+        return
+    deltas = defaultdict(lambda: [0, 0.0])
+    for enrollment in enrollments:
+        deltas[enrollment.course_id][0] -= 1
+        deltas[enrollment.course_id][1] -= enrollment.percent
+    Enrollment.objects.filter(pk__in=[enrollment.pk for enrollment in enrollments]).delete()
+    apply_course_deltas(deltas)
+    bump_course_versions(deltas)
+
+
+def progress_event(progress, kind, amount=1) -> ProgressEvent:
+    return ProgressEvent(course_id=progress.course_id, user_id=progress.user_id, kind=kind, amount=amount,
+                         cohort=progress.enrolled_at.date())
+
+
+def progress_events(progress, was_passed: int, was_completed: bool) -> list:
+    """
+    События об изменении прогресса ученика; заодно проставляет дату завершения курса
+    """
+    events = []
+    if progress.passed != was_passed:
+        events.append(progress_event(progress, ProgressEvent.LESSON_PASSED, progress.passed - was_passed))
+    if progress.is_completed and not was_completed:
+        progress.completed_at = timezone.now()
+        events.append(progress_event(progress, ProgressEvent.COMPLETED))
+    elif was_completed and not progress.is_completed:
+        progress.completed_at = None
+        events.append(progress_event(progress, ProgressEvent.COMPLETED, -1))
+    return events
+
+
+@transaction.atomic
+def rebuild_stats(batch_size=1000):
+    """
+    Полностью пересобирает записи на курсы и CourseStats по таблице Tracking,
+    сохраняя известные даты записи и завершения
+    """
+    now = timezone.now()
+    dates = {(user_id, course_id): (enrolled_at, completed_at)
+             for user_id, course_id, enrolled_at, completed_at in
+             Enrollment.objects.values_list('user', 'course', 'enrolled_at', 'completed_at').iterator()}
+    Enrollment.objects.all().delete()
+    CourseStats.objects.all().delete()
+
+    deltas = defaultdict(lambda: [0, 0.0])
+    records = []
+    for (user_id, course_id), state in compute_progress().items():
+        enrolled_at, completed_at = dates.get((user_id, course_id), (now, None))
+        enrollment = state.apply(Enrollment(user_id=user_id, course_id=course_id, enrolled_at=enrolled_at))
+        enrollment.completed_at = (completed_at or now) if enrollment.is_completed else None
+        records.append(enrollment)
+        deltas[course_id][0] += 1
+        deltas[course_id][1] += enrollment.percent
+    Enrollment.objects.bulk_create(records, batch_size=batch_size)
+    CourseStats.objects.bulk_create([
+        CourseStats(course_id=course_id, count_students=count_students, percent_sum=percent_sum)
+        for course_id, (count_students, percent_sum) in deltas.items()
+    ], batch_size=batch_size)
+    bump_course_versions(Course.objects.values_list('id', flat=True))
+    return len(records)
+
+
+def verify_stats() -> list:
+    """
+    Сверяет записи на курсы и CourseStats с таблицей Tracking, возвращает список расхождений
+    """
+    errors = []
+    actual = compute_progress()
+    stored = {(enrollment.user_id, enrollment.course_id): ProgressState.of(enrollment)
+              for enrollment in Enrollment.objects.only('user', 'course', 'lessons', 'passed_lessons').iterator()}
+    for pair in actual.keys() | stored.keys():
+        if actual.get(pair) != stored.get(pair):
+            errors.append(f'Прогресс ученика {pair[0]} по курсу {pair[1]}: '
+                          f'ожидалось {actual.get(pair)}, сохранено {stored.get(pair)}')
+
+    expected = defaultdict(lambda: [0, 0.0])
+    for (_, course_id), state in actual.items():
+        expected[course_id][0] += 1
+        expected[course_id][1] += state.passed / state.total * 100
+    stats = {course_id: (count_students, percent_sum) for course_id, count_students, percent_sum in
+             CourseStats.objects.values_list('course', 'count_students', 'percent_sum')}
+    for course_id in expected.keys() | stats.keys():
+        count_students, percent_sum = expected.get(course_id, (0, 0.0))
+        stored_count, stored_sum = stats.get(course_id, (0, 0.0))
+        if count_students != stored_count or round(percent_sum - stored_sum, 6):
+            errors.append(f'Статистика курса {course_id}: ожидалось ({count_students}, {percent_sum:.2f}), '
+                          f'сохранено ({stored_count}, {stored_sum:.2f})')
+    return errors
@@ -0,0 +1,40 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'BACKGROUND_TASKS_WORKERS', 2),
+                                       thread_name_prefix='learning-tasks')
+    return _executor
+
+
+def run_task(func, *args, **kwargs):
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        logger.exception('Фоновая задача %s завершилась ошибкой', getattr(func, '__name__', func))
+    finally:
+        # Поток пула живет дольше задачи: соединение с базой не должно оставаться открытым
+        connections.close_all()
+
+
+def run_in_background(func, *args, **kwargs):
+    """
+    Запускает задачу вне обработки запроса после фиксации текущей транзакции.
+    При BACKGROUND_TASKS_EAGER задача выполняется синхронно (тесты, отладка)
+    """
+    if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+        transaction.on_commit(partial(func, *args, **kwargs))
+    else:
+        transaction.on_commit(partial(get_executor().submit, run_task, func, *args, **kwargs))
@@ -1,5 +1,16 @@
-from django.test import TestCase
-from learning.models import Course, Lesson
+import tempfile
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from learning.certificates import get_certificate
+from auth_app.models import User
+from learning.enrollment import ALREADY_ENROLLED, ENROLLED, EnrollmentError, enroll_users, migrate_enrollments
+from learning.models import Course, Lesson, Enrollment, Tracking, TrackingQuerySet
+from learning.stats import verify_stats
 
 
 class LearningModelsTestCase(TestCase):
@@ -12,3 +23,128 @@ class LearningModelsTestCase(TestCase):
     def test_lesson_to_str(self):
         lesson = Lesson.objects.get(name='Разметка текста')
         self.assertEqual(str(lesson), f'{lesson.course.title}:Урок{lesson.name}')
+
+    def test_enrollment_bitset_follows_tracking(self):
+        tracking = Tracking.objects.select_related('lesson').filter(passed=False).first()
+        enrollment = Enrollment.objects.get(user=tracking.user, course=tracking.lesson.course_id)
+        self.assertIn(tracking.lesson.position, enrollment.lesson_positions)
+        self.assertFalse(enrollment.is_passed(tracking.lesson.position))
+
+        tracking.passed = True
+        tracking.save()
+        enrollment.refresh_from_db()
+        self.assertTrue(enrollment.is_passed(tracking.lesson.position))
+        self.assertEqual(enrollment.passed, len(enrollment.passed_positions))
+
+    def test_deleted_user_removed_from_stats(self):
+        enrollment = Enrollment.objects.first()
+        enrollment.user.delete()
+        self.assertFalse(Enrollment.objects.filter(user=enrollment.user_id).exists())
+        self.assertEqual(verify_stats(), [])
+
+    def test_enroll_status_counts_inserted_rows(self):
+        course = Course.objects.filter(lessons__isnull=False).first()
+        user = User.objects.exclude(tracking__lesson__course=course).first()
+        # Все строки уже вставил параллельный запрос: вставка с ignore_conflicts ничего не добавляет
+        with mock.patch.object(TrackingQuerySet, 'bulk_create', return_value=[]):
+            result, = enroll_users(course.id, [user.id])
+        self.assertEqual((result.status, result.created), (ALREADY_ENROLLED, 0))
+
+        result, = enroll_users(course.id, [user.id])
+        self.assertEqual((result.status, result.created), (ENROLLED, course.lessons.count()))
+
+    def test_enroll_requires_course_with_lessons(self):
+        user = User.objects.first()
+        with self.assertRaises(EnrollmentError):
+            enroll_users(100500, [user.id])
+        course = Course.objects.create(title='Пустой курс', description='Без уроков', start_date='2030-01-01',
+                                       duration=1, price=0, count_lessons=1)
+        with self.assertRaises(EnrollmentError):
+            enroll_users(course.id, [user.id])
+
+    def test_new_lesson_gets_next_position(self):
+        course = Course.objects.get(title='HTML верстка')
+        last = course.lessons.order_by('position').last()
+        lesson = Lesson.objects.create(course=course, name='Новый урок', preview='Описание')
+        self.assertEqual(lesson.position, last.position + 1)
+
+    def test_migrate_enrollments(self):
+        Lesson.objects.update(position=F('id') * 2 + 1)
+        Enrollment.objects.all().delete()
+        migrate_enrollments()
+        self.assertEqual(verify_stats(), [])
+        positions = Lesson.objects.filter(course=Course.objects.get(title='HTML верстка')).values_list('position', flat=True)
+        self.assertEqual(sorted(positions), list(range(len(positions))))
+
+    @override_settings(BACKGROUND_TASKS_EAGER=True)
+    def test_moved_lesson_gets_next_position(self):
+        lesson = Lesson.objects.filter(tracking__isnull=False).first()
+        target = Course.objects.exclude(id=lesson.course_id).filter(lessons__isnull=False).first()
+        last = Lesson.objects.filter(course=target).order_by('-position').values_list('position', flat=True)[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson.course = target
+            lesson.save()
+        self.assertEqual(Lesson.objects.get(pk=lesson.pk).position, last + 1)
+        self.assertEqual(verify_stats(), [])
+
+    @override_settings(BACKGROUND_TASKS_EAGER=True)
+    def test_new_lesson_backfilled_for_enrolled_users(self):
+        course = Course.objects.filter(enrollments__isnull=False).first()
+        students = set(Enrollment.objects.filter(course=course).values_list('user', flat=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson = Lesson.objects.create(course=course, name='Дополнительный урок', preview='Описание')
+        self.assertEqual(set(Tracking.objects.filter(lesson=lesson).values_list('user', flat=True)), students)
+        self.assertTrue(all(lesson.position in enrollment.lesson_positions
+                            for enrollment in Enrollment.objects.filter(course=course)))
+
+    def test_check_tracking_gaps(self):
+        tracking = Tracking.objects.select_related('lesson').first()
+        Tracking.objects.filter(pk=tracking.pk).delete()
+        with self.assertRaises(CommandError):
+            call_command('check_tracking_gaps', stdout=StringIO())
+        call_command('check_tracking_gaps', repair=True, stdout=StringIO())
+        self.assertTrue(Tracking.objects.filter(user=tracking.user, lesson=tracking.lesson).exists())
+        call_command('check_tracking_gaps', stdout=StringIO())
+
+    def test_certificate_rendered_once(self):
+        tracking = Tracking.objects.select_related('lesson').first()
+        Tracking.objects.filter(user=tracking.user, lesson__course=tracking.lesson.course_id).update(passed=True)
+        with tempfile.TemporaryDirectory() as root, override_settings(CERTIFICATE_ROOT=root):
+            with mock.patch('learning.certificates.ProcessPoolExecutor') as pool:
+                path = get_certificate(tracking.user_id, tracking.lesson.course_id)
+            pool.assert_not_called()
+            self.assertTrue(path.exists())
+            modified = path.stat().st_mtime_ns
+            self.assertEqual(get_certificate(tracking.user_id, tracking.lesson.course_id), path)
+            self.assertEqual(path.stat().st_mtime_ns, modified)
+
+            out = StringIO()
+            call_command('prerender_certificates', '--workers', '1', stdout=out)
+            self.assertEqual(len(list(path.parent.parent.glob('*/*.png'))),
+                             Enrollment.objects.filter(completed_at__isnull=False).count())
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class TrackingDedupeTestCase(TransactionTestCase):
+    fixtures = ['test_data.json']
+
+    def test_duplicates_removed_before_unique_constraint(self):
+        # Данные, записанные до ограничения unique_tracking_user_lesson
+        constraint = next(constraint for constraint in Tracking._meta.constraints
+                          if constraint.name == 'unique_tracking_user_lesson')
+        # SQLite пересоздает таблицу по Meta модели, поэтому ограничение убирается и из нее
+        with connection.schema_editor() as editor, mock.patch.object(Tracking._meta, 'constraints', []):
+            editor.remove_constraint(Tracking, constraint)
+        try:
+            tracking = Tracking.objects.filter(passed=False).first()
+            passed = Tracking.objects.create(user=tracking.user, lesson=tracking.lesson, passed=True)
+            Tracking.objects.create(user=tracking.user, lesson=tracking.lesson, passed=False)
+            removed, _, _ = migrate_enrollments()
+            self.assertEqual(removed, 2)
+            self.assertEqual(list(Tracking.objects.filter(user=tracking.user, lesson=tracking.lesson)
+                                  .values_list('id', flat=True)), [passed.id])
+            self.assertEqual(verify_stats(), [])
+        finally:
+            migrate_enrollments()
+            with connection.schema_editor() as editor:
+                editor.add_constraint(Tracking, constraint)
@@ -1,7 +1,15 @@
+import json
+from base64 import urlsafe_b64encode
 from django.db.models import Q
 from django.shortcuts import reverse
+from django.db import connection
 from django.test import TestCase, Client, tag
+from django.test.utils import CaptureQueriesContext
 from learning.models import *
+from learning.search import search_courses
+from learning.facets import facet_counts
+from learning.favourites import get_favourite_ids, add_favourites
+from auth_app.models import User
 from django.utils import timezone
 
 
@@ -28,14 +36,105 @@ class LearningViewTestCase(TestCase):
         response = self.client.get(self.index, data={'page': 2})
         self.assertEqual(len([response.context.get('courses')]), 1)
 
+    def test_index_view_keyset_pages(self):
+        self.client.cookies['paginate_by'] = 2
+        expected = list(Course.objects.order_by('price', 'pk'))
+        pages, params = [], {'price_order': 'price'}
+        while True:
+            response = self.client.get(self.index, data=params)
+            page = response.context['page_obj']
+            pages.append(list(response.context['courses']))
+            if not page.has_next():
+                break
+            params['cursor'] = page.next_cursor
+        self.assertEqual([course for page in pages for course in page], expected)
+
+        params['cursor'] = page.previous_cursor
+        response = self.client.get(self.index, data=params)
+        self.assertEqual(list(response.context['courses']), pages[-2])
+        self.assertEqual(self.client.get(self.index, data={'cursor': 'broken'}).status_code, 404)
+        for values in (['abc', 1], [100, 'abc'], [None, 1]):
+            cursor = urlsafe_b64encode(json.dumps({'v': values, 'r': 0}).encode()).decode()
+            response = self.client.get(self.index, data={'price_order': 'price', 'cursor': cursor})
+            self.assertEqual(response.status_code, 404)
+        cursor = urlsafe_b64encode(json.dumps({'v': [100, 'abc', 1], 'r': 0}).encode()).decode()
+        response = self.client.get(self.index, data={'search': 'html', 'price_order': 'price', 'cursor': cursor})
+        self.assertEqual(response.status_code, 404)
+
+        self.client.cookies['paginate_by'] = 'abc'
+        self.assertEqual(self.client.get(self.index).status_code, 200)
+
+    def test_index_view_facets(self):
+        response = self.client.get(self.index, data={'price_max': 9000, 'duration_min': 1})
+        courses = Course.objects.filter(price__lte=9000, duration__gte=1)
+        self.assertEqual({course.pk for course in response.context['courses']}, set(courses.values_list('pk', flat=True)))
+        facets = response.context['facets']
+        self.assertEqual(facets['total'], courses.count())
+        price = {value['key']: value['count'] for value in facets['price']}
+        # Значения фасета цены считаются без его собственного фильтра, но с фильтрами остальных фасетов
+        other = Course.objects.filter(duration__gte=1)
+        self.assertEqual(price['free'], other.filter(price=0).count())
+        self.assertEqual(price['over_10000'], other.filter(price__gt=10000).count())
+        duration = {value['key']: value['count'] for value in facets['duration']}
+        self.assertEqual(duration['short'], Course.objects.filter(price__lte=9000, duration__lte=2).count())
+
+        with CaptureQueriesContext(connection) as queries:
+            facet_counts(Course.objects.all())
+        self.assertEqual(len(queries), 1)
+
+        response = self.client.get(self.index, data={'free_only': 'on', 'price_min': 'abc'})
+        self.assertEqual({course.price for course in response.context['courses']}, {0})
+
     def test_search_and_order_by_view(self):
         search_query = {'search': 'h', 'price_order': '-price'}
         response = self.client.get(self.index, data=search_query)
-        filters = Q(title__icontains=search_query['search']) | Q(description__icontains=search_query['search'])
-        courses = Course.objects.filter(filters).order_by(search_query['price_order'])
+        courses = search_courses(Course.objects.all(), search_query['search'])\
+            .order_by(search_query['price_order'], '-rank')
         self.assertEqual(len(response.context['courses']), len(courses))
         self.assertQuerysetEqual(response.context['courses'], courses)
 
+    def test_search_uses_stemmed_index(self):
+        course = Course.objects.get(title='HTML верстка')
+        self.assertIn(course, search_courses(Course.objects.all(), 'Верстке'))
+        self.assertIn(course, search_courses(Course.objects.all(), 'html верст'))
+        self.assertNotIn(course, search_courses(Course.objects.all(), 'python верстка'))
+
+        author = course.authors.first()
+        author.last_name = 'Пушкин'
+        author.save()
+        self.assertIn(course, search_courses(Course.objects.all(), 'пушкина'))
+
+        long_word = 'суперкалифраджилистик' * 3
+        course.description = f'Курс {long_word}'
+        course.save()
+        self.assertIn(course, search_courses(Course.objects.all(), long_word))
+        self.assertIn(course, search_courses(Course.objects.all(), f'{long_word} html'))
+
+        response = self.client.get(reverse('courses'), data={'search': 'верстка'})
+        self.assertEqual([item['title'] for item in response.data['results']], [course.title])
+
+    def test_index_view_caches_evaluated_pages(self):
+        self.client.login(username='test_student@gmail.com', password='1')
+        search_query = {'search': 'h', 'price_order': '-price'}
+        response = self.client.get(self.index, data=search_query)
+        with CaptureQueriesContext(connection) as queries:
+            cached_response = self.client.get(self.index, data=search_query)
+        self.assertFalse([query for query in queries if 'learning_course' in query['sql']])
+        self.assertEqual(list(cached_response.context['courses']), list(response.context['courses']))
+
+        course = response.context['courses'][0]
+        course.price += 1
+        course.save()
+        response = self.client.get(self.index, data=search_query)
+        self.assertEqual(response.context['courses'][0].price, course.price)
+
+    def test_anonymous_catalog_shares_cached_data(self):
+        self.client.get(self.index, data={'search': 'h'})
+        self.client.cookies.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.index, data={'search': 'h'})
+        self.assertFalse([query for query in queries if 'learning_course' in query['sql']])
+
     def test_get_detail_view(self):
         course_id = '24'
         response = self.client.get(reverse('detail', kwargs={'course_id': course_id}))
@@ -44,6 +143,39 @@ class LearningViewTestCase(TestCase):
         self.assertTemplateUsed(response, 'detail.html')
         self.assertEqual(len(response.context['lessons']), Lesson.objects.filter(course=course_id).count())
 
+    def test_detail_view_reads_cached_payload(self):
+        course = Course.objects.get(id=24)
+        url = reverse('detail', kwargs={'course_id': course.id})
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.context['course'], course)
+        self.assertEqual(list(response.context['authors']), list(course.authors.order_by('last_name', 'first_name')))
+
+        user = User.objects.exclude(review__course=course).first()
+        Review.objects.create(user=user, course=course, content='Новый отзыв')
+        user.first_name = 'Переименован'
+        user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.context['count_reviews'], Review.objects.filter(course=course).count())
+        self.assertEqual(response.context['reviews'][0].user.first_name, 'Переименован')
+        self.assertEqual(self.client.get(reverse('detail', kwargs={'course_id': 100500})).status_code, 404)
+
+    def test_conditional_get(self):
+        url = reverse('detail', kwargs={'course_id': 24})
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertFalse(response.has_header('Last-Modified'))
+
+        Lesson.objects.filter(course=24).first().save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get(self.index)['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.index, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(self.index, {'price_order': 'price'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
     def test_get_create_view_not_login(self):
         response = self.client.get(path=self.create)
         self.assertEqual(response.status_code, 302)
@@ -105,30 +237,40 @@ class LearningViewTestCase(TestCase):
         self.assertRedirects(response, reverse('detail', kwargs={'course_id': course.id}), status_code=302)
 
     def test_add_add_to_favourites(self):
+        self.client.login(username='test_student@gmail.com', password='1')
+        user = User.objects.get(email='test_student@gmail.com')
         courses_ids = Course.objects.filter(id__in=[2, 3, 4, 7]).values_list('id', flat=True)
-        for course_id in courses_ids:
+        for course_id in list(courses_ids) + [courses_ids[0]]:
             response = self.client.post(reverse('add_booking', kwargs={'course_id': course_id}))
             self.assertEqual(response.status_code, 302)
             self.assertRedirects(response, self.index, status_code=302)
-            self.assertIn(course_id, self.client.session.get('favourites'))
+            self.assertIn(course_id, get_favourite_ids(user.id))
+        self.assertEqual(Favourite.objects.filter(user=user).count(), len(courses_ids))
+        self.assertNotIn('favourites', self.client.session)
 
     def test_add_remove_favourites(self):
-        session = self.client.session
-        session['favourites'] = [2, 3, 4, 7]
-        session.save()
+        self.client.login(username='test_student@gmail.com', password='1')
+        user = User.objects.get(email='test_student@gmail.com')
+        add_favourites(user.id, [2, 3, 4, 7])
         response = self.client.post(reverse('remove_booking', kwargs={'course_id': 4}))
-        self.assertEqual(len(self.client.session.get('favourites')), 3)
+        self.assertEqual(len(get_favourite_ids(user.id)), 3)
         self.assertRedirects(response, self.index, status_code=302)
-        self.assertNotIn(4, self.client.session.get('favourites'))
+        self.assertNotIn(4, get_favourite_ids(user.id))
 
     def test_get_favourites(self):
         session = self.client.session
         session['favourites'] = [2, 3, 7]
         session.save()
+        self.client.login(username='test_student@gmail.com', password='1')
         response = self.client.get(reverse('favourites'))
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'index.html')
-        self.assertEqual(len(response.context['courses']), len(session['favourites']))
+        self.assertEqual(len(response.context['courses']), 3)
+        self.assertEqual(response.context['favourite_ids'], {course.pk for course in response.context['courses']})
+
+        self.client.logout()
+        response = self.client.get(reverse('favourites'))
+        self.assertEqual(response.status_code, 302)
 
     def test_enroll_view(self):
         login = self.client.login(username='admin@example.com', password='1')
@@ -138,6 +280,12 @@ class LearningViewTestCase(TestCase):
         self.assertEqual(Tracking.objects.filter(user=response.context['user'], lesson__course=course.id).count(),
                          Lesson.objects.filter(course=course).count())
 
+        # пользователь, записи на курсы, названия курсов, уроки
+        with self.assertNumQueries(4):
+            response = self.client.get(self.tracking)
+        enrollment = [item for item in response.context['enrollments'] if item.course_id == course.id][0]
+        self.assertEqual(len(enrollment.lesson_marks), Lesson.objects.filter(course=course).count())
+
         response = self.client.post(reverse('enroll', kwargs={'course_id': course.id}))
         self.assertEqual(str(response.content, 'utf-8'), 'Вы уже записаны на данный курс')
 
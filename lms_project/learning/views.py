@@ -2,59 +2,171 @@ from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.core.cache import cache, caches
 from django.core.cache.backends.redis import RedisCache
-from django.core.exceptions import NON_FIELD_ERRORS
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
 from django.db.models import Q, F , Count, Sum
 from django.db import transaction
-from django.http import HttpResponse, HttpResponseRedirect
-from django.shortcuts import render, redirect
+from django.http import Http404, HttpResponse, HttpResponseRedirect
+from django.shortcuts import render, redirect, get_object_or_404
 from datetime import datetime
+from django.utils import timezone
+from hashlib import md5
+from django.utils.http import urlencode
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, FormView
-from .forms import CourseForm, ReviewForm, LessonForm, OrderByAndSearchForm, SettingsForm
+from .forms import CourseForm, ReviewForm, LessonForm, OrderByAndSearchForm, CourseFilterForm, SettingsForm
 from django.urls import reverse
 from .models import *
+from .cache import get_catalog_version
+from .conditional import ConditionalGetMixin, make_etag
+from .detail import get_course_detail
+from .enrollment import ALREADY_ENROLLED, EnrollmentError, enroll_users
+from .facets import FACET_FIELDS, FACET_LABELS, FILTER_FIELDS, filter_courses, facet_counts, get_facet_counts
+from .favourites import get_favourite_ids, filter_favourites, add_favourites, remove_favourites
+from .pagination import KeysetPaginator
+from .search import search_courses
 from .signals import set_views, course_enroll, get_certificate
 from django.db.models.signals import pre_save
 
 
-class MainView(ListView, FormView):
+CATALOG_CACHE_TIMEOUT = 60 * 5
+
+
+class MainView(ConditionalGetMixin, ListView, FormView):
+    """
+    Каталог. Страница целиком не кэшируется: в ней CSRF-токен посетителя, поэтому кэш страницы
+    был бы отдельным для каждого посетителя. Кэшируются данные - вычисленные страницы и фасеты
+    """
     template_name = 'index.html'
     queryset = Course.objects.all()
     context_object_name = 'courses'
     paginate_by = 2
-
-    form_class = OrderByAndSearchForm
+    use_cache = True
+
+    form_class = CourseFilterForm
+
+    def get_etag(self, request, *args, **kwargs):
+        user = request.user
+        favourites = sorted(get_favourite_ids(user.id)) if user.is_authenticated else ()
+        return make_etag('catalog', get_catalog_version(), timezone.localdate(), request.get_full_path(),
+                         request.COOKIES.get('paginate_by', ''), user.pk, favourites)
+
+    def get_search_params(self):
+        search = ' '.join(self.request.GET.get('search', '').split())
+        price_order = self.request.GET.get('price_order', 'title')
+        if price_order not in dict(OrderByAndSearchForm.PRICE_CHOICES):
+            price_order = 'title'
+        return search, price_order
+
+    def get_filters(self) -> dict:
+        if not hasattr(self, 'filters'):
+            self.filters = CourseFilterForm(self.request.GET).get_filters()
+        return self.filters
+
+    def get_base_queryset(self):
+        # Выборка без фильтров фасетов: по ней считаются фасеты
+        search, price_order = self.get_search_params()
+        queryset = self.queryset.all()
+        if search:
+            queryset = search_courses(queryset, search)
+        return queryset
 
     def get_queryset(self):
-        if 'courses' in cache:
-            queryset = cache.get('courses')
+        return filter_courses(self.get_base_queryset(), self.get_filters())
+
+    def get_ordering(self):
+        search, price_order = self.get_search_params()
+        if not search:
+            return [price_order]
+        if price_order == 'title':
+            return ['-rank', 'title']
+        return [price_order, '-rank']
+
+    def get_cache_key(self, page_size):
+        search, price_order = self.get_search_params()
+        params = urlencode({
+            'search': search.casefold(),
+            'price_order': price_order,
+            'cursor': self.request.GET.get('cursor', ''),
+            'paginate_by': page_size,
+            **{name: str(value) for name, value in sorted(self.get_filters().items())},
+        })
+        return f'catalog_{get_catalog_version()}_{md5(params.encode()).hexdigest()}'
+
+    def get_page(self, queryset, page_size):
+        paginator = KeysetPaginator(self.get_ordering(), page_size)
+        return paginator.page(queryset, self.request.GET.get('cursor'))
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Пагинация по курсору вместо номера страницы: без COUNT(*) и OFFSET.
+        Вычисленные страницы каталога кэшируются до смены его версии
+        """
+        if not self.use_cache:
+            page = self.get_page(queryset, page_size)
         else:
-            queryset = MainView.queryset
-            cache.set('courses', queryset, timeout=30)
-
-        if {'search', 'price_order'} != self.request.GET.keys():
-            return queryset
-        else:
-            search_query = self.request.GET.get('search')
-            price_order_by = self.request.GET.get('price_order')
-            filter = Q(title__icontains=search_query) | Q(description__icontains=search_query)
-            queryset = queryset.filter(filter).order_by(price_order_by)
-        return queryset
-
+            key = self.get_cache_key(page_size)
+            page = cache.get(key)
+            if page is None:
+                page = self.get_page(queryset, page_size)
+                cache.set(key, page, timeout=CATALOG_CACHE_TIMEOUT)
+        return None, page, page.object_list, page.has_other_pages()
+
+    def get_facets(self):
+        """
+        Количество курсов по значениям фасетов и ссылки для выбора значения
+        """
+        search, price_order = self.get_search_params()
+        params = {'search': search.casefold(), **self.get_filters()}
+        queryset = self.get_base_queryset()
+        facets = get_facet_counts(queryset, params) if self.use_cache else facet_counts(queryset, self.get_filters())
+        for facet, values in facets.items():
+            if facet == 'total':
+                continue
+            for value in values:
+                query = self.request.GET.copy()
+                for name in FACET_FIELDS[facet] + ('cursor', self.page_kwarg):
+                    query.pop(name, None)
+                query.update(value['params'])
+                value['url'] = f'?{query.urlencode()}'
+        return facets
+
+    def get_page_url(self, cursor=None):
+        params = self.request.GET.copy()
+        params.pop('cursor', None)
+        params.pop(self.page_kwarg, None)
+        if cursor:
+            params['cursor'] = cursor
+        return f'?{params.urlencode()}'
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super(MainView, self).get_context_data(**kwargs)
         context['current_year'] = datetime.now().year
+        # Избранное проверяется одним обращением сразу для всех курсов страницы
+        user = self.request.user
+        context['favourite_ids'] = filter_favourites(user.id, [course.pk for course in context['courses']]) \
+            if user.is_authenticated else set()
+        context['facets'] = self.get_facets()
+        context['facet_groups'] = [(label, context['facets'][facet]) for facet, label in FACET_LABELS.items()]
+        page = context['page_obj']
+        if page is not None:
+            context['first_page_url'] = self.get_page_url()
+            context['previous_page_url'] = self.get_page_url(page.previous_cursor)
+            context['next_page_url'] = self.get_page_url(page.next_cursor)
         return context
 
     def get_initial(self):
         initial = super(MainView, self).get_initial()
         initial['search'] = self.request.GET.get('search', '')
         initial['price_order'] = self.request.GET.get('price_order', 'title')
+        initial.update({name: self.request.GET[name] for name in FILTER_FIELDS if name in self.request.GET})
         return initial
 
 
     def get_paginate_by(self, queryset):
-        return self.request.COOKIES.get('paginate_by', 5)
+        # Cookie приходит от клиента: некорректное значение заменяется значением по умолчанию
+        try:
+            return SettingsForm.base_fields['paginate_by'].clean(self.request.COOKIES.get('paginate_by', 5))
+        except ValidationError:
+            return 5
 
 
 class CourseCreateView(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
@@ -69,7 +181,6 @@ class CourseCreateView(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
             course = form.save(commit=False)
             course.save()
             course.authors.add(self.request.user)
-            cache.delete('courses')
             return redirect(reverse('create_lesson', kwargs={'course_id': course.id}))
 
 
@@ -95,11 +206,6 @@ class CourseDeleteView(LoginRequiredMixin, PermissionRequiredMixin, DeleteView):
 
     permission_required = ('learning.delete_course', )
 
-    def form_valid(self, form):
-        course_id = self.kwargs.get('course_id')
-        cache.delete_many(['courses', f'course_{course_id}_lessons'])
-        return super(CourseDeleteView, self).form_valid(form)
-
     def get_queryset(self):
         return Course.objects.filter(id=self.kwargs.get('course_id'))
 
@@ -107,28 +213,37 @@ class CourseDeleteView(LoginRequiredMixin, PermissionRequiredMixin, DeleteView):
         return reverse('index')
 
 
-class CourseDetailView(ListView):
+class CourseDetailView(ConditionalGetMixin, ListView):
     template_name = 'detail.html'
     context_object_name = 'lessons'
     pk_url_kwarg = 'course_id'
 
-    def get(self, request, *args, **kwargs):
-        set_views.send(sender=self.__class__,
-                       session=request.session,
-                       pk_url_kwarg=CourseDetailView.pk_url_kwarg,
-                       id=kwargs[CourseDetailView.pk_url_kwarg])
-        return super(CourseDetailView, self).get(request, *args, **kwargs)
+    def dispatch(self, request, *args, **kwargs):
+        # Просмотр засчитывается и тогда, когда страница отдается из кэша браузера (304)
+        if request.method == 'GET':
+            set_views.send(sender=self.__class__, id=kwargs[CourseDetailView.pk_url_kwarg])
+        return super(CourseDetailView, self).dispatch(request, *args, **kwargs)
+
+    def get_detail(self):
+        if not hasattr(self, 'detail'):
+            self.detail = get_course_detail(self.kwargs.get('course_id'))
+            if self.detail is None:
+                raise Http404('Курс не найден')
+        return self.detail
+
+    def get_etag(self, request, *args, **kwargs):
+        return make_etag('detail', self.get_detail().built_at, request.user.pk)
 
     def get_queryset(self):
-        course_id = self.kwargs.get('course_id')
-        queryset = cache.get_or_set(f'course_{course_id}_lessons',
-                                    Lesson.objects.select_related('course').filter(course=course_id),
-                                    timeout=30)
-        return queryset
+        return self.get_detail().lessons
 
     def get_context_data(self, **kwargs):
         context = super(CourseDetailView, self).get_context_data(**kwargs)
-        context['reviews'] = Review.objects.select_related('user').filter(course=self.kwargs.get('course_id'))
+        detail = self.get_detail()
+        context['course'] = detail.course
+        context['authors'] = detail.authors
+        context['reviews'] = detail.reviews
+        context['count_reviews'] = detail.count_reviews
         return context
 
 
@@ -157,11 +272,12 @@ class LessonCreateView(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
         return form
 
 
-class FavouriteView(MainView):
-    def get_queryset(self):
-        queryset = super(FavouriteView, self).get_queryset()
-        ids = self.request.session.get('favourites', list())
-        return queryset.filter(id__in=ids)
+class FavouriteView(LoginRequiredMixin, MainView):
+    use_cache = False
+
+    def get_base_queryset(self):
+        queryset = super(FavouriteView, self).get_base_queryset()
+        return queryset.filter(id__in=get_favourite_ids(self.request.user.id))
 
 
 class SettingFormView(FormView):
@@ -182,29 +298,40 @@ class SettingFormView(FormView):
 
 
 class TrackingView(LoginRequiredMixin, ListView):
-    model = Tracking
+    model = Enrollment
     template_name = 'tracking.html'
-    context_object_name = 'tracks'
+    context_object_name = 'enrollments'
 
     def get_queryset(self):
-        queryset = Tracking.objects\
-            .select_related('lesson')\
-            .filter(user=self.request.user)\
-            .annotate(header=F('lesson__course__title'))
-        return queryset
+        """
+        Прогресс читается из записей на курсы без соединений: записи ученика, затем названия курсов
+        и уроков отдельными запросами по первичным ключам
+        """
+        enrollments = list(Enrollment.objects.filter(user=self.request.user).order_by('enrolled_at'))
+        course_ids = [enrollment.course_id for enrollment in enrollments]
+        titles = dict(Course.objects.filter(id__in=course_ids).values_list('id', 'title'))
+        lessons = {}
+        for lesson in Lesson.objects.filter(course__in=course_ids).only('course', 'name', 'position'):
+            lessons.setdefault(lesson.course_id, []).append(lesson)
+        for enrollment in enrollments:
+            enrollment.title = titles.get(enrollment.course_id, '')
+            positions, passed = enrollment.lesson_positions, enrollment.passed_positions
+            enrollment.lesson_marks = [(lesson, lesson.position in passed)
+                                       for lesson in lessons.get(enrollment.course_id, [])
+                                       if lesson.position in positions]
+        return enrollments
 
 
-@transaction.atomic
 @login_required
 @permission_required('learning.add_tracking', raise_exception=True)
 def enroll(request, course_id):
-    is_existed = Tracking.objects.filter(user=request.user, lesson__course=course_id).exists()
-    if is_existed:
+    try:
+        result, = enroll_users(course_id, [request.user.id])
+    except EnrollmentError as error:
+        return HttpResponse(str(error), status=400)
+    if result.status == ALREADY_ENROLLED:
         return HttpResponse('Вы уже записаны на данный курс')
     else:
-        lessons = Lesson.objects.filter(course=course_id)
-        records = [Tracking(lesson=lesson, user=request.user, passed=False) for lesson in lessons]
-        Tracking.objects.bulk_create(records)
         # Отправка письма об успешной записи на курс
         course_enroll.send(sender=Tracking, request=request, course_id=course_id)
 
@@ -230,29 +357,27 @@ def review(request, course_id):
         form = ReviewForm()
         return render(request, 'review.html', {'form': form})
 
+@login_required
 def add_booking(request, course_id):
     if request.method == 'POST':
-        favourites = request.session.get('favourites', list())
-        favourites.append(course_id)
-        request.session['favourites'] = favourites
-        request.session.modified = True
+        get_object_or_404(Course, id=course_id)
+        add_favourites(request.user.id, [course_id])
     return redirect(reverse('index'))
 
 
+@login_required
 def remove_booking(request, course_id):
     if request.method == 'POST':
-        request.session.get('favourites').remove(course_id)
-        request.session.modified = True
+        remove_favourites(request.user.id, [course_id])
     return redirect(reverse('index'))
 
 
 @login_required
 def get_certificate_view(request, course_id):
-    count_passed = Tracking.objects.filter(lesson__course=course_id, user=request.user)\
-        .aggregate(total_passed=Count('lesson__course'), fact_passed=Sum('passed'))
+    progress = Enrollment.objects.filter(course=course_id, user=request.user).first()
 
-    if count_passed['total_passed'] == count_passed['fact_passed']:
-        get_certificate.send(sender=request.user)
+    if progress and progress.is_completed:
+        get_certificate.send(sender=request.user, course_id=course_id)
         return HttpResponse('Сертификат отправлен на Ваш email')
     else:
         return HttpResponse('Вы не прошли полностью курс')
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 import os
+from importlib.util import find_spec
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -50,6 +51,7 @@ INSTALLED_APPS = [
     'learning.apps.LearningConfig',
     'auth_app.apps.AuthAppConfig',
     'api',
+    'outbox.apps.OutboxConfig',
     # packages
     'debug_toolbar',
     'rest_framework',
@@ -60,6 +62,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -133,6 +136,28 @@ CACHES = {
                       }
 }
 
+# Время жизни ответов API в кэше, сек. (0 - без кэша); ключ содержит версии моделей ответа
+API_RESPONSE_CACHE_TIMEOUT = 300
+
+# Сжатие ответов API (gzip, brotli при установленном brotli): порог размера, байт, и качество brotli
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_BROTLI_QUALITY = 4
+
+# Период сброса буфера просмотров курсов в таблицу CourseViews, сек.
+COURSE_VIEWS_FLUSH_INTERVAL = 60
+
+# Фоновые задачи (дозапись прогресса и т.п.): число потоков и синхронный режим для отладки
+BACKGROUND_TASKS_WORKERS = 2
+BACKGROUND_TASKS_EAGER = False
+
+# Именные сертификаты: шаблон, каталог готовых файлов, шрифт и число процессов массовой отрисовки
+# (prerender_certificates; 0 - по числу ядер). Сертификат по запросу рисуется в потоке запроса
+CERTIFICATE_TEMPLATE = BASE_DIR / 'media/certificates/certificate.png'
+CERTIFICATE_ROOT = BASE_DIR / 'media/certificates/issued'
+CERTIFICATE_FONT = 'DejaVuSans.ttf'
+CERTIFICATE_BOLD_FONT = 'DejaVuSans-Bold.ttf'
+CERTIFICATE_WORKERS = 2
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -181,6 +206,19 @@ EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = SERVER_EMAIL = EMAIL_HOST_USER
 
+# Очередь писем (приложение outbox): бэкенд воркера send_outbox, по умолчанию EMAIL_BACKEND.
+# Для локальной проверки - django.core.mail.backends.console.EmailBackend или .filebased (с EMAIL_FILE_PATH)
+OUTBOX_EMAIL_BACKEND = os.environ.get('OUTBOX_EMAIL_BACKEND')
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_DELAY = 60
+
+# Адрес сайта для ссылок в письмах, которые формируются вне запроса
+SITE_URL = os.environ.get('SITE_URL', 'http://127.0.0.1:8000')
+
+# Уведомления о входе: окно накопления событий одного пользователя, сек.
+LOGIN_NOTIFY_WINDOW = 5 * 60
+
 ADMINS = [
     ('admin', 'test@gmail.com')
 ]
@@ -214,8 +252,11 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'URL_FORMAT_OVERRIDE': 'to',
     'FORMAT_SUFFIX_KWARG': 'to',
+    # orjson и msgpack необязательны: без orjson JSON кодирует стандартный рендерер,
+    # MessagePack предлагается клиентам только при установленном msgpack
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'api.renderers.FastJSONRenderer',
+        *(['api.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
         'rest_framework.renderers.BrowsableAPIRenderer',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -225,7 +266,7 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
       'rest_framework.permissions.AllowAny',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
     'PAGE_SIZE': 3,
     'ORDERING_PARAM': 'order_by',
     'DATE_INPUT_FORMATS': [
@@ -0,0 +1,18 @@
+from django.contrib import admin
+from .models import OutboxMessage, Announcement
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', )
+    search_fields = ('subject', 'to')
+    list_per_page = 100
+
+
+@admin.register(Announcement)
+class AnnouncementAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'audience', 'status', 'total', 'sent', 'retried', 'percent', 'finished_at')
+    list_filter = ('status', )
+    readonly_fields = ('total', 'sent', 'retried', 'last_user_id', 'finished_at')
+    list_per_page = 100
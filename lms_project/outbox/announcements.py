@@ -0,0 +1,140 @@
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMultiAlternatives
+from django.db.models import F, Q
+from django.utils import timezone
+from .mail import enqueue_many
+from .models import Announcement
+from .worker import OUTBOX_LEASE, get_outbox_connection, reopen
+
+
+logger = logging.getLogger(__name__)
+
+ANNOUNCEMENT_CHUNK_SIZE = 500
+ANNOUNCEMENT_WORKERS = 4
+
+AUDIENCES = {
+    Announcement.STUDENTS: lambda: get_user_model().objects.filter(is_active=True).exclude(is_staff=True),
+}
+
+
+def announce(subject: str, html_message: str = '', body: str = '', audience: str = Announcement.STUDENTS,
+             from_email: str = '') -> Announcement:
+    """
+    Создает рассылку; письма отправляет воркер send_announcements, а не обработчик запроса
+    """
+    return Announcement.objects.create(subject=subject, body=body, html_body=html_message or '', audience=audience,
+                                       from_email=from_email or settings.DEFAULT_FROM_EMAIL or '')
+
+
+def recipient_chunks(announcement: Announcement, chunk_size: int):
+    """
+    Получатели пачками по первичному ключу, начиная с позиции рассылки: в памяти одна пачка адресов
+    """
+    users = AUDIENCES[announcement.audience]().order_by('id').values_list('id', 'email')
+    last_id = announcement.last_user_id
+    while True:
+        chunk = list(users.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return
+        last_id = chunk[-1][0]
+        yield last_id, [email for _, email in chunk if email]
+
+
+def send_chunk(announcement: Announcement, emails: list, backend=None) -> list:
+    """
+    Отправляет пачку через собственное соединение потока, возвращает адреса, которые не удалось отправить.
+    Работает без обращений к базе: тело письма подготовлено заранее
+    """
+    connection = get_outbox_connection(backend)
+    failed = []
+    try:
+        connection.open()
+    except Exception:
+        logger.exception('Не удалось открыть соединение для рассылки %s', announcement.id)
+    try:
+        for email in emails:
+            message = EmailMultiAlternatives(subject=announcement.subject, body=announcement.body,
+                                             from_email=announcement.from_email or None, to=[email],
+                                             connection=connection)
+            if announcement.html_body:
+                message.attach_alternative(announcement.html_body, mimetype='text/html')
+            try:
+                connection.send_messages([message])
+            except Exception:
+                failed.append(email)
+                reopen(connection)
+    finally:
+        connection.close()
+    return failed
+
+
+def record_chunk(announcement: Announcement, last_id: int, count: int, failed: list):
+    # Неотправленные адреса уходят в общую очередь: там повторы с растущей задержкой
+    if failed:
+        enqueue_many(announcement.subject, failed, body=announcement.body, html_message=announcement.html_body,
+                     from_email=announcement.from_email)
+    Announcement.objects.filter(id=announcement.id).update(
+        last_user_id=last_id, sent=F('sent') + count - len(failed), retried=F('retried') + len(failed),
+        updated_at=timezone.now())
+
+
+def touch_announcement(announcement: Announcement):
+    # Продление аренды: пока пачка отправляется, другой воркер не считает рассылку брошенной
+    Announcement.objects.filter(id=announcement.id, status=Announcement.SENDING).update(updated_at=timezone.now())
+
+
+def claim_announcement():
+    """
+    Берет ожидающую рассылку или рассылку, воркер которой перестал отчитываться дольше OUTBOX_LEASE
+    """
+    stale = timezone.now() - timedelta(seconds=getattr(settings, 'OUTBOX_LEASE', OUTBOX_LEASE))
+    available = Announcement.objects.filter(Q(status=Announcement.PENDING) |
+                                            Q(status=Announcement.SENDING, updated_at__lt=stale))
+    for announcement in available.order_by('id'):
+        if available.filter(id=announcement.id, updated_at=announcement.updated_at)\
+                .update(status=Announcement.SENDING, updated_at=timezone.now()):
+            announcement.refresh_from_db()
+            return announcement
+    return None
+
+
+def send_announcement(announcement: Announcement, workers: int = ANNOUNCEMENT_WORKERS,
+                      chunk_size: int = ANNOUNCEMENT_CHUNK_SIZE, backend=None, progress=None) -> Announcement:
+    """
+    Рассылка параллельными потоками, у каждого свое соединение. Пачек в работе не больше двух на поток;
+    позиция сдвигается только по завершенным подряд пачкам, поэтому после сбоя рассылка продолжается с нее.
+    Пока пачки отправляются, аренда рассылки продлевается из основного потока
+    """
+    if not announcement.total:
+        announcement.total = AUDIENCES[announcement.audience]().count()
+        Announcement.objects.filter(id=announcement.id).update(total=announcement.total)
+    in_flight = deque()
+    # Медленный SMTP может держать пачку дольше аренды: пока ждем, продлеваем ее несколько раз за OUTBOX_LEASE
+    heartbeat = getattr(settings, 'OUTBOX_LEASE', OUTBOX_LEASE) / 3
+
+    def complete_next():
+        last_id, count, future = in_flight.popleft()
+        while not wait([future], timeout=heartbeat).done:
+            touch_announcement(announcement)
+        record_chunk(announcement, last_id, count, future.result())
+        if progress is not None:
+            announcement.refresh_from_db()
+            progress(announcement)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='announcement') as executor:
+        for last_id, emails in recipient_chunks(announcement, chunk_size):
+            in_flight.append((last_id, len(emails), executor.submit(send_chunk, announcement, emails, backend)))
+            if len(in_flight) >= workers * 2:
+                complete_next()
+        while in_flight:
+            complete_next()
+
+    Announcement.objects.filter(id=announcement.id).update(status=Announcement.DONE, finished_at=timezone.now(),
+                                                           updated_at=timezone.now())
+    announcement.refresh_from_db()
+    return announcement
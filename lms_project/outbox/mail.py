@@ -0,0 +1,35 @@
+from django.conf import settings
+from .models import OutboxMessage
+
+
+ENQUEUE_BATCH_SIZE = 1000
+
+
+def build_message(subject: str, to, body: str = '', html_message: str = '', from_email: str = '',
+                  attachments=()) -> OutboxMessage:
+    """
+    Несохраненное письмо очереди: для массовой вставки через bulk_create
+    """
+    return OutboxMessage(subject=subject, body=body, html_body=html_message or '',
+                         from_email=from_email or settings.DEFAULT_FROM_EMAIL or '',
+                         to=[to] if isinstance(to, str) else list(to),
+                         attachments=[list(attachment) for attachment in attachments])
+
+
+def enqueue(subject: str, to, body: str = '', html_message: str = '', from_email: str = '', attachments=()):
+    """
+    Ставит письмо в очередь. Вложения передаются парами (путь к файлу, MIME-тип)
+    """
+    message = build_message(subject, to, body, html_message, from_email, attachments)
+    message.save()
+    return message
+
+
+def enqueue_many(subject: str, recipients, body: str = '', html_message: str = '', from_email: str = '',
+                 batch_size: int = ENQUEUE_BATCH_SIZE) -> int:
+    """
+    Рассылка: отдельное письмо каждому получателю, вставка пачками
+    """
+    messages = [build_message(subject, email, body, html_message, from_email) for email in recipients]
+    OutboxMessage.objects.bulk_create(messages, batch_size=batch_size)
+    return len(messages)
@@ -0,0 +1,34 @@
+import time
+from django.core.management.base import BaseCommand
+from outbox.announcements import ANNOUNCEMENT_CHUNK_SIZE, ANNOUNCEMENT_WORKERS, claim_announcement, send_announcement
+
+
+class Command(BaseCommand):
+    help = 'Выполняет рассылки Announcement: получатели пачками, отправка в несколько потоков'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=ANNOUNCEMENT_WORKERS,
+                            help='Количество потоков отправки, у каждого свое соединение')
+        parser.add_argument('--chunk-size', type=int, default=ANNOUNCEMENT_CHUNK_SIZE,
+                            help='Количество получателей в одной пачке')
+        parser.add_argument('--interval', type=float, default=5, help='Пауза между проверками, сек.')
+        parser.add_argument('--backend', help='Почтовый бэкенд вместо OUTBOX_EMAIL_BACKEND / EMAIL_BACKEND')
+        parser.add_argument('--once', action='store_true', help='Выполнить ожидающие рассылки и завершиться')
+
+    def handle(self, *args, **options):
+        while True:
+            announcement = claim_announcement()
+            if announcement is not None:
+                announcement = send_announcement(announcement, options['workers'], options['chunk_size'],
+                                                 options['backend'], progress=self.report)
+                self.stdout.write(self.style.SUCCESS(f'Рассылка {announcement.id} завершена: '
+                                                     f'отправлено {announcement.sent}, '
+                                                     f'на повтор {announcement.retried}'))
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['interval'])
+
+    def report(self, announcement):
+        self.stdout.write(f'Рассылка {announcement.id}: {announcement.sent + announcement.retried} '
+                          f'из {announcement.total} ({announcement.percent}%)')
@@ -0,0 +1,26 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from outbox.worker import OUTBOX_BATCH_SIZE, drain
+
+
+class Command(BaseCommand):
+    help = 'Отправляет письма из очереди OutboxMessage пачками через одно соединение'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=getattr(settings, 'OUTBOX_BATCH_SIZE', OUTBOX_BATCH_SIZE),
+                            help='Количество писем, забираемых из очереди за один раз')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Пауза между проверками пустой очереди, сек.')
+        parser.add_argument('--backend', help='Почтовый бэкенд вместо OUTBOX_EMAIL_BACKEND / EMAIL_BACKEND')
+        parser.add_argument('--once', action='store_true', help='Отправить накопленные письма и завершиться')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = drain(options['batch_size'], options['backend'])
+            if sent or failed:
+                self.stdout.write(f'Отправлено писем: {sent}, отложено или не отправлено: {failed}')
+            if options['once']:
+                break
+            time.sleep(options['interval'])
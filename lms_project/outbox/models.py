@@ -0,0 +1,89 @@
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+
+class OutboxMessage(models.Model):
+    """
+    Письмо в очереди на отправку: запрос и сигналы только сохраняют его, отправляет воркер send_outbox
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Ожидает отправки'),
+        (SENDING, 'Отправляется'),
+        (SENT, 'Отправлено'),
+        (FAILED, 'Не отправлено'),
+    )
+
+    subject = models.CharField(verbose_name='Тема', max_length=255)
+    body = models.TextField(verbose_name='Текст', blank=True)
+    html_body = models.TextField(verbose_name='HTML-версия', blank=True)
+    from_email = models.CharField(verbose_name='Отправитель', max_length=255, blank=True)
+    to = models.JSONField(verbose_name='Получатели', default=list)
+    # Пути к файлам и их MIME-типы: файл читается в момент отправки, а не хранится в базе
+    attachments = models.JSONField(verbose_name='Вложения', default=list, blank=True)
+    status = models.CharField(verbose_name='Статус', max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(verbose_name='Попыток отправки', default=0)
+    next_attempt_at = models.DateTimeField(verbose_name='Следующая попытка', default=timezone.now)
+    last_error = models.TextField(verbose_name='Последняя ошибка', blank=True)
+    created_at = models.DateTimeField(verbose_name='Дата постановки в очередь', auto_now_add=True)
+    sent_at = models.DateTimeField(verbose_name='Дата отправки', null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'Очередь писем'
+        verbose_name = 'Письмо'
+        ordering = ('id', )
+        indexes = (
+            models.Index(fields=('status', 'next_attempt_at', ), name='outbox_status_next_idx'),
+        )
+
+    def __str__(self):
+        return f'{self.subject}: {", ".join(self.to)}'
+
+
+class Announcement(models.Model):
+    """
+    Рассылка по аудитории: текст хранится один раз, получатели читаются пачками по id пользователя.
+    Позиция last_user_id и счетчики позволяют следить за ходом рассылки и продолжить ее после сбоя
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    DONE = 'done'
+    STATUS_CHOICES = (
+        (PENDING, 'Ожидает отправки'),
+        (SENDING, 'Отправляется'),
+        (DONE, 'Завершена'),
+    )
+    STUDENTS = 'students'
+    AUDIENCE_CHOICES = (
+        (STUDENTS, 'Ученики'),
+    )
+
+    subject = models.CharField(verbose_name='Тема', max_length=255)
+    body = models.TextField(verbose_name='Текст', blank=True)
+    html_body = models.TextField(verbose_name='HTML-версия', blank=True)
+    from_email = models.CharField(verbose_name='Отправитель', max_length=255, blank=True)
+    audience = models.CharField(verbose_name='Аудитория', max_length=20, choices=AUDIENCE_CHOICES, default=STUDENTS)
+    status = models.CharField(verbose_name='Статус', max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    total = models.PositiveIntegerField(verbose_name='Всего получателей', default=0)
+    sent = models.PositiveIntegerField(verbose_name='Отправлено', default=0)
+    retried = models.PositiveIntegerField(verbose_name='Передано в очередь повторной отправки', default=0)
+    last_user_id = models.PositiveBigIntegerField(verbose_name='Последний обработанный пользователь', default=0)
+    created_at = models.DateTimeField(verbose_name='Дата создания', auto_now_add=True)
+    updated_at = models.DateTimeField(verbose_name='Дата изменения', default=timezone.now)
+    finished_at = models.DateTimeField(verbose_name='Дата завершения', null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'Рассылки'
+        verbose_name = 'Рассылка'
+        ordering = ('id', )
+
+    @property
+    def percent(self):
+        return round((self.sent + self.retried) / self.total * 100, 2) if self.total else 0
+
+    def __str__(self):
+        return f'{self.subject}: {self.get_status_display()}'
@@ -0,0 +1,53 @@
+import time
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TestCase, override_settings
+from outbox import announcements
+from outbox.announcements import announce, claim_announcement, send_announcement
+from outbox.models import Announcement, OutboxMessage
+
+
+class SlowBackend(EmailBackend):
+    def send_messages(self, messages):
+        time.sleep(0.2)
+        return super(SlowBackend, self).send_messages(messages)
+
+
+class AnnouncementTestCase(TestCase):
+    fixtures = ['test_data.json']
+
+    def setUp(self):
+        self.recipients = set(get_user_model().objects.filter(is_active=True).exclude(is_staff=True)
+                              .values_list('email', flat=True))
+
+    def test_announcement_fans_out_in_chunks(self):
+        announce('Новый курс', html_message='<p>Новый курс</p>')
+        self.assertEqual(len(mail.outbox), 0)
+
+        announcement = claim_announcement()
+        self.assertIsNone(claim_announcement())
+        progress = []
+        announcement = send_announcement(announcement, workers=2, chunk_size=1, progress=progress.append)
+        self.assertEqual({email.to[0] for email in mail.outbox}, self.recipients)
+        self.assertEqual(len(mail.outbox), len(self.recipients))
+        self.assertEqual((announcement.status, announcement.total, announcement.sent),
+                         (Announcement.DONE, len(self.recipients), len(self.recipients)))
+        self.assertEqual(len(progress), len(self.recipients))
+        self.assertEqual(announcement.percent, 100)
+
+    @override_settings(OUTBOX_EMAIL_BACKEND='outbox.tests.test_worker.FailingBackend')
+    def test_failed_recipients_go_to_outbox(self):
+        announcement = send_announcement(announce('Новый курс', body='Новый курс'), workers=2, chunk_size=2)
+        self.assertEqual((announcement.sent, announcement.retried), (0, len(self.recipients)))
+        self.assertEqual({message.to[0] for message in OutboxMessage.objects.all()}, self.recipients)
+
+    @override_settings(OUTBOX_EMAIL_BACKEND='outbox.tests.test_announcements.SlowBackend', OUTBOX_LEASE=0.15)
+    def test_lease_extended_while_chunk_is_sent(self):
+        announce('Новый курс', body='Новый курс')
+        announcement = claim_announcement()
+        with mock.patch('outbox.announcements.touch_announcement', wraps=announcements.touch_announcement) as touch:
+            announcement = send_announcement(announcement, workers=1, chunk_size=len(self.recipients))
+        self.assertTrue(touch.called)
+        self.assertEqual(announcement.sent, len(self.recipients))
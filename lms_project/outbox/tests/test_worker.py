@@ -0,0 +1,57 @@
+from datetime import timedelta
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from learning.models import Course
+from outbox.mail import enqueue, enqueue_many
+from outbox.models import OutboxMessage
+from outbox.worker import drain
+
+
+class FailingBackend(BaseEmailBackend):
+
+    def send_messages(self, email_messages):
+        raise ConnectionError('SMTP недоступен')
+
+
+class OutboxWorkerTestCase(TestCase):
+    fixtures = ['test_data.json']
+
+    def test_enroll_only_enqueues_email(self):
+        self.client.login(username='admin@example.com', password='1')
+        course = Course.objects.first()
+        self.client.post(reverse('enroll', kwargs={'course_id': course.id}))
+        self.assertEqual(len(mail.outbox), 0)
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.to, ['admin@example.com'])
+
+        self.assertEqual(drain(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.SENT)
+        self.assertEqual(drain(), (0, 0))
+
+    def test_batches_share_one_connection(self):
+        enqueue_many('Рассылка', [f'student{number}@example.com' for number in range(5)], body='Текст')
+        self.assertEqual(drain(batch_size=2), (5, 0))
+        self.assertEqual(sorted(email.to[0] for email in mail.outbox),
+                         [f'student{number}@example.com' for number in range(5)])
+
+    @override_settings(OUTBOX_EMAIL_BACKEND='outbox.tests.test_worker.FailingBackend', OUTBOX_MAX_ATTEMPTS=2)
+    def test_failed_message_backs_off_then_gives_up(self):
+        message = enqueue('Тема', 'student@example.com', body='Текст')
+        self.assertEqual(drain(), (0, 1))
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), (OutboxMessage.PENDING, 1))
+        self.assertGreater(message.next_attempt_at, timezone.now())
+        self.assertIn('SMTP', message.last_error)
+        # До истечения задержки письмо не берется повторно
+        self.assertEqual(drain(), (0, 0))
+
+        OutboxMessage.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(drain(), (0, 1))
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), (OutboxMessage.FAILED, 2))
@@ -0,0 +1,119 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import OutboxMessage
+
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 5
+# Задержка перед повтором удваивается с каждой попыткой, сек.
+OUTBOX_RETRY_DELAY = 60
+OUTBOX_MAX_RETRY_DELAY = 60 * 60
+# Письма, взятые воркером, который не отчитался за это время, снова считаются ожидающими, сек.
+OUTBOX_LEASE = 10 * 60
+
+
+def get_outbox_connection(backend=None):
+    """
+    Соединение для отправки очереди: OUTBOX_EMAIL_BACKEND или EMAIL_BACKEND (console/file для локальной проверки)
+    """
+    return get_connection(backend or getattr(settings, 'OUTBOX_EMAIL_BACKEND', None), fail_silently=False)
+
+
+def retry_delay(attempts: int) -> timedelta:
+    delay = getattr(settings, 'OUTBOX_RETRY_DELAY', OUTBOX_RETRY_DELAY) * 2 ** max(attempts - 1, 0)
+    return timedelta(seconds=min(delay, getattr(settings, 'OUTBOX_MAX_RETRY_DELAY', OUTBOX_MAX_RETRY_DELAY)))
+
+
+def claim_batch(batch_size: int = OUTBOX_BATCH_SIZE) -> list:
+    """
+    Забирает пачку готовых к отправке писем. Строки блокируются с пропуском занятых,
+    поэтому несколько воркеров не отправят одно письмо дважды
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(OutboxMessage.objects
+                   .select_for_update(skip_locked=True)
+                   .filter(status__in=(OutboxMessage.PENDING, OutboxMessage.SENDING), next_attempt_at__lte=now)
+                   .order_by('next_attempt_at', 'id')
+                   .values_list('id', flat=True)[:batch_size])
+        OutboxMessage.objects.filter(id__in=ids).update(
+            status=OutboxMessage.SENDING, attempts=F('attempts') + 1,
+            next_attempt_at=now + timedelta(seconds=getattr(settings, 'OUTBOX_LEASE', OUTBOX_LEASE)))
+    return list(OutboxMessage.objects.filter(id__in=ids))
+
+
+def build_email(message: OutboxMessage, connection) -> EmailMultiAlternatives:
+    email = EmailMultiAlternatives(subject=message.subject, body=message.body, from_email=message.from_email or None,
+                                   to=message.to, connection=connection)
+    if message.html_body:
+        email.attach_alternative(message.html_body, mimetype='text/html')
+    for path, mimetype in message.attachments:
+        email.attach_file(path=path, mimetype=mimetype)
+    return email
+
+
+def send_batch(messages: list, connection) -> tuple:
+    """
+    Отправляет пачку через одно открытое соединение. Ошибка письма не прерывает пачку:
+    письмо откладывается с растущей задержкой, после OUTBOX_MAX_ATTEMPTS попыток помечается неотправленным
+    """
+    now = timezone.now()
+    max_attempts = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', OUTBOX_MAX_ATTEMPTS)
+    sent = failed = 0
+    for message in messages:
+        try:
+            connection.send_messages([build_email(message, connection)])
+        except Exception as error:
+            logger.warning('Письмо %s не отправлено (попытка %s): %s', message.id, message.attempts, error)
+            failed += 1
+            message.last_error = repr(error)
+            if message.attempts >= max_attempts:
+                message.status = OutboxMessage.FAILED
+            else:
+                message.status = OutboxMessage.PENDING
+                message.next_attempt_at = now + retry_delay(message.attempts)
+            reopen(connection)
+        else:
+            sent += 1
+            message.status, message.sent_at, message.last_error = OutboxMessage.SENT, timezone.now(), ''
+    OutboxMessage.objects.bulk_update(messages, fields=('status', 'next_attempt_at', 'last_error', 'sent_at', ))
+    return sent, failed
+
+
+def reopen(connection):
+    # После ошибки соединение могло быть разорвано сервером: следующее письмо идет через новое
+    try:
+        connection.close()
+        connection.open()
+    except Exception:
+        logger.exception('Не удалось переоткрыть соединение для отправки писем')
+
+
+def drain(batch_size: int = OUTBOX_BATCH_SIZE, backend=None) -> tuple:
+    """
+    Отправляет все готовые письма пачками; соединение открывается один раз на все пачки
+    """
+    connection, sent, failed = None, 0, 0
+    try:
+        while True:
+            messages = claim_batch(batch_size)
+            if not messages:
+                return sent, failed
+            if connection is None:
+                connection = get_outbox_connection(backend)
+                try:
+                    connection.open()
+                except Exception:
+                    logger.exception('Не удалось открыть соединение для отправки писем')
+            batch_sent, batch_failed = send_batch(messages, connection)
+            sent, failed = sent + batch_sent, failed + batch_failed
+    finally:
+        if connection is not None:
+            connection.close()